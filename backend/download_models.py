@@ -1,18 +1,32 @@
 # livestream-w2-gaules/backend/download_models.py
 
 """
-Este script garante que os modelos necessários para transcrição (Whisper) sejam baixados 
-antes de o backend iniciar. Basta importar e executar a função download_all_models() no começo de main.py.
+Este script garante que o modelo do motor de ASR padrão (ASR_ENGINE e
+WHISPER_MODEL, padrão whisper "base") e o do degrau fast_asr
+(degrade_asr_model, padrão "tiny") estejam no cache antes de o backend
+iniciar. Rode no build da imagem (python -m backend.download_models): na
+partida, o modelo é só mapeado do cache (mmap) em vez de baixado.
 """
 
-import whisper
+from pipeline.asr_engines import create_engine, create_fast_engine
+from pipeline.config import channel_config
+
 
 def download_all_models():
     """
-    Carrega (e portanto baixa) o modelo Whisper “base” para transcrição.
+    Baixa (ou confirma no cache) os modelos do motor de ASR configurado e do degrau fast_asr.
     """
-    try:
-        whisper.load_model("base")
-        print("Modelo Whisper 'base' baixado/com cache verificado com sucesso.")
-    except Exception as e:
-        print(f"Falha ao baixar/verificar o modelo Whisper: {e}")
+    config = channel_config("default")
+    engines = [create_engine(config), create_fast_engine(config)]
+    for engine in engines:
+        if engine is None:
+            continue
+        try:
+            path = engine.download()
+            print(f"Modelo '{engine}' baixado/com cache verificado com sucesso: {path}")
+        except Exception as e:
+            print(f"Falha ao baixar/verificar o modelo de ASR '{engine}': {e}")
+
+
+if __name__ == "__main__":
+    download_all_models()
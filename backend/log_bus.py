@@ -0,0 +1,139 @@
+# backend/log_bus.py
+
+"""
+Barramento de logs com difusão para todos os clientes SSE.
+
+Substitui a queue.Queue única do /logs/stream, em que cada linha chegava a um
+só navegador, o get() bloqueante travava o event loop e a fila crescia sem
+limite quando ninguém estava conectado.
+
+- Buffer circular de tamanho fixo com ids absolutos crescentes: a memória não
+  depende do volume de logs nem do número de clientes.
+- Cada assinante tem só um cursor (o próximo id a ler); nada é copiado por
+  assinante.
+- put() pode ser chamado de qualquer thread (drop-in para log_queue.put).
+  Acorda os assinantes com no máximo um callback pendente no event loop,
+  por mais linhas que cheguem.
+- Replay a partir do Last-Event-ID (reconexão do EventSource) ou das últimas
+  N linhas.
+- Filtro por canal: linhas publicadas via for_channel(canal) levam a tag.
+- Cliente lento: se o cursor ficou para trás do buffer, pula para a linha
+  mais antiga ainda disponível e recebe um aviso com quantas perdeu.
+"""
+
+import asyncio
+import threading
+
+
+class ChannelLog:
+    """Visão do barramento que marca cada linha com o canal (mesma interface de log_queue)."""
+
+    def __init__(self, bus: "LogBus", channel: str):
+        self.bus = bus
+        self.channel = channel
+
+    def put(self, msg, *args, **kwargs):
+        self.bus.put(msg, channel=self.channel)
+
+
+class LogBus:
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._entries = [None] * capacity  # (id, canal, texto) no slot id % capacity
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._event = None
+        self._wakeup_pending = False
+        self.subscribers = 0
+
+    # ------------------------------------------------------------ produtores
+
+    def put(self, msg, *args, channel: str = None, **kwargs):
+        """Publica uma linha. Aceita os mesmos argumentos de Queue.put (ignorados)."""
+        with self._lock:
+            entry_id = self._next_id
+            self._entries[entry_id % self.capacity] = (entry_id, channel, str(msg))
+            self._next_id += 1
+            loop = self._loop
+            wake = loop is not None and not self._wakeup_pending
+            if wake:
+                self._wakeup_pending = True
+        if wake:
+            try:
+                loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # event loop já encerrado
+                pass
+
+    def for_channel(self, channel: str) -> ChannelLog:
+        return ChannelLog(self, channel)
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    # ------------------------------------------------------------ consumidores
+
+    def read(self, cursor: int, channel: str = None, limit: int = 500):
+        """
+        Lê até `limit` linhas a partir do id `cursor`.
+        Retorna ([(id, texto)], próximo cursor, linhas perdidas por atraso).
+        """
+        with self._lock:
+            oldest = max(0, self._next_id - self.capacity)
+            dropped = max(0, oldest - cursor)
+            cursor = max(cursor, oldest)
+            end = min(self._next_id, cursor + limit)
+            entries = [self._entries[i % self.capacity] for i in range(cursor, end)]
+        lines = [(entry_id, text) for entry_id, entry_channel, text in entries
+                 if channel is None or entry_channel == channel]
+        return lines, end, dropped
+
+    async def subscribe(self, last_event_id: int = None, channel: str = None, replay: int = 0,
+                        keepalive: float = 15.0, limit: int = 500):
+        """
+        Gerador assíncrono de lotes [(id, texto)]. Um lote vazio significa que
+        nada chegou em `keepalive` segundos (hora de mandar um ping). Um id
+        None é um aviso do barramento (linhas perdidas por lentidão).
+        """
+        self._bind_loop()
+        if last_event_id is not None:
+            cursor = last_event_id + 1
+        else:
+            cursor = max(0, self._next_id - replay)
+
+        self.subscribers += 1
+        try:
+            while True:
+                event = self._event
+                lines, cursor, dropped = self.read(cursor, channel, limit)
+                if dropped:
+                    lines.insert(0, (None, f"[logbus] {dropped} linha(s) descartada(s): cliente lento"))
+                if lines:
+                    yield lines
+                    continue
+                if cursor < self._next_id:
+                    # Só linhas de outros canais: nada a enviar, mas o cursor avançou
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield []
+        finally:
+            self.subscribers -= 1
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                self._loop = loop
+                self._event = asyncio.Event()
+                self._wakeup_pending = False
+
+    def _wake(self):
+        with self._lock:
+            self._wakeup_pending = False
+        # Troca o evento e libera todos que esperavam no anterior
+        event, self._event = self._event, asyncio.Event()
+        event.set()
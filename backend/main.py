@@ -3,24 +3,35 @@
 import asyncio
 import logging
 import os
-import queue
 
+# Primeiro import: marca o início das fases de partida (backend/startup.py)
+from backend.startup import STARTUP
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
 from starlette.staticfiles import StaticFiles
-from capture.recorder import start_capture
-from pipeline.worker_thread import start_worker_thread
+from backend.log_bus import LogBus
+from backend.supervisor import AdmissionError, ChannelSupervisor
+from pipeline import metrics, profiler
+from pipeline.storage import get_storage_manager, hls_root
+from pipeline.vod import vod_root, vod_status
 
 app = FastAPI()
 
-# → 1.1) Cria uma fila thread-safe para empilhar cada linha de log
-log_queue: queue.Queue[str] = queue.Queue()
+# "wav": recorder grava WAVs de tamanho fixo (max_segment) em disco (padrão).
+# "pcm": ffmpeg entrega PCM 16 kHz mono num ring buffer em memória compartilhada,
+#        cortado nas pausas da fala (segmenter "adaptive" na config do canal);
+#        ARCHIVE_WAV=1 mantém uma cópia em WAV fora do caminho quente.
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "wav")
 
-# → 1.2) Hook de logging que joga cada registro na fila
+# → 1.1) Barramento de logs: buffer circular limitado, entregue a todos os clientes SSE.
+#        Os workers recebem log_bus (ou log_bus.for_channel) no lugar da antiga log_queue.
+log_bus = LogBus(capacity=int(os.getenv("LOG_BUFFER_LINES", "10000")))
+
+# → 1.2) Hook de logging que joga cada registro no barramento
 class QueueHandler(logging.Handler):
     def emit(self, record: logging.LogRecord) -> None:
         msg = self.format(record)
-        log_queue.put(msg)
+        log_bus.put(msg)
 
 # Configuramos o logger do nosso backend para usar esse handler:
 logger = logging.getLogger("backend")
@@ -36,46 +47,189 @@ logging.getLogger("uvicorn.error").handlers.clear()
 logging.getLogger("uvicorn.error").addHandler(q_handler)
 
 
-# → 1.3) Endpoint SSE que consome a fila e envia cada linha como "data: <mensagem>\n\n"
+# → 1.3) Endpoint SSE: cada cliente tem o seu cursor no barramento e recebe todas as linhas
 @app.get("/logs/stream")
-async def stream_logs(request: Request) -> StreamingResponse:
+async def stream_logs(request: Request, channel: str = None, replay: int = 0,
+                      last_event_id: int = None) -> StreamingResponse:
     """
     Retorna um fluxo SSE com cada linha de log que aparecer no backend.
+    - channel: só linhas daquele canal
+    - replay: começa pelas últimas N linhas do buffer
+    - Last-Event-ID (cabeçalho enviado pelo EventSource ao reconectar, ou
+      ?last_event_id=): retoma logo após a última linha recebida
     """
+    header = request.headers.get("last-event-id")
+    if last_event_id is None and header and header.isdigit():
+        last_event_id = int(header)
+
     async def event_generator():
-        # Enquanto a conexão não for fechada pelo cliente...
-        while True:
-            # Se o cliente desconectar, abortamos.
-            if await request.is_disconnected():
-                break
-
-            try:
-                # bloqueia até que haja uma nova mensagem
-                line = log_queue.get(timeout=0.1)
-            except queue.Empty:
-                await asyncio.sleep(0.1)
+        # A desconexão do cliente cancela este gerador (StreamingResponse)
+        async for lines in log_bus.subscribe(last_event_id, channel=channel, replay=min(replay, log_bus.capacity)):
+            if not lines:
+                yield ": ping\n\n"
                 continue
+            chunk = []
+            for entry_id, line in lines:
+                if entry_id is not None:
+                    chunk.append(f"id: {entry_id}\n")
+                chunk.extend(f"data: {part}\n" for part in line.split("\n"))
+                chunk.append("\n")
+            yield "".join(chunk)
 
-            # regenera o evento no formato SSE
-            yield f"data: {line}\n\n"
+    return StreamingResponse(event_generator(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+# Supervisor: registro dos canais (captura + pipeline), reinício de capturas
+# que caem e orçamento global de computação (MAX_CHANNELS, CHANNEL_RTF, ...).
+supervisor = ChannelSupervisor(log_bus, capture_mode=CAPTURE_MODE)
 
-# Endpoint para iniciar a captura e o worker de dublagem
+
+# Endpoint para iniciar a captura e o worker de dublagem (idempotente).
+# Se o canal já está rodando, só anexa o novo idioma (mesma captura, mesmo ASR).
 @app.post("/start/{channel}/{lang}")
 async def start_pipeline(channel: str, lang: str):
-    audio_dir = os.path.join("audio_segments", channel)
-    start_capture(channel, audio_dir)
-    start_worker_thread(audio_dir, lang, log_queue)
-    logger.info(f"Pipeline iniciado para {channel} em {lang}")
+    try:
+        result = await asyncio.to_thread(supervisor.start, channel, lang)
+    except AdmissionError as e:
+        return JSONResponse(status_code=503, content={"status": "refused", "reason": str(e)},
+                            headers={"Retry-After": "60"})
+    if result["channel_started"]:
+        logger.info(f"Pipeline iniciado para {channel} em {lang}")
+    elif result["language_attached"]:
+        logger.info(f"Idioma {lang} anexado ao canal {channel}")
+    status = "ok" if result["language_attached"] else "already_running"
+    return JSONResponse(content={"status": status, **result})
+
+
+# Endpoint para remover um idioma de um canal em execução (o último idioma encerra o canal)
+@app.post("/stop/{channel}/{lang}")
+async def stop_pipeline(channel: str, lang: str):
+    if not await asyncio.to_thread(supervisor.stop, channel, lang):
+        return JSONResponse(status_code=404, content={"status": "not_running"})
+    logger.info(f"Idioma {lang} removido do canal {channel}")
+    return JSONResponse(content={"status": "ok"})
+
+
+# Endpoint para encerrar o canal inteiro (captura e todos os idiomas)
+@app.post("/stop/{channel}")
+async def stop_channel(channel: str):
+    if not await asyncio.to_thread(supervisor.stop, channel):
+        return JSONResponse(status_code=404, content={"status": "not_running"})
+    logger.info(f"Canal {channel} encerrado")
     return JSONResponse(content={"status": "ok"})
 
 
+# Estado dos canais (captura, idiomas, reinícios) e do orçamento de computação
+@app.get("/status")
+async def get_status():
+    return JSONResponse(content=supervisor.status())
+
+
+@app.get("/status/{channel}")
+async def get_channel_status(channel: str):
+    status = supervisor.status(channel)
+    if channel not in status["channels"]:
+        return JSONResponse(status_code=404, content={"status": "not_running"})
+    return JSONResponse(content=status["channels"][channel])
+
+
+# Uso de disco por canal (intermediários em audio_segments e segmentos HLS) e espaço livre
+@app.get("/storage")
+async def get_storage():
+    return JSONResponse(content=await asyncio.to_thread(get_storage_manager().usage))
+
+
+@app.get("/storage/{channel}")
+async def get_channel_storage(channel: str):
+    usage = await asyncio.to_thread(get_storage_manager().usage, channel)
+    if channel not in usage["channels"]:
+        return JSONResponse(status_code=404, content={"status": "not_found"})
+    return JSONResponse(content=usage["channels"][channel])
+
+
+# Dublagem em lote de uma gravação (pipeline/vod.py): só arquivos em VOD_INPUT_DIR.
+# Repetir o pedido com a mesma fonte retoma o job de onde parou.
+@app.post("/vod")
+async def post_vod(source: str, langs: str, format: str = "mp4"):
+    input_dir = os.path.abspath(os.getenv("VOD_INPUT_DIR", "recordings"))
+    path = os.path.abspath(os.path.join(input_dir, source))
+    if os.path.commonpath([input_dir, path]) != input_dir or not os.path.isfile(path):
+        return JSONResponse(status_code=404, content={"status": "not_found", "source": source})
+    if format not in ("mp4", "hls"):
+        return JSONResponse(status_code=400, content={"status": "invalid_format", "format": format})
+    try:
+        job = await asyncio.to_thread(supervisor.start_vod, path,
+                                      [lang.strip() for lang in langs.split(",") if lang.strip()], format)
+    except AdmissionError as e:
+        return JSONResponse(status_code=503, content={"status": "refused", "reason": str(e)},
+                            headers={"Retry-After": "60"})
+    logger.info(f"VOD {job['id']} ({source}) em {langs}: {job['state']}")
+    return JSONResponse(status_code=202, content=job)
+
+
+@app.get("/vod")
+async def get_vod_jobs():
+    return JSONResponse(content=vod_status())
+
+
+@app.get("/vod/{job_id}")
+async def get_vod_job(job_id: str):
+    job = vod_status(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "not_found"})
+    return JSONResponse(content=job)
+
+
+# Ao subir, prepara a inferência em segundo plano (import do torch, modelo, decodificação de teste)
+@app.on_event("startup")
+async def warm_up():
+    STARTUP.record("imports", STARTUP.since_start())
+    STARTUP.warm_up_in_background()
+
+
+# Liveness: o processo responde (não depende do modelo)
+@app.get("/healthz")
+async def healthz():
+    return JSONResponse(content={"status": "ok", "uptime_seconds": round(STARTUP.since_start(), 3)})
+
+
+# Readiness: 200 só com a inferência pronta; 503 (com as fases até aqui) enquanto aquece ou se falhou
+@app.get("/readyz")
+async def readyz():
+    return JSONResponse(status_code=200 if STARTUP.ready else 503, content=STARTUP.as_dict())
+
+
+# Ao desligar o backend, encerra as capturas (senão streamlink/ffmpeg ficam órfãos)
+@app.on_event("shutdown")
+async def shutdown_channels():
+    await asyncio.to_thread(supervisor.shutdown)
+
+
+# Métricas no formato do Prometheus (latência por estágio, filas, RTF, atraso por canal)
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Profiler por amostragem do processo em execução (pilhas "collapsed" para flamegraph).
+# Desligado a menos que PROFILER_ENABLED=1.
+@app.post("/debug/profile")
+async def profile(seconds: float = 10.0, interval: float = 0.01):
+    if os.getenv("PROFILER_ENABLED") != "1":
+        return JSONResponse(status_code=404, content={"status": "disabled"})
+    try:
+        stacks = await asyncio.to_thread(profiler.sample, min(seconds, 120.0), max(interval, 0.001))
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"status": str(e)})
+    return PlainTextResponse(stacks)
+
+
 # ——————————————————————————————
 # (A seguir, o restante das suas rotas / mount de staticfiles / etc.)
 # Por exemplo:
-app.mount("/hls", StaticFiles(directory="hls", html=False), name="hls")
+app.mount("/hls", StaticFiles(directory=hls_root(), html=False), name="hls")
+app.mount("/vod-files", StaticFiles(directory=vod_root(), html=False, check_dir=False), name="vod-files")
 # Monte o frontend gerado pelo Vite
 app.mount("/", StaticFiles(directory="frontend_dist", html=True), name="frontend")
 # … resto do seu main.py …
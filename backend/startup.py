@@ -0,0 +1,112 @@
+# backend/startup.py
+
+"""
+Partida rápida e prontidão do backend.
+
+O backend sobe e responde (/healthz) sem esperar o Whisper: torch/whisper só
+são importados, o modelo carregado (mmap do cache, ver pipeline/asr_service.py)
+e aquecido com uma decodificação de silêncio numa thread de fundo. /readyz só
+responde 200 quando a inferência está pronta, para a plataforma (Render,
+Kubernetes, ...) mandar tráfego apenas a partir daí.
+
+Cada fase fica em STARTUP.as_dict() e na métrica dub_startup_phase_seconds.
+ASR_WARMUP=0 desliga o aquecimento (o modelo carrega no primeiro /start, como antes).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pipeline import metrics
+
+logger = logging.getLogger("backend")
+
+STARTUP_PHASE_SECONDS = metrics.gauge("dub_startup_phase_seconds", "Duração de cada fase da partida do backend")
+
+
+def _process_age():
+    """Segundos desde que o processo foi criado (Linux), ou None."""
+    try:
+        with open("/proc/self/stat") as f:
+            # starttime (campo 22, em ticks desde o boot) vem depois do "(comm)"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTracker:
+    def __init__(self):
+        self.state = "starting"  # starting → warming → ready | failed
+        self.error = None
+        self.phases = {}
+        self.ready_after = None
+        self._started = time.monotonic()
+        self._offset = _process_age() or 0.0  # o que o interpretador gastou antes deste módulo
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = round(seconds, 3)
+        STARTUP_PHASE_SECONDS.set(seconds, phase=name)
+        logger.info(f"[startup] {name}: {seconds:.2f}s")
+
+    def since_start(self) -> float:
+        """Segundos desde a criação do processo (aproximado fora do Linux)."""
+        return self._offset + time.monotonic() - self._started
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def warm_up_in_background(self):
+        threading.Thread(target=self._warm_up, name="startup-warmup", daemon=True).start()
+
+    def _warm_up(self):
+        from pipeline.job_queue import remote_asr_service
+
+        self.state = "warming"
+        try:
+            if os.getenv("ASR_WARMUP", "1") != "0" and remote_asr_service() is None:
+                with self.phase("import_inference"):
+                    import torch  # noqa: F401
+                    import whisper  # noqa: F401
+                from pipeline.asr_service import get_asr_service
+                with self.phase("load_model"):
+                    asr = get_asr_service()
+                with self.phase("warmup_decode"):
+                    asr.warm_up()
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            logger.error(f"[startup] Falha ao preparar a inferência: {self.error}")
+            return
+        self.ready_after = round(self.since_start(), 3)
+        self.state = "ready"
+        logger.info(f"[startup] Pronto para receber tráfego {self.ready_after:.2f}s após o início do processo")
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "state": self.state,
+            "error": self.error,
+            "ready_after_seconds": self.ready_after,
+            "uptime_seconds": round(self.since_start(), 3),
+            "phases": phases,
+        }
+
+
+STARTUP = StartupTracker()
@@ -0,0 +1,430 @@
+# backend/supervisor.py
+
+"""
+Supervisor de canais: um registro dos canais em execução (captura + pipeline
+de dublagem) no lugar de subir um streamlink|ffmpeg e uma thread a cada POST.
+
+- start(canal, idioma) é idempotente: canal já rodando só ganha o idioma (ou
+  nada muda, se ele já estava anexado).
+- stop(canal) encerra captura e pipeline; stop(canal, idioma) remove só o
+  idioma, e remover o último encerra o canal.
+- Capturas que caem são reiniciadas com backoff exponencial. No modo "wav" a
+  numeração sempre continua depois do maior segmento em disco
+  (-segment_start_number), e o watcher começa nesse número: sobras de uma
+  execução anterior não são dubladas de novo; no modo "pcm" o novo ffmpeg
+  escreve no mesmo ring buffer. Reinícios (que esperam processos terminarem)
+  rodam fora do lock, sem travar start/stop/status.
+- Orçamento de computação global: canais novos são recusados (AdmissionError)
+  quando o limite de canais, a capacidade de inferência (núcleos) ou a memória
+  livre não comportam mais um, em vez de degradar todos os streams.
+- Jobs de VOD da API (start_vod) passam pelo mesmo orçamento: cada um ocupa
+  vod_slots processos de ASR (o job não manda mais que isso ao pool de uma vez)
+  e conta como vod_slots / channel_rtf canais ao vivo.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+from capture.recorder import next_segment_number, start_capture, start_capture_pcm, stop_capture
+from capture.segmenter import SpeechSegmenter
+from pipeline import metrics
+from pipeline.config import channel_config
+from pipeline.segment_source import DirectorySegmentSource, RingSegmentSource
+from pipeline.storage import audio_root
+from pipeline.vod import FINISHED_STATES, job_id_for, running_vod_jobs, start_vod_job, vod_status
+from pipeline.worker_thread import (channel_languages, channel_latency, is_channel_running, start_worker_thread,
+                                    stop_channel, stop_worker)
+
+logger = logging.getLogger("backend")
+
+CAPTURE_RESTARTS = metrics.counter("dub_capture_restarts_total", "Capturas reiniciadas pelo supervisor")
+ADMISSION_REFUSED = metrics.counter("dub_admission_refused_total", "Canais recusados pelo orçamento de computação")
+
+
+class AdmissionError(Exception):
+    """O orçamento de computação não comporta mais um canal."""
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _available_memory_mb():
+    """MemAvailable do /proc/meminfo (Linux), ou None se indisponível."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class ComputeBudget:
+    """
+    Quantos canais cabem na máquina:
+    - inference_slots: processos de ASR (ASR_WORKERS ou metade dos núcleos, como o ASRService);
+    - cada canal ocupa channel_rtf de um slot (segundos de inferência por segundo
+      de áudio), com headroom para picos: capacidade = slots * headroom / channel_rtf;
+    - max_channels: teto fixo opcional;
+    - cada canal novo precisa de channel_memory_mb livres além de memory_reserve_mb;
+    - cada job de VOD usa no máximo vod_slots processos de ASR inteiros.
+    """
+
+    def __init__(self, max_channels: int = None, inference_slots: int = None, channel_rtf: float = 0.5,
+                 headroom: float = 0.8, channel_memory_mb: float = 400, memory_reserve_mb: float = 512,
+                 max_languages: int = 4, vod_slots: int = 1):
+        self.inference_slots = inference_slots or max(1, _cores() // 2)
+        self.channel_rtf = channel_rtf
+        self.headroom = headroom
+        self.max_channels = max_channels
+        self.channel_memory_mb = channel_memory_mb
+        self.memory_reserve_mb = memory_reserve_mb
+        self.max_languages = max_languages
+        self.vod_slots = vod_slots
+
+    @classmethod
+    def from_env(cls) -> "ComputeBudget":
+        """MAX_CHANNELS, ASR_WORKERS, CHANNEL_RTF, CHANNEL_MEMORY_MB, MEMORY_RESERVE_MB, MAX_LANGUAGES, VOD_ASR_SLOTS."""
+        return cls(
+            max_channels=int(os.getenv("MAX_CHANNELS", "0")) or None,
+            inference_slots=int(os.getenv("ASR_WORKERS", "0")) or None,
+            channel_rtf=float(os.getenv("CHANNEL_RTF", "0.5")),
+            channel_memory_mb=float(os.getenv("CHANNEL_MEMORY_MB", "400")),
+            memory_reserve_mb=float(os.getenv("MEMORY_RESERVE_MB", "512")),
+            max_languages=int(os.getenv("MAX_LANGUAGES", "4")),
+            vod_slots=int(os.getenv("VOD_ASR_SLOTS", "1")),
+        )
+
+    @property
+    def channel_capacity(self) -> int:
+        capacity = max(1, math.floor(self.inference_slots * self.headroom / self.channel_rtf))
+        return min(capacity, self.max_channels) if self.max_channels else capacity
+
+    @property
+    def vod_channels(self) -> float:
+        """Canais ao vivo que um job de VOD ocupa (no máximo a capacidade: numa máquina ociosa ele sempre cabe)."""
+        return min(self.vod_slots / self.channel_rtf, self.channel_capacity)
+
+    def check_channel(self, running: float):
+        """Levanta AdmissionError se não cabe mais um canal além dos `running` (jobs de VOD inclusos)."""
+        if running + 1 > self.channel_capacity:
+            raise AdmissionError(
+                f"limite de {self.channel_capacity} canal(is) atingido "
+                f"({self.inference_slots} slot(s) de inferência, RTF estimado {self.channel_rtf} por canal)"
+            )
+        self._check_memory()
+
+    def check_vod(self, running: float):
+        """Levanta AdmissionError se um job de VOD não cabe além da carga atual (em canais)."""
+        if running + self.vod_channels > self.channel_capacity:
+            raise AdmissionError(
+                f"sem capacidade para um job de VOD ({self.vod_slots} slot(s) de inferência) além da carga "
+                f"atual de {running:g} canal(is) de {self.channel_capacity}"
+            )
+        self._check_memory()
+
+    def _check_memory(self):
+        available = _available_memory_mb()
+        if available is not None and available < self.channel_memory_mb + self.memory_reserve_mb:
+            raise AdmissionError(
+                f"memória insuficiente: {available:.0f} MB livres, "
+                f"{self.channel_memory_mb + self.memory_reserve_mb:.0f} MB necessários"
+            )
+
+    def check_language(self, languages: int):
+        if languages >= self.max_languages:
+            raise AdmissionError(f"limite de {self.max_languages} idioma(s) por canal atingido")
+
+    def as_dict(self, running: int, vod_jobs: int = 0) -> dict:
+        return {
+            "inference_slots": self.inference_slots,
+            "channel_capacity": self.channel_capacity,
+            "channels_running": running,
+            "vod_jobs_running": vod_jobs,
+            "vod_slots": self.vod_slots,
+            "max_languages": self.max_languages,
+            "available_memory_mb": _available_memory_mb(),
+        }
+
+
+class ChannelRecord:
+    def __init__(self, channel: str, audio_dir: str, mode: str):
+        self.channel = channel
+        self.audio_dir = audio_dir
+        self.mode = mode
+        self.state = "starting"  # starting | running | backoff | restarting | failed
+        self.capture = None  # Popen (wav) ou PCMCapture (pcm)
+        self.source = None
+        self.started_at = None
+        self.capture_started_at = None
+        self.restarts = 0
+        self.failures = 0  # quedas seguidas (zera quando a captura fica de pé por stable_seconds)
+        self.last_exit = None
+        self.retry_at = None
+
+    def capture_pid(self):
+        return self.capture.process.pid if self.mode == "pcm" else self.capture.pid
+
+    def capture_alive(self) -> bool:
+        return self.capture is not None and self.capture.poll() is None
+
+
+class ChannelSupervisor:
+    def __init__(self, log_bus, capture_mode: str = "wav", budget: ComputeBudget = None,
+                 check_interval: float = 1.0, backoff: float = 2.0, max_backoff: float = 60.0,
+                 stable_seconds: float = 60.0, max_failures: int = 20):
+        self.log_bus = log_bus
+        self.capture_mode = capture_mode
+        self.budget = budget or ComputeBudget.from_env()
+        self.check_interval = check_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_seconds = stable_seconds
+        self.max_failures = max_failures
+        self._channels = {}
+        self._lock = threading.RLock()
+        self._monitor = None
+
+    # ------------------------------------------------------------ API
+
+    def start(self, channel: str, lang: str) -> dict:
+        """
+        Garante o canal rodando com o idioma anexado. Retorna
+        {"channel_started": bool, "language_attached": bool}.
+        Levanta AdmissionError se o orçamento não comporta.
+        """
+        with self._lock:
+            record = self._channels.get(channel)
+            if record is not None and record.state == "failed":
+                self._stop_locked(channel)
+                record = None
+
+            if record is not None:
+                languages = channel_languages(channel)
+                if lang in languages:
+                    return {"channel_started": False, "language_attached": False}
+                self._admit(self.budget.check_language, len(languages))
+                start_worker_thread(record.audio_dir, lang, self.log_bus.for_channel(channel), source=record.source)
+                return {"channel_started": False, "language_attached": True}
+
+            self._admit(self.budget.check_channel, self._load())
+            record = ChannelRecord(channel, os.path.join(audio_root(), channel), self.capture_mode)
+            self._spawn_capture(record)
+            record.started_at = time.time()
+            self._channels[channel] = record
+            start_worker_thread(record.audio_dir, lang, self.log_bus.for_channel(channel), source=record.source)
+            record.state = "running"
+            self._ensure_monitor()
+        logger.info(f"[supervisor] Canal {channel} iniciado ({self.capture_mode}, PID {record.capture_pid()})")
+        return {"channel_started": True, "language_attached": True}
+
+    def start_vod(self, source: str, langs: list, fmt: str = "mp4") -> dict:
+        """
+        Inicia (ou retoma) um job de VOD com o ASR limitado a budget.vod_slots.
+        Idempotente enquanto o job roda. Levanta AdmissionError se o orçamento não comporta.
+        """
+        with self._lock:
+            job = vod_status(job_id_for(source))
+            if job is None or job["state"] in FINISHED_STATES:
+                self._admit(self.budget.check_vod, self._load())
+            return start_vod_job(source, langs, fmt=fmt, log_queue=self.log_bus.for_channel("vod"),
+                                 asr_slots=self.budget.vod_slots)
+
+    def stop(self, channel: str, lang: str = None) -> bool:
+        """Remove o idioma (ou o canal inteiro, sem lang). Retorna False se não estava rodando."""
+        with self._lock:
+            if channel not in self._channels:
+                return False
+            if lang is not None:
+                if not stop_worker(channel, lang):
+                    return False
+                if channel_languages(channel):
+                    return True
+                # Sem idiomas, a captura só gastaria orçamento: encerra o canal
+            self._stop_locked(channel)
+        logger.info(f"[supervisor] Canal {channel} encerrado")
+        return True
+
+    def status(self, channel: str = None) -> dict:
+        with self._lock:
+            records = [self._channels[channel]] if channel in self._channels else (
+                [] if channel else list(self._channels.values()))
+            now = time.time()
+            channels = {
+                record.channel: {
+                    "state": record.state,
+                    "mode": record.mode,
+                    "languages": channel_languages(record.channel),
+                    "capture_pid": record.capture_pid() if record.capture is not None else None,
+                    "capture_alive": record.capture_alive(),
+                    "pipeline_alive": is_channel_running(record.channel),
+                    "uptime_seconds": now - record.started_at if record.started_at else None,
+                    "restarts": record.restarts,
+                    "last_exit_code": record.last_exit,
+                    "retry_in_seconds": max(0.0, record.retry_at - now) if record.retry_at else None,
+                    "latency": channel_latency(record.channel),
+                }
+                for record in records
+            }
+            return {"budget": self.budget.as_dict(self._running(), running_vod_jobs()), "channels": channels}
+
+    def shutdown(self):
+        with self._lock:
+            for channel in list(self._channels):
+                self._stop_locked(channel)
+
+    # ------------------------------------------------------------ internos
+
+    def _running(self) -> int:
+        return sum(1 for record in self._channels.values() if record.state != "failed")
+
+    def _load(self) -> float:
+        """Carga em canais: os ao vivo mais os jobs de VOD em andamento."""
+        return self._running() + running_vod_jobs() * self.budget.vod_channels
+
+    def _admit(self, check, value: int):
+        try:
+            check(value)
+        except AdmissionError as e:
+            ADMISSION_REFUSED.inc()
+            logger.warning(f"[supervisor] Recusado: {e}")
+            raise
+
+    def _spawn_capture(self, record: ChannelRecord, restart: bool = False):
+        config = channel_config(record.channel)
+        if record.mode == "pcm":
+            if restart:
+                record.capture.restart()
+            else:
+                record.capture = start_capture_pcm(record.channel, record.audio_dir,
+                                                   archive=os.getenv("ARCHIVE_WAV") == "1")
+                segmenter = None
+                if config.segmenter == "adaptive":
+                    segmenter = SpeechSegmenter(
+                        record.capture.ring.sample_rate,
+                        min_seconds=config.min_segment,
+                        target_seconds=config.target_segment,
+                        max_seconds=config.max_segment,
+                        overlap_seconds=config.segment_overlap,
+                        min_pause=config.min_pause,
+                    )
+                record.source = RingSegmentSource(record.capture.ring, record.audio_dir,
+                                                  segment_seconds=config.target_segment,
+                                                  log_queue=self.log_bus.for_channel(record.channel),
+                                                  segmenter=segmenter)
+        else:
+            os.makedirs(record.audio_dir, exist_ok=True)
+            # Sempre continua a numeração (sobras da retenção ou de uma execução anterior
+            # ficam em disco): o watcher espera exatamente este número
+            start_number = next_segment_number(record.audio_dir)
+            record.capture = start_capture(record.channel, record.audio_dir, segment_time=config.max_segment,
+                                           start_number=start_number)
+            if not restart:
+                record.source = DirectorySegmentSource(record.audio_dir, start_seq=start_number)
+        record.capture_started_at = time.monotonic()
+
+    def _stop_capture(self, record: ChannelRecord):
+        if record.capture is None:
+            return
+        if record.mode == "pcm":
+            record.capture.stop()
+        else:
+            stop_capture(record.capture)
+
+    def _stop_locked(self, channel: str):
+        record = self._channels.pop(channel)
+        stop_channel(channel)
+        self._stop_capture(record)
+
+    def _ensure_monitor(self):
+        if self._monitor is None or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._monitor_loop, name="channel-supervisor", daemon=True)
+            self._monitor.start()
+
+    def _monitor_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            actions = []
+            with self._lock:
+                for record in list(self._channels.values()):
+                    try:
+                        action = self._check(record)
+                    except Exception as e:
+                        logger.error(f"[supervisor] Erro ao verificar {record.channel}: {e}")
+                        continue
+                    if action is not None:
+                        actions.append((action, record))
+            # Parar/reiniciar capturas espera processos (proc.wait, join): fora do lock
+            for action, record in actions:
+                try:
+                    action(record)
+                except Exception as e:
+                    logger.error(f"[supervisor] Erro ao reiniciar {record.channel}: {e}")
+
+    def _check(self, record: ChannelRecord):
+        """
+        Decide, com o lock, o que fazer com o canal. Trabalho lento (parar ou
+        reiniciar a captura) volta como uma ação para rodar fora do lock.
+        """
+        if record.state in ("failed", "restarting"):
+            return None
+        log = self.log_bus.for_channel(record.channel)
+
+        if record.state == "running" and not record.capture_alive():
+            record.last_exit = record.capture.poll()
+            uptime = time.monotonic() - record.capture_started_at
+            record.failures = 1 if uptime >= self.stable_seconds else record.failures + 1
+            if record.failures > self.max_failures:
+                record.state = "failed"
+                log.put(f"[supervisor] Captura de {record.channel} caiu {record.failures - 1} vezes seguidas; "
+                        f"canal marcado como falho")
+                return self._fail_channel
+            delay = min(self.max_backoff, self.backoff * 2 ** (record.failures - 1))
+            record.state = "backoff"
+            record.retry_at = time.time() + delay
+            log.put(f"[supervisor] Captura de {record.channel} caiu (código {record.last_exit}); "
+                    f"reiniciando em {delay:.0f}s")
+            return None
+
+        if record.state == "backoff" and time.time() >= record.retry_at:
+            record.state = "restarting"
+            return self._restart_capture
+
+        if not is_channel_running(record.channel):
+            # A thread do pipeline morreu de vez (worker_wrapper já tentou uma vez): sobe de novo
+            languages = channel_languages(record.channel)
+            if languages:
+                start_worker_thread(record.audio_dir, languages[0], log, source=record.source)
+                log.put(f"[supervisor] Pipeline de {record.channel} reiniciado")
+        return None
+
+    def _fail_channel(self, record: ChannelRecord):
+        stop_channel(record.channel)
+        self._stop_capture(record)
+
+    def _restart_capture(self, record: ChannelRecord):
+        """Fora do lock; se o canal foi encerrado enquanto isso, desfaz o reinício."""
+        if record.mode == "wav":
+            stop_capture(record.capture)  # streamlink pode ter ficado órfão
+        self._spawn_capture(record, restart=True)
+        with self._lock:
+            current = self._channels.get(record.channel) is record
+            if current:
+                record.restarts += 1
+                record.retry_at = None
+                record.state = "running"
+        if not current:
+            self._stop_capture(record)
+            return
+        CAPTURE_RESTARTS.inc(channel=record.channel)
+        self.log_bus.for_channel(record.channel).put(
+            f"[supervisor] Captura de {record.channel} reiniciada (PID {record.capture_pid()}, "
+            f"{record.restarts} reinício(s))")
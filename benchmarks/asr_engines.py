@@ -0,0 +1,193 @@
+# livestream-w2-gaules/benchmarks/asr_engines.py
+
+"""
+Compara os motores de ASR (pipeline/asr_engines.py) nos MESMOS segmentos:
+fator de tempo real, tempo de carga, memória e divergência do texto em
+relação ao primeiro motor da lista.
+
+Uso:
+    python -m benchmarks.asr_engines --segments audio_segments/gaules --limit 30
+    python -m benchmarks.asr_engines --engines whisper:base,whisper-int8:base,faster-whisper:small --batch 4
+
+Use segmentos gravados de verdade (--segments, ex.: os WAVs do recorder):
+a "fala" sintética do benchmarks/synthetic.py serve para medir RTF, mas não
+diz nada sobre a qualidade. Cada motor roda num processo próprio (a memória
+de um não contamina o outro), com a mesma quantidade de threads.
+
+Memória: rss_anon_mb é a parte privada do processo (o que multiplica por
+processo do pool); rss_file_mb são páginas de arquivo mapeadas, como os pesos
+via mmap, compartilhadas entre processos.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import synthetic
+from benchmarks.run import REPO_DIR, _git_commit
+
+DEFAULT_ENGINES = "whisper:base,whisper-int8:base,faster-whisper:base"
+
+
+def _memory_mb() -> dict:
+    """VmRSS/VmHWM/RssAnon/RssFile do processo (Linux), em MB."""
+    fields = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "RssAnon", "RssFile"):
+                    fields[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return fields
+
+
+def _word_error_rate(reference: str, hypothesis: str):
+    """Distância de edição por palavras / palavras da referência (None sem referência)."""
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return None if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, 1):
+        current = [i]
+        for j, other in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def run_engine(spec: dict) -> dict:
+    """Roda no processo filho: carrega o motor e transcreve os segmentos."""
+    from pipeline.asr_engines import ENGINES, DecodeOptions
+
+    memory_before = _memory_mb()
+    name, _, model = spec["engine"].partition(":")
+    options = DecodeOptions(spec["beam_size"], spec["temperature"], not spec["timestamps"])
+    engine = ENGINES[name](model or "base", options)
+    engine.set_threads(spec["threads"])
+    started = time.perf_counter()
+    engine.load()
+    load_seconds = time.perf_counter() - started
+    memory_loaded = _memory_mb()
+
+    audios = [engine.load_audio(path) for path in spec["segments"]]
+    # Primeiro decode fora da medição (alocações, caches de kernels)
+    engine.transcribe([audios[0]], spec["language"])
+
+    texts = []
+    per_segment = []
+    started = time.perf_counter()
+    for i in range(0, len(audios), spec["batch"]):
+        batch = audios[i:i + spec["batch"]]
+        batch_started = time.perf_counter()
+        texts.extend(engine.transcribe(batch, spec["language"]))
+        per_segment.extend([(time.perf_counter() - batch_started) / len(batch)] * len(batch))
+    compute_seconds = time.perf_counter() - started
+    audio_seconds = sum(len(audio) for audio in audios) / 16000
+    memory = _memory_mb()
+    return {
+        "engine": str(engine),
+        "options": str(options),
+        "load_seconds": load_seconds,
+        "audio_seconds": audio_seconds,
+        "compute_seconds": compute_seconds,
+        "rtf": compute_seconds / audio_seconds,
+        "x_realtime": audio_seconds / compute_seconds,
+        "segment_seconds_max": max(per_segment),
+        "rss_base_mb": memory_before.get("VmRSS"),
+        "rss_loaded_mb": memory_loaded.get("VmRSS"),
+        "peak_rss_mb": memory.get("VmHWM"),
+        "rss_anon_mb": memory.get("RssAnon"),
+        "rss_file_mb": memory.get("RssFile"),
+        "texts": texts,
+    }
+
+
+def _segments(args, work_dir: str) -> list:
+    if args.segments:
+        paths = sorted(glob.glob(os.path.join(args.segments, "segment_*.wav")))
+        if not paths:
+            raise SystemExit(f"nenhum segment_*.wav em {args.segments}")
+        return [os.path.abspath(path) for path in paths[:args.limit]]
+    print("[asr-bench] Sem --segments: usando fala sintética (mede RTF, não qualidade)")
+    stream = synthetic.make_stream("speech:20,silence:2", args.limit * 5.0, seed=0)
+    return [synthetic.write_segment(work_dir, seq, samples)
+            for seq, samples in enumerate(synthetic.split_segments(stream, 5.0))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara motores de ASR nos mesmos segmentos")
+    parser.add_argument("--engines", default=DEFAULT_ENGINES, help="motor:modelo separados por vírgula")
+    parser.add_argument("--segments", help="diretório com segment_*.wav gravados")
+    parser.add_argument("--limit", type=int, default=20, help="máximo de segmentos")
+    parser.add_argument("--language", default="pt")
+    parser.add_argument("--batch", type=int, default=1, help="segmentos por decode (1 = ao vivo em dia)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--beam-size", type=int, default=0)
+    parser.add_argument("--temperature", default="0.0,0.2,0.4,0.6,0.8,1.0")
+    parser.add_argument("--timestamps", action="store_true", help="decodifica com timestamps")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "benchmarks", "results"))
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_engine(json.loads(args.child)), ensure_ascii=False))
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix="asr-bench-")
+    segments = _segments(args, work_dir)
+    results = []
+    for engine in args.engines.split(","):
+        spec = {"engine": engine, "segments": segments, "language": args.language, "batch": args.batch,
+                "threads": args.threads, "beam_size": args.beam_size, "temperature": args.temperature,
+                "timestamps": args.timestamps}
+        print(f"[asr-bench] {engine}: {len(segments)} segmento(s) ...")
+        process = subprocess.run([sys.executable, "-m", "benchmarks.asr_engines", "--child", json.dumps(spec)],
+                                 cwd=REPO_DIR, capture_output=True, text=True)
+        if process.returncode != 0:
+            error = (process.stderr.strip().splitlines() or ["?"])[-1]
+            print(f"[asr-bench] {engine} falhou: {error}")
+            results.append({"engine": engine, "error": error})
+            continue
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    reference = next((result for result in results if "texts" in result), None)
+    for result in results:
+        if "texts" in result and reference is not None:
+            rates = [_word_error_rate(ref, hyp) for ref, hyp in zip(reference["texts"], result["texts"])]
+            rates = [rate for rate in rates if rate is not None]
+            result["wer_vs_reference"] = sum(rates) / len(rates) if rates else None
+
+    print(f"\n[asr-bench] {len(segments)} segmento(s), lote {args.batch}, {args.threads} thread(s); "
+          f"referência do texto: {reference['engine'] if reference else '-'}")
+    print(f"  {'motor':<36}{'x tempo real':>13}{'RTF':>8}{'carga s':>9}{'RSS MB':>8}"
+          f"{'anon MB':>9}{'pico MB':>9}{'WER':>7}")
+    for result in results:
+        if "error" in result:
+            print(f"  {result['engine']:<36}  erro: {result['error']}")
+            continue
+        wer = result.get("wer_vs_reference")
+        print(f"  {result['engine']:<36}{result['x_realtime']:>13.2f}{result['rtf']:>8.3f}"
+              f"{result['load_seconds']:>9.2f}{result['rss_loaded_mb'] or 0:>8.0f}{result['rss_anon_mb'] or 0:>9.0f}"
+              f"{result['peak_rss_mb'] or 0:>9.0f}{'-' if wer is None else f'{wer:.1%}':>7}")
+
+    os.makedirs(args.output, exist_ok=True)
+    commit = _git_commit()
+    path = os.path.join(args.output, f"asr-engines-{commit['commit'] or 'nogit'}-"
+                                     f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**commit, "params": {k: v for k, v in vars(args).items() if k not in ("child", "output")},
+                   "segments": segments, "results": results}, f, indent=2, ensure_ascii=False)
+    print(f"[asr-bench] Resultado salvo em {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# livestream-w2-gaules/benchmarks/compare.py
+
+"""
+Compara dois resultados do benchmarks/run.py (ex.: antes e depois de uma mudança).
+
+Uso:
+    python -m benchmarks.compare base.json novo.json [--threshold 10]
+
+Mostra a variação de cada número; com --threshold, marca como regressão o que
+piorou mais que o limite (%) e sai com código 1 se houver alguma.
+"""
+
+import argparse
+import json
+import sys
+
+# (caminho no JSON, True se maior é melhor)
+SUMMARY_KEYS = (
+    (("summary", "throughput_x_realtime"), True),
+    (("summary", "rtf"), False),
+    (("summary", "segments_packaged"), True),
+    (("resources", "peak_rss_mb"), False),
+    (("resources", "cpu_user_seconds"), False),
+    (("resources", "cpu_system_seconds"), False),
+    (("resources", "disk_read_bytes"), False),
+    (("resources", "disk_write_bytes"), False),
+)
+LATENCY_FIELDS = ("p50", "p90", "p99")
+
+
+def _get(data: dict, path: tuple):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(base: dict, new: dict, threshold: float = None) -> list:
+    """[(nome, base, novo, variação %, regressão?)]"""
+    rows = []
+    candidates = [(".".join(path), path, higher_is_better) for path, higher_is_better in SUMMARY_KEYS]
+    for series in sorted(set(base.get("latency", {})) | set(new.get("latency", {}))):
+        for field in LATENCY_FIELDS:
+            candidates.append((f"{series} {field}", ("latency", series, field), False))
+
+    for name, path, higher_is_better in candidates:
+        before, after = _get(base, path), _get(new, path)
+        if before is None or after is None:
+            rows.append((name, before, after, None, False))
+            continue
+        change = (after - before) / before * 100 if before else None
+        worse = change is not None and (-change if higher_is_better else change)
+        regression = threshold is not None and worse is not None and worse > threshold
+        rows.append((name, before, after, change, regression))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, help="piora máxima aceita (%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{base.get('name')} @ {base.get('commit')}  ->  {new.get('name')} @ {new.get('commit')}")
+    rows = compare(base, new, args.threshold)
+    for name, before, after, change, regression in rows:
+        fmt = lambda value: "-" if value is None else f"{value:.4g}"
+        delta = "" if change is None else f"{change:+.1f}%"
+        print(f"  {name:<56}{fmt(before):>12}{fmt(after):>12}{delta:>10}{'  REGRESSÃO' if regression else ''}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# livestream-w2-gaules/benchmarks/fakes.py
+
+"""
+Backends falsos para o benchmark, com latência configurável.
+
+- FakeASRService: mesma interface do ASRService (submit/stats), "transcreve"
+  em tempo proporcional à duração do áudio (rtf) com `workers` em paralelo.
+- Tradução: o FakeTranslateBackend do próprio pipeline.translator
+  (TRANSLATE_BACKEND=fake, FAKE_TRANSLATE_LATENCY).
+- TTS: o servidor pipeline.mock_tts_server num subprocesso, apontado pelo
+  SPEECHIFY_API_URL; o caminho do cliente (aiohttp, retries, hedging) é o real.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.audio import read_wav
+
+WORDS = ("pessoal", "olha", "isso", "aqui", "mano", "vamos", "jogar", "agora", "rodada", "time",
+         "bomba", "plantada", "muito", "bom", "cara", "que", "jogada", "absurda", "não", "acredito")
+
+
+def fake_transcript(seconds: float, seed: int = 0) -> str:
+    """~2,5 palavras por segundo, determinístico por seed."""
+    n = max(1, int(seconds * 2.5))
+    return " ".join(WORDS[(seed * 7 + i * 3) % len(WORDS)] for i in range(n)) + "."
+
+
+class FakeASRService:
+    model_name = "fake"
+    max_pending_per_channel = 8
+
+    def __init__(self, rtf: float = 0.3, workers: int = 2):
+        self.rtf = rtf
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fake-asr")
+        self._lock = threading.Lock()
+        self._stats = {"segments": 0, "audio_seconds": 0.0, "compute_seconds": 0.0,
+                       "last_batch_size": None, "last_rtf": None}
+
+    def submit(self, channel: str, audio, language: str = "pt", engine=None):
+        return self._executor.submit(self._transcribe, audio)
+
+    def release_engine(self, engine):
+        pass
+
+    def _transcribe(self, audio) -> str:
+        started = time.perf_counter()
+        if isinstance(audio, str):
+            samples, sr = read_wav(audio)
+        elif hasattr(audio, "array"):
+            samples, sr = audio.array(), audio.sample_rate
+        else:
+            samples, sr = audio, 16000  # float32 16 kHz, como no ASRService
+        seconds = len(samples) / sr
+        time.sleep(seconds * self.rtf)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats
+            stats["segments"] += 1
+            stats["audio_seconds"] += seconds
+            stats["compute_seconds"] += elapsed
+            stats["last_batch_size"] = 1
+            stats["last_rtf"] = elapsed / seconds if seconds else None
+            seed = stats["segments"]
+        return fake_transcript(seconds, seed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = 0
+        stats["rtf"] = stats["compute_seconds"] / stats["audio_seconds"] if stats["audio_seconds"] else None
+        return stats
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class MockTTSServer:
+    """pipeline.mock_tts_server num subprocesso (fora do RSS/CPU medidos do pipeline)."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.2, error_rate: float = 0.0):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}/v1/tts/audio"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "pipeline.mock_tts_server", "--port", str(self.port),
+             "--latency", str(latency), "--jitter", str(jitter), "--error-rate", str(error_rate)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.5).close()
+                return
+            except OSError:
+                if self.process.poll() is not None:
+                    break
+                time.sleep(0.1)
+        self.close()
+        raise RuntimeError("mock_tts_server não subiu")
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=5)
@@ -0,0 +1,369 @@
+# livestream-w2-gaules/benchmarks/run.py
+
+"""
+Benchmark offline do pipeline completo: captura -> ASR -> tradução -> TTS -> HLS.
+
+Gera streams sintéticos (benchmarks/synthetic.py), grava os segmentos como o
+recorder e roda os mesmos ChannelPipeline/LanguageBranch de produção, com
+backends falsos de latência configurável (benchmarks/fakes.py). Nada sai da
+máquina.
+
+Uso:
+    python -m benchmarks.run --name baseline --seconds 120 --langs en,es
+    python -m benchmarks.run --realtime --channels 2 --tts-latency 0.6
+    python -m benchmarks.run --asr whisper          # ASR real (WHISPER_MODEL)
+    python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+
+Dois modos:
+- backlog (padrão): todos os segmentos são entregues de uma vez; mede a vazão
+  (quantas vezes mais rápido que o tempo real o pipeline drena o áudio).
+- --realtime: um segmento a cada segment_seconds, como a captura ao vivo;
+  mede a latência (idade do segmento ao ser publicado).
+
+O resultado (JSON em benchmarks/results/) traz vazão, RTF, percentis de
+latência por estágio, pico de RSS, CPU e I/O de disco, junto do commit, para
+comparar entre versões.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.fakes import FakeASRService, MockTTSServer
+from pipeline import channel_pipeline, metrics
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Histogramas reportados: (métrica, label que separa as séries ou None para agregar)
+REPORTED = (
+    ("dub_stage_seconds", "stage"),
+    ("dub_asr_latency_seconds", None),
+    ("dub_asr_batch_seconds", None),
+    ("dub_translate_request_seconds", None),
+    ("dub_tts_request_seconds", None),
+    ("dub_tts_synthesis_seconds", None),
+    ("dub_hls_write_seconds", None),
+    ("dub_encoder_latency_seconds", None),
+    ("dub_segment_age_seconds", None),
+    ("dub_timing_stretch_ratio", None),
+)
+
+
+class _LogSink:
+    """log_queue do benchmark: guarda só as últimas linhas e conta erros."""
+
+    def __init__(self, keep: int = 200):
+        self.lines = deque(maxlen=keep)
+        self.errors = 0
+
+    def put(self, msg, *args, **kwargs):
+        msg = str(msg)
+        if "ERRO" in msg or "Erro" in msg:
+            self.errors += 1
+        self.lines.append(msg)
+
+
+class _Samples:
+    """Recebe cada observação de histograma (metrics.set_sample_hook)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = defaultdict(list)  # (métrica, série) -> [valores]
+        self.packaged = 0
+        self.last_packaged_at = None
+
+    def __call__(self, name: str, labels: dict, value: float):
+        with self._lock:
+            self.values[(name, None)].append(value)
+            for metric, label in REPORTED:
+                if metric == name and label and label in labels:
+                    self.values[(name, labels[label])].append(value)
+            if name == "dub_segment_age_seconds":
+                self.packaged += 1
+                self.last_packaged_at = time.perf_counter()
+
+    def summary(self) -> dict:
+        result = {}
+        with self._lock:
+            items = {key: list(values) for key, values in self.values.items()}
+        for metric, label in REPORTED:
+            for (name, series), values in sorted(items.items(), key=lambda item: str(item[0])):
+                if name != metric or not values or (label is not None and series is None):
+                    continue
+                key = f"{name}{{{label}={series}}}" if series is not None else name
+                result[key] = _percentiles(values)
+        return result
+
+
+def _percentiles(values: list) -> dict:
+    data = np.asarray(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(data, (50, 90, 99))
+    return {"count": len(data), "mean": float(data.mean()), "p50": float(p50), "p90": float(p90),
+            "p99": float(p99), "max": float(data.max())}
+
+
+def _proc_io() -> dict:
+    """Bytes lidos/gravados no disco por este processo (Linux), ou blocos do getrusage."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read_bytes": int(fields["read_bytes"]), "write_bytes": int(fields["write_bytes"])}
+    except (OSError, KeyError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {"read_bytes": usage.ru_inblock * 512, "write_bytes": usage.ru_oublock * 512}
+
+
+def _maxrss_mb(usage) -> float:
+    # ru_maxrss: KiB no Linux, bytes no macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _resources(io_before: dict, usage_before, children_before) -> dict:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_after = _proc_io()
+    return {
+        "peak_rss_mb": _maxrss_mb(usage),
+        "children_peak_rss_mb": _maxrss_mb(children),
+        "cpu_user_seconds": usage.ru_utime - usage_before.ru_utime,
+        "cpu_system_seconds": usage.ru_stime - usage_before.ru_stime,
+        "children_cpu_seconds": (children.ru_utime + children.ru_stime)
+                                - (children_before.ru_utime + children_before.ru_stime),
+        "disk_read_bytes": io_after["read_bytes"] - io_before["read_bytes"],
+        "disk_write_bytes": io_after["write_bytes"] - io_before["write_bytes"],
+    }
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None,
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def _configure_env(args, tts_url: str, work_dir: str):
+    os.environ["TRANSLATE_BACKEND"] = "fake"
+    os.environ["FAKE_TRANSLATE_LATENCY"] = str(args.translate_latency)
+    os.environ.pop("TRANSLATION_CACHE_PATH", None)
+    os.environ["SPEECHIFY_API_URL"] = tts_url
+    os.environ["SPEECHIFY_API_KEY"] = "benchmark"
+    os.environ["SPEECHIFY_VOICE_ID"] = "benchmark"
+    os.environ["TTS_CACHE_DIR"] = os.path.join(work_dir, "tts_cache") if args.tts_cache else ""
+    os.environ["CHANNEL_CONFIG"] = os.path.abspath(args.channel_config or os.path.join(work_dir, "channels.json"))
+    if args.no_vad:
+        os.environ["VAD_ENABLED"] = "0"
+
+
+def run(args) -> dict:
+    langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()]
+    print(f"[bench] Gerando {args.channels} stream(s) de {args.seconds:.0f}s ({args.pattern}) ...")
+    streams = [synthetic.make_stream(args.pattern, args.seconds, seed=args.seed + i) for i in range(args.channels)]
+    segments = [synthetic.split_segments(stream, args.segment_seconds) for stream in streams]
+    audio_seconds = sum(len(stream) for stream in streams) / synthetic.SAMPLE_RATE
+    expected = sum(len(channel_segments) for channel_segments in segments) * len(langs)
+
+    work_dir = tempfile.mkdtemp(prefix="dub-bench-")
+    tts = MockTTSServer(args.tts_latency, args.tts_jitter, args.tts_error_rate)
+    _configure_env(args, tts.url, work_dir)
+    # O pipeline grava em hls/<canal>/<idioma> relativo ao diretório atual
+    os.chdir(work_dir)
+
+    if args.asr == "fake":
+        asr = FakeASRService(rtf=args.asr_rtf, workers=args.asr_workers)
+        channel_pipeline.get_asr_service = lambda config=None: asr
+
+    samples = _Samples()
+    metrics.set_sample_hook(samples)
+    log = _LogSink()
+
+    pipelines = []
+    for i in range(args.channels):
+        audio_dir = os.path.join(work_dir, "audio", f"bench{i}")
+        os.makedirs(audio_dir, exist_ok=True)
+        pipeline = channel_pipeline.ChannelPipeline(audio_dir, log)
+        for lang in langs:
+            pipeline.attach(lang)
+        threading.Thread(target=pipeline.run, daemon=True).start()
+        pipelines.append(pipeline)
+
+    io_before = _proc_io()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    print(f"[bench] {expected} segmento(s) x idioma esperados; modo {'tempo real' if args.realtime else 'backlog'}")
+
+    started = time.perf_counter()
+    feeder = threading.Thread(target=_feed, args=(pipelines, segments, args), daemon=True)
+    feeder.start()
+    timed_out = not _wait(samples, pipelines, feeder, expected, started + args.timeout)
+    finished = samples.last_packaged_at or time.perf_counter()
+    wall_seconds = finished - started
+
+    resources = _resources(io_before, usage_before, children_before)
+    # Decisões do controle de latência (pipeline/latency_controller.py) por canal
+    degradation = {pipeline.channel: pipeline.controller.as_dict() for pipeline in pipelines}
+    for pipeline in pipelines:
+        for lang in pipeline.languages():
+            pipeline.detach(lang)
+    metrics.set_sample_hook(None)
+    resources["hls_bytes"] = _dir_bytes(os.path.join(work_dir, "hls"))
+    tts.close()
+    os.chdir(REPO_DIR)
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "name": args.name,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **_git_commit(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+        "summary": {
+            "audio_seconds": audio_seconds,
+            "wall_seconds": wall_seconds,
+            # Backlog: quantas vezes mais rápido que o tempo real; tempo real: ~1 se acompanha
+            "throughput_x_realtime": audio_seconds / wall_seconds if wall_seconds else None,
+            "rtf": wall_seconds / audio_seconds if audio_seconds else None,
+            "segments_expected": expected,
+            "segments_packaged": samples.packaged,
+            "log_errors": log.errors,
+            "timed_out": timed_out,
+        },
+        "latency": samples.summary(),
+        "degradation": degradation,
+        "resources": resources,
+        "work_dir": work_dir if args.keep else None,
+    }
+    if timed_out:
+        result["log_tail"] = list(log.lines)[-30:]
+    return result
+
+
+def _feed(pipelines: list, segments: list, args):
+    started = time.perf_counter()
+    for seq in range(max(len(channel_segments) for channel_segments in segments)):
+        if args.realtime:
+            # O segmento seq "termina de ser capturado" em (seq + 1) * segment_seconds
+            delay = started + (seq + 1) * args.segment_seconds - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        for pipeline, channel_segments in zip(pipelines, segments):
+            if seq < len(channel_segments):
+                synthetic.write_segment(pipeline.audio_dir, seq, channel_segments[seq])
+
+
+def _wait(samples: _Samples, pipelines: list, feeder: threading.Thread, expected: int, deadline: float,
+          idle_seconds: float = 10.0) -> bool:
+    """
+    Espera todos os segmentos serem publicados. Segmentos que falham (ex.: TTS
+    esgotou os retries) nunca chegam: também termina quando tudo foi entregue,
+    as filas esvaziaram e nada é publicado há idle_seconds.
+    """
+    last_report = time.perf_counter()
+    while samples.packaged < expected:
+        now = time.perf_counter()
+        if now >= deadline:
+            return False
+        if now - last_report >= 5:
+            print(f"[bench] {samples.packaged}/{expected} publicados ...")
+            last_report = now
+        if not feeder.is_alive() and samples.last_packaged_at is not None \
+                and now - samples.last_packaged_at > idle_seconds \
+                and all(_queues_empty(pipeline.queue_depths()) for pipeline in pipelines):
+            return True
+        time.sleep(0.05)
+    return True
+
+
+def _queues_empty(depths: dict) -> bool:
+    return all(_queues_empty(value) if isinstance(value, dict) else value == 0 for value in depths.values())
+
+
+def _print_summary(result: dict):
+    summary = result["summary"]
+    resources = result["resources"]
+    print(f"\n[bench] {result['name']} @ {result['commit']}{' (sujo)' if result['dirty'] else ''}")
+    print(f"  áudio {summary['audio_seconds']:.0f}s em {summary['wall_seconds']:.1f}s: "
+          f"{summary['throughput_x_realtime']:.2f}x tempo real (RTF {summary['rtf']:.3f}); "
+          f"{summary['segments_packaged']}/{summary['segments_expected']} segmentos, "
+          f"{summary['log_errors']} erro(s) no log" + (" — TIMEOUT" if summary["timed_out"] else ""))
+    print(f"  {'série':<48}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for key, stats in result["latency"].items():
+        print(f"  {key:<48}{stats['count']:>6}{stats['p50']:>9.3f}{stats['p90']:>9.3f}"
+              f"{stats['p99']:>9.3f}{stats['max']:>9.3f}")
+    for channel, state in result["degradation"].items():
+        for event in state["history"]:
+            print(f"  {channel}: {event['from']} → {event['to']} (atraso {event['lag_seconds']:.1f}s)")
+    print(f"  RSS pico {resources['peak_rss_mb']:.0f} MB (filhos {resources['children_peak_rss_mb']:.0f} MB), "
+          f"CPU {resources['cpu_user_seconds'] + resources['cpu_system_seconds']:.1f}s "
+          f"(filhos {resources['children_cpu_seconds']:.1f}s), "
+          f"disco lido {resources['disk_read_bytes'] / 1e6:.1f} MB / gravado {resources['disk_write_bytes'] / 1e6:.1f} MB, "
+          f"HLS {resources['hls_bytes'] / 1e6:.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de dublagem")
+    parser.add_argument("--name", default="bench", help="nome do resultado")
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--langs", default="en", help="idiomas separados por vírgula")
+    parser.add_argument("--seconds", type=float, default=60.0, help="duração de cada stream")
+    parser.add_argument("--segment-seconds", type=float, default=5.0)
+    parser.add_argument("--pattern", default="speech:20,silence:4,music:6",
+                        help="trechos tipo:segundos repetidos (speech, silence, music)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--realtime", action="store_true", help="entrega os segmentos no ritmo da captura")
+    parser.add_argument("--asr", choices=("fake", "whisper"), default="fake")
+    parser.add_argument("--asr-rtf", type=float, default=0.3, help="ASR falso: segundos de computação por segundo de áudio")
+    parser.add_argument("--asr-workers", type=int, default=2)
+    parser.add_argument("--translate-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--tts-jitter", type=float, default=0.2)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-cache", action="store_true", help="liga o cache de áudio do TTS")
+    parser.add_argument("--no-vad", action="store_true", help="desliga o portão VAD")
+    parser.add_argument("--channel-config", help="JSON de configuração por canal (pipeline/config.py)")
+    parser.add_argument("--timeout", type=float, default=900.0)
+    parser.add_argument("--keep", action="store_true", help="mantém o diretório de trabalho (segmentos, HLS)")
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "benchmarks", "results"))
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    _print_summary(result)
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(args.output, f"{args.name}-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"[bench] Resultado salvo em {path}")
+    return 1 if result["summary"]["timed_out"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# livestream-w2-gaules/benchmarks/synthetic.py
+
+"""
+Streams sintéticos para o benchmark, gerados com NumPy (sem rede nem captura).
+
+Um padrão como "speech:20,silence:5,music:10" vira um sinal contínuo com
+trechos de "fala" (harmônicos moldados por formantes, com sílabas a
+~4 Hz e pausas curtas, que passam no portão VAD), silêncio (ruído de fundo
+baixo) e "música" (acordes sustentados, que o VAD descarta). O sinal é
+gravado em segment_000.wav, segment_001.wav, ... como o recorder faz.
+"""
+
+import os
+import wave
+
+import numpy as np
+
+from pipeline.audio import to_pcm16
+
+SAMPLE_RATE = 48000
+# (F1, F2, F3) de algumas vogais: cada sílaba sorteia uma
+VOWELS = ((730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (570, 840, 2410))
+
+
+def _formant_gain(freqs: np.ndarray, formants: tuple) -> np.ndarray:
+    """Ganho de uma cadeia de ressonâncias (formantes) nas frequências dadas."""
+    gain = np.zeros_like(freqs)
+    for f in formants:
+        bandwidth = 80 + f / 20
+        gain += 1.0 / (1.0 + ((freqs - f) / bandwidth) ** 2)
+    return gain
+
+
+def speech(seconds: float, sr: int = SAMPLE_RATE, rng: np.random.Generator = None) -> np.ndarray:
+    rng = rng or np.random.default_rng()
+    out = np.zeros(int(seconds * sr), dtype=np.float32)
+    pos = 0
+    while pos < len(out):
+        syllable = int(rng.uniform(0.15, 0.3) * sr)
+        if rng.random() < 0.12:
+            pos += int(rng.uniform(0.2, 0.5) * sr)  # pausa entre frases
+            continue
+        n = min(syllable, len(out) - pos)
+        # Síntese aditiva: harmônicos de f0 com o envelope dos formantes da vogal
+        f0 = rng.uniform(100, 180)
+        harmonics = f0 * np.arange(1, int(4000 / f0) + 1)
+        gains = _formant_gain(harmonics, VOWELS[rng.integers(len(VOWELS))])
+        t = np.arange(n) / sr
+        voiced = (gains[:, None] * np.sin(2 * np.pi * harmonics[:, None] * t)).sum(axis=0)
+        envelope = np.sin(np.pi * np.arange(n) / n) ** 2
+        out[pos:pos + n] = voiced * envelope
+        pos += n
+    peak = np.abs(out).max() or 1.0
+    return (0.3 * out / peak + 0.001 * rng.standard_normal(len(out))).astype(np.float32)
+
+
+def silence(seconds: float, sr: int = SAMPLE_RATE, rng: np.random.Generator = None) -> np.ndarray:
+    rng = rng or np.random.default_rng()
+    return (0.0003 * rng.standard_normal(int(seconds * sr))).astype(np.float32)
+
+
+def music(seconds: float, sr: int = SAMPLE_RATE, rng: np.random.Generator = None) -> np.ndarray:
+    rng = rng or np.random.default_rng()
+    t = np.arange(int(seconds * sr)) / sr
+    out = np.zeros(len(t))
+    chord_seconds = 2.0
+    for start in np.arange(0, seconds, chord_seconds):
+        mask = (t >= start) & (t < start + chord_seconds)
+        root = rng.choice((220.0, 246.9, 261.6, 293.7))
+        for ratio in (1.0, 1.26, 1.5):
+            out[mask] += 0.05 * np.sin(2 * np.pi * root * ratio * t[mask])
+    return out.astype(np.float32)
+
+
+GENERATORS = {"speech": speech, "silence": silence, "music": music}
+
+
+def parse_pattern(pattern: str) -> list:
+    """ "speech:20,silence:5" -> [("speech", 20.0), ("silence", 5.0)]"""
+    parts = []
+    for item in pattern.split(","):
+        kind, _, seconds = item.strip().partition(":")
+        if kind not in GENERATORS:
+            raise ValueError(f"tipo de trecho desconhecido: {kind!r} (use {', '.join(GENERATORS)})")
+        parts.append((kind, float(seconds)))
+    return parts
+
+
+def make_stream(pattern: str, total_seconds: float, sr: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """Repete o padrão até total_seconds. A mesma seed gera o mesmo sinal."""
+    rng = np.random.default_rng(seed)
+    parts = parse_pattern(pattern)
+    chunks = []
+    length = 0
+    target = int(total_seconds * sr)
+    while length < target:
+        for kind, seconds in parts:
+            chunk = GENERATORS[kind](seconds, sr, rng)
+            chunks.append(chunk)
+            length += len(chunk)
+    return np.concatenate(chunks)[:target]
+
+
+def write_segment(audio_dir: str, seq: int, samples: np.ndarray, sr: int = SAMPLE_RATE) -> str:
+    """Grava segment_{seq:03d}.wav atomicamente (o watcher o vê já fechado)."""
+    path = os.path.join(audio_dir, f"segment_{seq:03d}.wav")
+    tmp_path = path + ".tmp"
+    with wave.open(tmp_path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(to_pcm16(samples))
+    os.replace(tmp_path, path)
+    return path
+
+
+def split_segments(samples: np.ndarray, segment_seconds: float, sr: int = SAMPLE_RATE) -> list:
+    step = int(segment_seconds * sr)
+    return [samples[i:i + step] for i in range(0, len(samples), step)]
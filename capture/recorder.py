@@ -1,36 +1,221 @@
 # livestream-w2-gaules/capture/recorder.py
 
 import os
+import re
 import subprocess
 import shlex
 import logging
+import threading
+import time
+import wave
+
+import numpy as np
+
+from capture.ring_buffer import PCMRingBuffer, RingClosed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("recorder")
 
+SEGMENT_RE = re.compile(r"^segment_(\d+)\.wav$")
+
 
-def start_capture(channel_name: str, output_dir: str):
+def _spawn_capture(channel_name: str, ffmpeg_output: str, log_file, stdout=None):
     """
-    Inicia o ffmpeg para capturar áudio do canal Twitch, segmentando em .wav de 10s.
+    Sobe streamlink → ffmpeg ligados por um pipe de verdade (Popen com lista de
+    argumentos não interpreta "|"). Retorna o processo do ffmpeg, com o do
+    streamlink acessível em process.streamlink.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    cmd_str = (
-        f"streamlink --twitch-disable-hosting twitch.tv/{channel_name} best -O "
-        f"| ffmpeg -hide_banner -loglevel error -i - -vn "
-        f"-acodec pcm_s16le -ar 48000 -ac 2 "
-        f"-f segment -segment_time 10 -reset_timestamps 1 "
-        f"{output_dir}/segment_%03d.wav"
+    streamlink_cmd = f"streamlink --twitch-disable-hosting twitch.tv/{channel_name} best -O"
+    ffmpeg_cmd = f"ffmpeg -hide_banner -loglevel error -i - -vn {ffmpeg_output}"
+    logger.info(f"[recorder] Comando completo para captura: {streamlink_cmd} | {ffmpeg_cmd}")
+
+    streamlink = subprocess.Popen(
+        shlex.split(streamlink_cmd),
+        stdout=subprocess.PIPE,
+        stderr=log_file
     )
-    logger.info(f"[recorder] Comando completo para captura: {cmd_str}")
+    process = subprocess.Popen(
+        shlex.split(ffmpeg_cmd),
+        stdin=streamlink.stdout,
+        stdout=stdout if stdout is not None else log_file,
+        stderr=log_file
+    )
+    # O ffmpeg é o único leitor do pipe; fecha a nossa ponta para o SIGPIPE funcionar
+    streamlink.stdout.close()
+    process.streamlink = streamlink
+    return process
+
+
+def next_segment_number(output_dir: str) -> int:
+    """Número do próximo segment_NNN.wav, depois do maior já gravado em output_dir."""
+    numbers = [int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(output_dir)) if m]
+    return max(numbers) + 1 if numbers else 0
+
+
+def start_capture(channel_name: str, output_dir: str, segment_time: float = 10.0, start_number: int = 0):
+    """
+    Inicia o ffmpeg para capturar áudio do canal Twitch, segmentando em .wav de
+    segment_time segundos (corte fixo; o corte nas pausas só existe na captura PCM).
+    start_number: numeração do primeiro segmento (ao reiniciar uma captura que
+    caiu, continua de onde parou para o watcher seguir a sequência).
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
     log_path = os.path.join(output_dir, "ffmpeg_capture.log")
     logger.info(f"[recorder] Salvando logs do ffmpeg em: {log_path}")
 
     with open(log_path, "a") as log_file:
-        process = subprocess.Popen(
-            shlex.split(cmd_str),
-            stdout=log_file,
-            stderr=log_file
+        process = _spawn_capture(
+            channel_name,
+            f"-acodec pcm_s16le -ar 48000 -ac 2 "
+            f"-f segment -segment_time {segment_time:g} -segment_start_number {start_number} -reset_timestamps 1 "
+            f"{output_dir}/segment_%03d.wav",
+            log_file
         )
     logger.info(f"[recorder] FFmpeg iniciado com PID {process.pid}. Gravando em {output_dir}/segment_*.wav")
     return process
+
+
+class PCMCapture:
+    """
+    Captura em memória: o ffmpeg entrega PCM float32 16 kHz mono (o formato que o
+    Whisper consome) num pipe, e uma thread copia o áudio para um PCMRingBuffer
+    em memória compartilhada. Nada passa pelo disco no caminho quente.
+
+    Se archive_dir for informado, uma thread separada grava WAVs de
+    archive_seconds a partir do anel, fora do caminho quente.
+    """
+
+    def __init__(self, channel_name: str, output_dir: str, sample_rate: int = 16000,
+                 capacity_seconds: float = 120.0, archive_dir: str = None, archive_seconds: float = 10.0):
+        self.channel_name = channel_name
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.ring = PCMRingBuffer(int(capacity_seconds * sample_rate), sample_rate)
+        self.archive_dir = archive_dir
+        self.archive_seconds = archive_seconds
+
+        self._stopped = threading.Event()
+        self._pump_thread = None
+        self._archive_thread = None
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._spawn()
+        logger.info(f"[recorder] PCM {sample_rate} Hz mono no ring buffer {self.ring.name} ({capacity_seconds:.0f}s)")
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            self._archive_thread = threading.Thread(target=self._archive_loop, daemon=True)
+            self._archive_thread.start()
+
+    def _spawn(self):
+        log_path = os.path.join(self.output_dir, "ffmpeg_capture.log")
+        logger.info(f"[recorder] Salvando logs do ffmpeg em: {log_path}")
+        with open(log_path, "a") as log_file:
+            self.process = _spawn_capture(
+                self.channel_name,
+                f"-f f32le -ar {self.sample_rate} -ac 1 pipe:1",
+                log_file,
+                stdout=subprocess.PIPE
+            )
+        logger.info(f"[recorder] FFmpeg iniciado com PID {self.process.pid}")
+        self._pump_thread = threading.Thread(target=self._pump, args=(self.process,), daemon=True)
+        self._pump_thread.start()
+
+    def restart(self):
+        """
+        Sobe um novo streamlink/ffmpeg escrevendo no MESMO anel: as posições
+        continuam crescendo e o RingSegmentSource segue sem perceber (só há um
+        salto no áudio).
+        """
+        self._terminate()
+        # Uma thread escrevendo no anel por vez
+        self._pump_thread.join(timeout=5)
+        self._spawn()
+
+    def _pump(self, process):
+        """Copia o stdout do ffmpeg para o anel, sempre em múltiplos de 4 bytes (float32)."""
+        leftover = b""
+        stdout = process.stdout
+        while True:
+            chunk = stdout.read1(65536)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - len(chunk) % 4
+            leftover = chunk[usable:]
+            if usable:
+                try:
+                    self.ring.write(np.frombuffer(chunk[:usable], dtype=np.float32))
+                except RingClosed:
+                    break
+        logger.info(f"[recorder] Captura PCM de {self.channel_name} encerrada (código {process.wait()})")
+
+    def _archive_loop(self):
+        block = int(self.archive_seconds * self.sample_rate)
+        cursor = 0
+        index = 0
+        # Sobrevive a restart(): só termina em stop(), que espera esta thread antes de fechar o anel
+        while not self._stopped.is_set():
+            try:
+                if self.ring.write_pos - cursor < block:
+                    self._stopped.wait(self.archive_seconds / 4)
+                    continue
+                if not self.ring.valid(cursor):
+                    cursor = self.ring.oldest()
+                    logger.warning(f"[recorder] Arquivamento atrasado; pulando para a amostra {cursor}")
+                    continue
+                samples = self.ring.read(cursor, block)
+            except RingClosed:
+                return
+            path = os.path.join(self.archive_dir, f"segment_{index:05d}.wav")
+            with wave.open(path, "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(self.sample_rate)
+                w.writeframes((np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes())
+            cursor += block
+            index += 1
+
+    def poll(self):
+        return self.process.poll()
+
+    def _terminate(self):
+        stop_capture(self.process)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Encerra a captura e libera o anel. As threads que escrevem/leem nele
+        (pump e arquivamento) saem antes do close(); um leitor que ainda
+        chegue depois (pipeline atrasado) recebe RingClosed.
+        """
+        self._stopped.set()
+        self._terminate()
+        for thread in (self._pump_thread, self._archive_thread):
+            if thread is not None:
+                thread.join(timeout=timeout)
+        self.ring.close()
+        self.ring.unlink()
+
+
+def stop_capture(process, timeout: float = 5.0):
+    """Encerra o ffmpeg de uma captura e o streamlink que o alimenta."""
+    for proc in (getattr(process, "streamlink", None), process):
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+    for proc in (getattr(process, "streamlink", None), process):
+        if proc is None:
+            continue
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def start_capture_pcm(channel_name: str, output_dir: str, archive: bool = False) -> PCMCapture:
+    """
+    Inicia a captura em memória (PCM 16 kHz mono → ring buffer compartilhado).
+    Com archive=True também grava WAVs em output_dir/archive, fora do caminho quente.
+    """
+    archive_dir = os.path.join(output_dir, "archive") if archive else None
+    return PCMCapture(channel_name, output_dir, archive_dir=archive_dir)
@@ -0,0 +1,176 @@
+# livestream-w2-gaules/capture/ring_buffer.py
+
+"""
+Ring buffer de PCM float32 em memória compartilhada (multiprocessing.shared_memory).
+
+O recorder escreve o áudio 16 kHz mono que sai do ffmpeg; o worker (e os
+processos do pool de ASR) leem trechos do buffer com read(), que devolve uma
+cópia: nenhuma view sobrevive ao close() da captura (ler memória já
+desmapeada derruba o processo). Leitura, escrita e close() são serializados
+por um lock; depois do close(), leituras levantam RingClosed.
+
+Layout: [cabeçalho 64 bytes | dados 2 * capacity float32]. Cada amostra é
+gravada duas vezes (posição p e p + capacity), então qualquer janela de até
+`capacity` amostras é contígua e sai numa cópia só, mesmo quando cruza o fim
+do anel. As posições são absolutas (amostras desde o
+início da captura) e só crescem.
+"""
+
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_BYTES = 64
+
+# Buffers abertos neste processo (criados ou anexados): nome -> PCMRingBuffer
+_attached = {}
+
+
+class RingOverrun(Exception):
+    """O trecho pedido já foi sobrescrito (leitor atrasado mais que a capacidade)."""
+
+
+class RingClosed(Exception):
+    """A captura foi encerrada e o anel fechado."""
+
+
+class PCMRingBuffer:
+    def __init__(self, capacity: int, sample_rate: int = 16000, name: str = None, create: bool = True):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        size = HEADER_BYTES + 2 * capacity * 4
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            # Os leitores são processos filhos (pool de ASR) e compartilham o
+            # resource_tracker do criador; só o criador faz unlink()
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._lock = threading.Lock()
+        self._closed = False
+        self._header = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self._data = np.ndarray((2 * capacity,), dtype=np.float32, buffer=self.shm.buf, offset=HEADER_BYTES)
+        if create:
+            self._header[0] = 0
+        _attached[self.name] = self
+
+    @classmethod
+    def attach(cls, name: str, capacity: int, sample_rate: int = 16000):
+        return cls(capacity, sample_rate, name=name, create=False)
+
+    @property
+    def write_pos(self) -> int:
+        """Total de amostras já escritas desde o início."""
+        with self._lock:
+            self._check_open()
+            return int(self._header[0])
+
+    def oldest(self) -> int:
+        """Posição absoluta da amostra mais antiga ainda disponível."""
+        return max(0, self.write_pos - self.capacity)
+
+    def _check_open(self):
+        if self._closed:
+            raise RingClosed(f"ring buffer {self.name} fechado")
+
+    def write(self, samples: np.ndarray):
+        """Anexa amostras (só um escritor). Sobrescreve as mais antigas se o anel encher."""
+        with self._lock:
+            self._check_open()
+            self._write(samples)
+
+    def _write(self, samples: np.ndarray):
+        pos = int(self._header[0])
+        n = len(samples)
+        if n > self.capacity:
+            pos += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        cap = self.capacity
+        start = pos % cap
+        first = min(n, cap - start)
+        rest = n - first
+        self._data[start:start + first] = samples[:first]
+        self._data[start + cap:start + cap + first] = samples[:first]
+        if rest:
+            self._data[:rest] = samples[first:]
+            self._data[cap:cap + rest] = samples[first:]
+        # Publica a nova posição só depois dos dados
+        self._header[0] = pos + n
+
+    def read(self, start: int, n: int) -> np.ndarray:
+        """Cópia das amostras [start, start + n). Levanta RingOverrun se já foram sobrescritas."""
+        if n > self.capacity:
+            raise ValueError(f"Janela de {n} amostras maior que a capacidade ({self.capacity})")
+        with self._lock:
+            self._check_open()
+            write_pos = int(self._header[0])
+            if start + n > write_pos:
+                raise ValueError("Trecho ainda não escrito")
+            if start < write_pos - self.capacity:
+                raise RingOverrun(f"Amostra {start} já foi sobrescrita (mais antiga: {write_pos - self.capacity})")
+            idx = start % self.capacity
+            return self._data[idx:idx + n].copy()
+
+    def valid(self, start: int) -> bool:
+        return start >= self.oldest()
+
+    def slice(self, start: int, n: int) -> "RingSlice":
+        """Referência leve (picklable) a um trecho; o áudio só é copiado quando alguém o lê."""
+        return RingSlice(self.name, self.capacity, self.sample_rate, start, n)
+
+    def close(self):
+        """Desmapeia o anel (depois que nenhuma thread o lê); leituras seguintes levantam RingClosed."""
+        _attached.pop(self.name, None)
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._header = self._data = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class RingSlice:
+    """Trecho [start, start + n) de um PCMRingBuffer, identificado pelo nome do segmento de memória."""
+
+    def __init__(self, name: str, capacity: int, sample_rate: int, start: int, n: int):
+        self.name = name
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self.start = start
+        self.n = n
+
+    def array(self) -> np.ndarray:
+        """
+        Cópia do trecho. No processo da captura, lê do anel aberto; em outro
+        processo (pool de ASR), anexa o segmento de memória só durante a cópia,
+        sem deixá-lo mapeado depois que a captura termina.
+        """
+        ring = _attached.get(self.name)
+        if ring is not None:
+            return ring.read(self.start, self.n)
+        try:
+            ring = PCMRingBuffer.attach(self.name, self.capacity, self.sample_rate)
+        except FileNotFoundError:
+            raise RingClosed(f"ring buffer {self.name} não existe mais") from None
+        try:
+            return ring.read(self.start, self.n)
+        finally:
+            ring.close()
+
+    def __len__(self):
+        return self.n
+
+
+def _forget_inherited():
+    # Filho de fork (pool de ASR): os anéis do pai não são dele; soltá-los desmapeia a cópia herdada
+    _attached.clear()
+
+
+os.register_at_fork(after_in_child=_forget_inherited)
@@ -0,0 +1,113 @@
+# livestream-w2-gaules/capture/segmenter.py
+
+"""
+Segmentação adaptativa do PCM ao vivo, cortando nas pausas da fala.
+
+O corte fixo de 10 s do segment muxer impõe 10 s de latência antes de o
+Whisper começar e parte palavras ao meio. Aqui o áudio é analisado em quadros
+de 20 ms conforme chega e o segmento é fechado:
+
+- numa pausa de pelo menos `min_pause` depois de `min_seconds` de áudio (a
+  pausa exigida cai pela metade depois de `target_seconds`, favorecendo
+  segmentos perto do alvo);
+- à força em `max_seconds`, no quadro mais silencioso da parte final.
+
+Um segmento é emitido assim que a pausa que o encerra é detectada, sem
+esperar o próximo começar. Cada segmento carrega `overlap_seconds` do final
+do anterior como contexto para o ASR, para não perder palavras no corte.
+
+O segmentador só conta amostras (posições absolutas): quem o alimenta decide
+de onde vem o áudio (ring buffer, arquivo, ...).
+"""
+
+import numpy as np
+
+_EPS = 1e-10
+
+
+class SpeechSegmenter:
+    def __init__(self, sample_rate: int, min_seconds: float = 2.0, target_seconds: float = 5.0,
+                 max_seconds: float = 10.0, overlap_seconds: float = 0.3, min_pause: float = 0.3,
+                 frame_ms: float = 20.0, margin_db: float = 10.0, silence_db: float = -50.0, start: int = 0):
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.min_frames = int(min_seconds * 1000 / frame_ms)
+        self.target_frames = int(target_seconds * 1000 / frame_ms)
+        self.max_frames = max(self.min_frames + 1, int(max_seconds * 1000 / frame_ms))
+        self.pause_frames = max(1, int(min_pause * 1000 / frame_ms))
+        self.overlap = int(overlap_seconds * sample_rate)
+        self.margin_db = margin_db
+        self.silence_db = silence_db
+        self.reset(start)
+
+    def reset(self, start: int):
+        """Recomeça a segmentação na posição absoluta start (ex.: depois de um overrun)."""
+        self.segment_start = start  # primeira amostra do segmento em aberto
+        self._energies = []  # dB de cada quadro desde segment_start
+        self._pending = np.zeros(0, dtype=np.float32)  # resto que ainda não fecha um quadro
+        self._silent_run = 0
+        self._floor = None
+        self._context_start = start
+
+    def feed(self, samples: np.ndarray) -> list:
+        """
+        Consome as próximas amostras do fluxo e devolve os segmentos fechados,
+        como (início com contexto, início, fim) em posições absolutas.
+        """
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+        n = len(samples) // self.frame
+        self._pending = samples[n * self.frame:].copy()
+        if n == 0:
+            return []
+
+        frames = samples[:n * self.frame].reshape(n, self.frame).astype(np.float64)
+        energies = 10 * np.log10(np.mean(frames ** 2, axis=1) + _EPS)
+
+        cuts = []
+        for energy in energies:
+            cut = self._push(float(energy))
+            if cut is not None:
+                cuts.append(cut)
+        return cuts
+
+    def _push(self, energy: float):
+        # Piso de ruído: desce na hora, sobe devagar (fala não o arrasta para cima)
+        if self._floor is None or energy < self._floor:
+            self._floor = energy
+        else:
+            self._floor += 0.002 * (energy - self._floor)
+        silent = energy < max(self._floor + self.margin_db, self.silence_db)
+        self._silent_run = self._silent_run + 1 if silent else 0
+        self._energies.append(energy)
+
+        length = len(self._energies)
+        if length >= self.min_frames:
+            needed = self.pause_frames if length < self.target_frames else max(1, self.pause_frames // 2)
+            # Corta no meio da pausa: metade fica como cauda, metade abre o próximo.
+            # O meio pode cair antes de min_seconds (pausa longa): espera a pausa crescer
+            cut = length - self._silent_run // 2
+            if self._silent_run >= needed and cut >= self.min_frames:
+                return self._cut(cut)
+        if length >= self.max_frames:
+            # Sem pausa boa: corta no quadro mais baixo da metade final (nunca antes de min_seconds)
+            first = max(self.min_frames, length // 2)
+            tail = np.asarray(self._energies[first:])
+            return self._cut(first + int(np.argmin(tail)) + 1)
+        return None
+
+    def _cut(self, frames: int):
+        start = self.segment_start
+        end = start + frames * self.frame
+        context_start = self._context_start
+        self.segment_start = end
+        self._context_start = max(start, end - self.overlap)
+        self._energies = self._energies[frames:]
+        self._silent_run = min(self._silent_run, len(self._energies))
+        return context_start, start, end
+
+    def flush(self):
+        """Fecha o segmento em aberto (fim do fluxo). None se estiver vazio."""
+        if not self._energies:
+            return None
+        return self._cut(len(self._energies))
@@ -1,83 +1,373 @@
 #!/usr/bin/env python3
 """
-Servidor HTTP simples e dedicado para servir arquivos HLS
+Servidor HTTP dedicado para servir arquivos HLS (origin)
+
+- Uma thread por conexão (ThreadingHTTPServer) com keep-alive HTTP/1.1: os
+  players repetem o pedido da playlist a cada poucos segundos na mesma conexão.
+- Segmentos são enviados com sendfile (zero-copy: o kernel copia do page cache
+  direto para o socket), com suporte a Range e cabeçalhos de cache imutável
+  (um segmento publicado nunca muda de conteúdo).
+- Playlists ficam em cache na memória e são invalidadas quando o arquivo muda
+  (o packager as troca com os.replace, então inode/mtime/tamanho mudam). Um
+  os.stat por pedido, nenhuma leitura de disco enquanto não mudarem.
+- ETag / If-None-Match (304) em tudo.
+- O status só é enviado depois de saber se o arquivo existe (404 de verdade).
+- LL-HLS: blocking playlist reload (_HLS_msn / _HLS_part) — a resposta fica
+  retida até a playlist conter o segmento/parte pedido (ou 3x a target
+  duration), e pedidos de uma parte anunciada em EXT-X-PRELOAD-HINT que ainda
+  não existe esperam o arquivo aparecer em vez de levar 404. Delta updates
+  (_HLS_skip) não são suportados: a playlist vem sempre inteira.
 """
 
+import hashlib
 import os
+import re
+import socket
 import sys
+import threading
+import time
 import http.server
-import socketserver
-from urllib.parse import urlparse, unquote
+from urllib.parse import urlparse, unquote, parse_qs
+
+PORT = int(os.getenv("HLS_PORT", "8001"))
+DIRECTORY = os.path.realpath(os.getenv("HLS_DIR", os.path.join(os.getcwd(), "hls")))
+ACCESS_LOG = os.getenv("HLS_ACCESS_LOG") == "1"
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".aac": "audio/aac",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".vtt": "text/vtt",
+}
+PLAYLIST_EXTENSIONS = (".m3u8",)
+SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLAYLIST_CACHE_CONTROL = "no-cache"
+# Resposta a um blocking reload é única para aquela URL: CDNs podem guardá-la
+BLOCKING_CACHE_CONTROL = "public, max-age=6"
+
+BLOCK_POLL_INTERVAL = 0.025
+# Por quanto tempo um pedido de parte anunciada (preload hint) espera o arquivo
+PRELOAD_HOLD = float(os.getenv("HLS_PRELOAD_HOLD", "6"))
+PART_NAME = re.compile(r"^\d+\.\d+\.(aac|m4s|ts)$")
+
+
+class PlaylistPosition:
+    """Até onde uma playlist LL-HLS chega: próximo MSN e partes já publicadas dele."""
+
+    def __init__(self, body: bytes):
+        self.media_sequence = 0
+        self.segments = 0
+        self.trailing_parts = 0  # partes do segmento em andamento (depois do último URI)
+        self.target_duration = 6
+        for raw in body.decode("utf-8", "replace").splitlines():
+            line = raw.strip()
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                self.media_sequence = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-TARGETDURATION:"):
+                self.target_duration = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-PART:"):
+                self.trailing_parts += 1
+            elif line.startswith("#EXTINF:"):
+                self.segments += 1
+            elif line and not line.startswith("#"):
+                self.trailing_parts = 0
+
+    @property
+    def next_msn(self) -> int:
+        return self.media_sequence + self.segments
+
+    def contains(self, msn: int, part: int = None) -> bool:
+        if msn < self.next_msn:
+            return True
+        return part is not None and msn == self.next_msn and part < self.trailing_parts
+
+
+class PlaylistCache:
+    """Conteúdo das playlists em memória, chaveado pelo (inode, mtime, tamanho) do arquivo."""
+
+    def __init__(self):
+        self._entries = {}  # caminho -> (chave do stat, corpo, etag, PlaylistPosition)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, st: os.stat_result):
+        body, etag, _ = self.get_with_position(path, st)
+        return body, etag
+
+    def get_with_position(self, path: str, st: os.stat_result):
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1], entry[2], entry[3]
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        position = PlaylistPosition(body)
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = (key, body, etag, position)
+        return body, etag, position
+
+    def discard(self, path: str):
+        with self._lock:
+            self._entries.pop(path, None)
+
 
-PORT = 8001
-DIRECTORY = os.path.join(os.getcwd(), "hls")
+playlist_cache = PlaylistCache()
 
-class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+
+def _segment_etag(st: os.stat_result) -> str:
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _parse_range(header: str, size: int):
+    """
+    Interpreta um único intervalo "bytes=a-b" / "bytes=a-" / "bytes=-n".
+    Retorna (início, fim inclusivo), None para ignorar o cabeçalho (servir tudo)
+    ou "invalid" se não for satisfazível.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            length = int(end_text)
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+class CORSHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
     """Manipulador HTTP com suporte a CORS para servir arquivos HLS"""
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
-    
+
+    protocol_version = "HTTP/1.1"
+    server_version = "HLSOrigin/1.0"
+    timeout = 60  # conexões keep-alive ociosas são fechadas depois disso
+
     def do_GET(self):
-        """Adiciona cabeçalhos CORS e serve o arquivo solicitado"""
-        print(f"Requisição recebida: {self.path}")
-        
-        # Adiciona cabeçalhos CORS
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'X-Requested-With')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-        
-        # Define o tipo de conteúdo com base na extensão do arquivo
-        if self.path.endswith('.m3u8'):
-            self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
-        elif self.path.endswith('.ts'):
-            self.send_header('Content-Type', 'video/mp2t')
-        else:
-            self.send_header('Content-Type', 'application/octet-stream')
-        
-        # Finaliza os cabeçalhos e serve o arquivo
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_OPTIONS(self):
+        """Responde a requisições OPTIONS para suporte a CORS"""
+        self.send_response(204)
+        self._cors_headers()
+        self.send_header("Content-Length", "0")
         self.end_headers()
-        
-        # Caminho do arquivo solicitado
-        parsed_path = urlparse(self.path)
-        file_path = unquote(parsed_path.path.lstrip('/'))
-        
+
+    # ------------------------------------------------------------ internos
+
+    def _serve(self, send_body: bool):
+        url = urlparse(self.path)
+        path = self._resolve(url.path)
+        if path is None:
+            return self._error(404, "File not found")
+        ext = os.path.splitext(path)[1].lower()
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            playlist_cache.discard(path)
+            st = None
+            if PART_NAME.match(os.path.basename(path)):
+                st = self._wait_for_file(path, PRELOAD_HOLD)
+            if st is None:
+                return self._error(404, "File not found")
+        if not os.path.isfile(path):
+            return self._error(404, "File not found")
+
+        content_type = CONTENT_TYPES.get(ext, "application/octet-stream")
+        if ext in PLAYLIST_EXTENSIONS:
+            self._serve_playlist(path, st, content_type, send_body, parse_qs(url.query))
+        else:
+            self._serve_file(path, st, content_type, send_body)
+
+    def _serve_playlist(self, path: str, st: os.stat_result, content_type: str, send_body: bool, query: dict):
+        cache_control = PLAYLIST_CACHE_CONTROL
         try:
-            with open(os.path.join(DIRECTORY, file_path), 'rb') as file:
-                self.wfile.write(file.read())
-            print(f"Arquivo servido com sucesso: {file_path}")
+            if "_HLS_msn" in query:
+                try:
+                    msn = int(query["_HLS_msn"][0])
+                    part = int(query["_HLS_part"][0]) if "_HLS_part" in query else None
+                except ValueError:
+                    return self._error(400, "Invalid _HLS_msn/_HLS_part")
+                result = self._block_for(path, st, msn, part)
+                if isinstance(result, int):
+                    return self._error(result, "Blocking reload failed")
+                body, etag = result
+                cache_control = BLOCKING_CACHE_CONTROL
+            else:
+                body, etag = playlist_cache.get(path, st)
         except FileNotFoundError:
-            print(f"Arquivo não encontrado: {file_path}")
-            self.send_error(404, "File not found")
-        except Exception as e:
-            print(f"Erro ao servir arquivo: {e}")
-            self.send_error(500, str(e))
-    
-    def do_OPTIONS(self):
-        """Responde a requisições OPTIONS para suporte a CORS"""
+            # Trocada entre o stat e a leitura: o cliente tenta de novo no próximo poll
+            return self._error(404, "File not found")
+
+        if self._not_modified(etag):
+            return self._send_304(etag, cache_control)
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'X-Requested-With')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self._cors_headers()
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("ETag", etag)
         self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _block_for(self, path: str, st: os.stat_result, msn: int, part: int):
+        """
+        Segura o pedido até a playlist conter o MSN (e a parte) pedido.
+        Devolve (corpo, etag) ou um status de erro: 400 se o pedido está
+        adiantado demais (mais de dois segmentos à frente), 503 se estourar
+        3x a target duration.
+        """
+        body, etag, position = playlist_cache.get_with_position(path, st)
+        if msn > position.next_msn + 2:
+            return 400
+        deadline = time.monotonic() + 3 * position.target_duration
+        while not position.contains(msn, part):
+            if time.monotonic() >= deadline:
+                return 503
+            time.sleep(BLOCK_POLL_INTERVAL)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            body, etag, position = playlist_cache.get_with_position(path, st)
+        return body, etag
+
+    @staticmethod
+    def _wait_for_file(path: str, timeout: float):
+        """Espera uma parte anunciada no preload hint ser publicada; devolve o stat ou None."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(BLOCK_POLL_INTERVAL)
+            try:
+                return os.stat(path)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _serve_file(self, path: str, st: os.stat_result, content_type: str, send_body: bool):
+        etag = _segment_etag(st)
+        if self._not_modified(etag):
+            return self._send_304(etag, SEGMENT_CACHE_CONTROL)
+
+        size = st.st_size
+        byte_range = _parse_range(self.headers.get("Range"), size)
+        if byte_range == "invalid":
+            self.send_response(416)
+            self._cors_headers()
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return self._error(404, "File not found")
+        with f:
+            if byte_range is None:
+                start, length = 0, size
+                self.send_response(200)
+            else:
+                start, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {byte_range[0]}-{byte_range[1]}/{size}")
+            self._cors_headers()
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Cache-Control", SEGMENT_CACHE_CONTROL)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            if send_body and length:
+                # sendfile: sem cópia para o espaço do usuário (fallback para send em outros SOs)
+                self.connection.sendfile(f, start, length)
+
+    def _resolve(self, url_path: str):
+        """Caminho absoluto dentro de DIRECTORY, ou None se tentar sair dele."""
+        path = os.path.realpath(os.path.join(DIRECTORY, unquote(url_path).lstrip("/")))
+        if path != DIRECTORY and not path.startswith(DIRECTORY + os.sep):
+            return None
+        return path
+
+    def _not_modified(self, etag: str) -> bool:
+        header = self.headers.get("If-None-Match")
+        if not header:
+            return False
+        return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+    def _send_304(self, etag: str, cache_control: str):
+        self.send_response(304)
+        self._cors_headers()
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+
+    def _error(self, code: int, message: str):
+        body = message.encode()
+        self.send_response(code)
+        self._cors_headers()
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _cors_headers(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "X-Requested-With, Content-Type, Range, If-None-Match")
+        self.send_header("Access-Control-Expose-Headers", "Content-Length, Content-Range, ETag")
+
+    def log_message(self, format, *args):
+        # Centenas de players fazendo polling: log de acesso só se pedido
+        if ACCESS_LOG:
+            super().log_message(format, *args)
+
+    def log_error(self, format, *args):
+        super().log_message(format, *args)
+
+
+class HLSServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().server_bind()
+
 
 def run_server():
     """Inicia o servidor HTTP"""
     # Garante que o diretório HLS existe
     os.makedirs(DIRECTORY, exist_ok=True)
-    
+
     # Configura e inicia o servidor
-    handler = CORSHTTPRequestHandler
-    httpd = socketserver.TCPServer(("", PORT), handler)
-    
+    httpd = HLSServer(("", PORT), CORSHTTPRequestHandler)
+
     print(f"Servidor HLS iniciado na porta {PORT}")
     print(f"Servindo arquivos do diretório: {DIRECTORY}")
     print(f"URL de acesso: http://localhost:{PORT}")
-    
+    sys.stdout.flush()
+
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -0,0 +1,319 @@
+# livestream-w2-gaules/pipeline/asr_engines.py
+
+"""
+Motores de ASR que o ASRService (pipeline/asr_service.py) roda nos processos do pool.
+
+- "whisper": openai-whisper em fp32 na CPU (o comportamento original).
+- "whisper-int8": o mesmo modelo com as camadas Linear quantizadas
+  dinamicamente para int8 (torch.ao.quantization.quantize_dynamic). Os pesos
+  das Linear ficam ~4x menores e os matmuls usam kernels int8 (fbgemm): em CPU
+  sem GPU, o encoder/decoder costuma ficar bem mais rápido com perda pequena de
+  qualidade. O fp32 é mapeado no pai (compartilhado) e cada processo do pool
+  quantiza a sua cópia das Linear (int8, pequena) depois do fork.
+- "faster-whisper": CTranslate2 (pacote opcional faster-whisper), com
+  compute_type int8 por padrão; aceita modelos menores/destilados
+  ("tiny", "small", "distil-large-v3", ...).
+
+O motor e as opções de decodificação vêm da config do canal (asr_engine,
+asr_model, beam_size, temperature, without_timestamps) ou, se ausentes, das
+variáveis ASR_ENGINE, WHISPER_MODEL, ASR_BEAM_SIZE, ASR_TEMPERATURE e
+ASR_WITHOUT_TIMESTAMPS. Canais com a mesma combinação compartilham o mesmo
+ASRService (ver get_asr_service).
+
+Interface de um motor: preload() (no pai, antes do fork: só o que é seguro
+herdar), load(), set_threads(n), load_audio(path) → float32
+16 kHz, transcribe(audios, language) → textos, download() e key() (identifica
+o serviço compartilhado).
+"""
+
+import logging
+import os
+
+from pipeline.config import ChannelConfig, channel_config
+
+logger = logging.getLogger("asr_engines")
+
+# Limiares do whisper.transcribe para repetir a decodificação na próxima temperatura
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+DEFAULT_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def parse_temperatures(value) -> tuple:
+    """"0.0,0.2,0.4", 0.0 ou [0.0, 0.2] → (0.0, 0.2, 0.4)."""
+    if value is None or value == "":
+        return DEFAULT_TEMPERATURES
+    if isinstance(value, str):
+        return tuple(float(t) for t in value.split(","))
+    if isinstance(value, (int, float)):
+        return (float(value),)
+    return tuple(float(t) for t in value)
+
+
+class DecodeOptions:
+    def __init__(self, beam_size: int = None, temperatures=DEFAULT_TEMPERATURES, without_timestamps: bool = True):
+        self.beam_size = beam_size or None  # None/0: busca gulosa
+        self.temperatures = parse_temperatures(temperatures)
+        self.without_timestamps = without_timestamps
+
+    def key(self) -> tuple:
+        return (self.beam_size, self.temperatures, self.without_timestamps)
+
+    def __str__(self):
+        search = f"beam {self.beam_size}" if self.beam_size else "guloso"
+        return f"{search}, temperaturas {','.join(f'{t:g}' for t in self.temperatures)}"
+
+
+class WhisperEngine:
+    name = "whisper"
+
+    def __init__(self, model_name: str = "base", options: DecodeOptions = None):
+        self.model_name = model_name
+        self.options = options or DecodeOptions()
+        self.model = None
+
+    def key(self) -> tuple:
+        return (self.name, self.model_name) + self.options.key()
+
+    def __str__(self):
+        return f"{self.name}:{self.model_name}"
+
+    def __getstate__(self):
+        # Com spawn o motor vai ao filho sem o modelo: cada processo carrega o seu
+        return dict(self.__dict__, model=None)
+
+    def download(self) -> str:
+        return checkpoint_path(self.model_name)
+
+    def preload(self):
+        # Pesos mapeados no pai e herdados pelos filhos do fork (compartilhados)
+        if self.model is None:
+            self.model = load_whisper(self.model_name)
+
+    def load(self):
+        self.preload()
+        return self
+
+    def set_threads(self, threads: int):
+        import torch
+        torch.set_num_threads(threads)
+
+    def load_audio(self, path: str):
+        import whisper
+        return whisper.load_audio(path)
+
+    def transcribe(self, audios: list, language: str) -> list:
+        """Áudios float32 16 kHz mono → textos. Até 30 s: um único decode em lote."""
+        import torch
+        import whisper
+
+        options = self.options
+        texts = [None] * len(audios)
+        batch_idx = []
+        mels = []
+        for i, audio in enumerate(audios):
+            if len(audio) > whisper.audio.N_SAMPLES:
+                # Mais longo que a janela de 30 s do Whisper: transcrição sequencial
+                texts[i] = self.model.transcribe(
+                    audio, language=language, fp16=False, beam_size=options.beam_size,
+                    temperature=options.temperatures, without_timestamps=options.without_timestamps,
+                )["text"].strip()
+            else:
+                batch_idx.append(i)
+                mels.append(whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels))
+
+        # Fallback de temperatura como no whisper.transcribe, mas em lote: só os
+        # segmentos com decodificação ruim (repetitiva ou pouco provável) voltam
+        pending = list(range(len(mels)))
+        for temperature in options.temperatures:
+            if not pending:
+                break
+            decoding = whisper.DecodingOptions(
+                language=language, fp16=False, without_timestamps=options.without_timestamps,
+                temperature=temperature, beam_size=options.beam_size if temperature == 0 else None,
+            )
+            with torch.no_grad():
+                results = whisper.decode(self.model, torch.stack([mels[j] for j in pending]), decoding)
+            retry = []
+            for j, result in zip(pending, results):
+                texts[batch_idx[j]] = result.text.strip()
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                    texts[batch_idx[j]] = ""  # silêncio: aceita vazio em vez de tentar de novo
+                elif (result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                      or result.avg_logprob < LOGPROB_THRESHOLD):
+                    retry.append(j)
+            pending = retry
+        return texts
+
+
+class QuantizedWhisperEngine(WhisperEngine):
+    name = "whisper-int8"
+
+    def __init__(self, model_name: str = "base", options: DecodeOptions = None):
+        super().__init__(model_name, options)
+        self.quantized = False
+
+    def load(self):
+        # Quantizar empacota pesos com o fbgemm (threads do torch): só depois do fork
+        self.preload()
+        if not self.quantized:
+            quantize_int8(self.model)
+            self.quantized = True
+        return self
+
+
+class FasterWhisperEngine:
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str = "base", options: DecodeOptions = None, compute_type: str = None):
+        self.model_name = model_name
+        self.options = options or DecodeOptions()
+        self.compute_type = compute_type or os.getenv("ASR_COMPUTE_TYPE", "int8")
+        self.threads = 0
+        self.model = None
+
+    def key(self) -> tuple:
+        return (self.name, self.model_name, self.compute_type) + self.options.key()
+
+    def __str__(self):
+        return f"{self.name}:{self.model_name}:{self.compute_type}"
+
+    def __getstate__(self):
+        return dict(self.__dict__, model=None)
+
+    def _module(self):
+        try:
+            import faster_whisper
+        except ImportError:
+            raise RuntimeError("motor faster-whisper requer o pacote opcional: pip install faster-whisper")
+        return faster_whisper
+
+    def download(self) -> str:
+        return self._module().download_model(self.model_name)
+
+    def preload(self):
+        # CTranslate2 sobe pools de threads ao carregar: cada processo do pool carrega o seu
+        pass
+
+    def load(self):
+        if self.model is None:
+            self.model = self._module().WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                                                     cpu_threads=self.threads)
+        return self
+
+    def set_threads(self, threads: int):
+        self.threads = threads
+
+    def load_audio(self, path: str):
+        return self._module().decode_audio(path, sampling_rate=16000)
+
+    def transcribe(self, audios: list, language: str) -> list:
+        options = self.options
+        texts = []
+        for audio in audios:
+            segments, _ = self.model.transcribe(
+                audio, language=language, beam_size=options.beam_size or 1,
+                temperature=list(options.temperatures), without_timestamps=options.without_timestamps,
+                compression_ratio_threshold=COMPRESSION_RATIO_THRESHOLD, log_prob_threshold=LOGPROB_THRESHOLD,
+                no_speech_threshold=NO_SPEECH_THRESHOLD, condition_on_previous_text=False,
+            )
+            texts.append("".join(segment.text for segment in segments).strip())
+        return texts
+
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine, QuantizedWhisperEngine, FasterWhisperEngine)}
+
+
+def create_engine(config=None):
+    """Motor (ainda não carregado) da config do canal; o que faltar vem das variáveis de ambiente."""
+
+    def pick(key: str, env: str, default):
+        value = getattr(config, key, None) if config is not None else None
+        return value if value is not None else os.getenv(env, default)
+
+    name = pick("asr_engine", "ASR_ENGINE", "whisper")
+    if name not in ENGINES:
+        raise ValueError(f"motor de ASR desconhecido: {name} (opções: {', '.join(ENGINES)})")
+    without_timestamps = pick("without_timestamps", "ASR_WITHOUT_TIMESTAMPS", "1")
+    options = DecodeOptions(
+        beam_size=int(pick("beam_size", "ASR_BEAM_SIZE", "0")),
+        temperatures=pick("temperature", "ASR_TEMPERATURE", None),
+        without_timestamps=without_timestamps if isinstance(without_timestamps, bool) else without_timestamps != "0",
+    )
+    return ENGINES[name](pick("asr_model", "WHISPER_MODEL", "base"), options)
+
+
+def create_fast_engine(config=None):
+    """
+    Motor do degrau fast_asr: o do canal com degrade_asr_model no lugar do
+    modelo (sem config, a seção "default" do CHANNEL_CONFIG). None se o degrau
+    está desligado ou cai no mesmo motor.
+    """
+    config = config if config is not None else channel_config("default")
+    if not config.degrade_asr_model:
+        return None
+    fast = create_engine(ChannelConfig(config.channel, **dict(config.as_dict(), asr_model=config.degrade_asr_model)))
+    return fast if fast.key() != create_engine(config).key() else None
+
+
+# ------------------------------------------------------------ carga do Whisper
+
+
+def checkpoint_path(model_name: str) -> str:
+    """Caminho do .pt no cache do Whisper (WHISPER_CACHE_DIR), baixando se ainda não existe."""
+    import whisper
+    if os.path.isfile(model_name):
+        return model_name
+    if model_name not in whisper._MODELS:
+        raise ValueError(f"modelo Whisper desconhecido: {model_name}")
+    cache_home = os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    root = os.getenv("WHISPER_CACHE_DIR", os.path.join(cache_home, "whisper"))
+    return whisper._download(whisper._MODELS[model_name], root, False)
+
+
+def load_whisper(model_name: str):
+    """
+    Carrega o checkpoint com torch.load(mmap=True): os pesos viram páginas do
+    arquivo no page cache (carga quase instantânea com o cache quente, e
+    compartilhadas com os filhos do fork) em vez de uma cópia na heap.
+    """
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+
+    path = checkpoint_path(model_name)
+    try:
+        checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except (TypeError, RuntimeError) as e:
+        # torch < 2.1 ou checkpoint no formato antigo (não zip): carga normal
+        logger.warning(f"torch.load com mmap indisponível ({e}); carregando {model_name} na memória")
+        model = whisper.load_model(model_name, device="cpu")
+        model.eval()
+        return model
+
+    model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    # assign=True: os parâmetros passam a ser os tensores mapeados (sem cópia)
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    if model_name in whisper._ALIGNMENT_HEADS:
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+    model.eval()
+    return model
+
+
+def quantize_int8(model):
+    """
+    Quantização dinâmica int8 das camadas Linear (pesos int8, ativações
+    quantizadas em tempo de execução), no lugar: o resto do modelo continua
+    nos tensores mapeados.
+    """
+    import torch
+    from whisper.model import Linear
+
+    # whisper.model.Linear só converte o dtype dos pesos no forward (irrelevante
+    # em fp32); quantize_dynamic só reconhece o nn.Linear exato
+    for module in model.modules():
+        if type(module) is Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
@@ -0,0 +1,395 @@
+# livestream-w2-gaules/pipeline/asr_service.py
+
+"""
+Serviço de inferência Whisper compartilhado entre canais e idiomas.
+
+- O motor (pipeline/asr_engines.py: whisper, whisper-int8 ou faster-whisper)
+  e as opções de decodificação vêm da config do canal; há um serviço por
+  combinação (get_asr_service), e canais iguais o compartilham.
+- O modelo é carregado UMA vez no processo principal e os processos do pool são
+  criados via fork: os pesos ficam compartilhados (copy-on-write, só leitura)
+  em vez de uma cópia por worker.
+- O pool é dimensionado pelos núcleos disponíveis, e cada processo recebe uma
+  fatia dos threads do torch, sem disputa pelo GIL entre pipelines.
+- Os pipelines chamam submit(channel, audio) e recebem um Future.
+- Concorrência limitada (no máximo `workers` lotes em inferência) e
+  escalonamento round-robin por canal: um canal com fila grande não segura os outros.
+- Decodificação em lote: segmentos pendentes viram um único forward pass
+  (mels empilhados + whisper.decode em batch). O tamanho do lote acompanha a
+  fila: 1 quando estamos em dia (menor latência), até max_batch quando há
+  backlog (maior vazão). O fator de tempo real (RTF) de cada lote fica em stats().
+- Os pesos do Whisper são mapeados do cache (mmap, ver asr_engines.load_whisper).
+  warm_up() faz uma decodificação de silêncio em cada processo do pool antes
+  do primeiro segmento de verdade.
+- submit(..., engine=) usa um motor alternativo (o modelo menor do degrau
+  fast_asr) nos MESMOS processos, e o descarta quando nenhum canal o usa há
+  ALTERNATE_IDLE_SECONDS ou depois de release_engine(). Nenhum pool extra
+  disputa os núcleos. O do degrau da config é pré-carregado no pai junto com o
+  principal (get_asr_service): os processos o herdam no fork em vez de cada um
+  baixar/carregar o seu ao mesmo tempo no primeiro lote degradado.
+"""
+
+import logging
+import math
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pipeline import metrics
+from pipeline.asr_engines import create_engine, create_fast_engine
+
+logger = logging.getLogger("asr_service")
+
+ASR_BATCH_SECONDS = metrics.histogram("dub_asr_batch_seconds", "Tempo de computação de cada lote do Whisper")
+ASR_BATCH_SIZE = metrics.histogram("dub_asr_batch_size", "Segmentos por lote do Whisper", buckets=(1, 2, 4, 8, 16, 32))
+ASR_AUDIO_SECONDS = metrics.counter("dub_asr_audio_seconds_total", "Segundos de áudio transcritos")
+ASR_COMPUTE_SECONDS = metrics.counter("dub_asr_compute_seconds_total", "Segundos de computação gastos no ASR")
+ASR_ERRORS = metrics.counter("dub_asr_errors_total", "Lotes do Whisper que falharam")
+ASR_POOL_RESTARTS = metrics.counter("dub_asr_pool_restarts_total",
+                                    "Pools do ASR recriados depois que um processo morreu (OOM, crash)")
+
+SAMPLE_RATE = 16000
+WARMUP_CHANNEL = "__warmup__"
+# Sem submits com um motor alternativo por este tempo, os processos o descartam
+ALTERNATE_IDLE_SECONDS = 60.0
+
+# Motor do processo do pool (pipeline/asr_engines.py)
+_engine = None
+_threads = 1
+# Motores alternativos carregados neste processo: key() -> motor
+_alternates = {}
+# Alternativos pré-carregados pelo pai (com fork, já com os pesos): key() -> motor
+_preloaded = {}
+
+
+def _init_worker(engine, threads: int, preloaded: tuple = ()):
+    """Inicializador dos processos do pool."""
+    global _engine, _threads, _preloaded
+    _threads = threads
+    _preloaded = {alternate.key(): alternate for alternate in preloaded}
+    engine.set_threads(threads)
+    # Com fork, o motor chega já carregado pelo pai (load() não faz nada); com
+    # spawn ou motor que não suporta fork, cada processo carrega o seu
+    _engine = engine.load()
+
+
+def _transcribe_batch(audios: list, language: str, alternate=None, keep: tuple = ()):
+    """
+    Executa no processo do pool. Cada áudio: caminho do arquivo, float32 16 kHz
+    mono ou RingSlice (copiado da memória compartilhada da captura, sem disco).
+    alternate: motor alternativo (ainda não carregado) para este lote; keep:
+    chaves dos alternativos em uso, os demais são descartados deste processo.
+    Retorna (textos, segundos de áudio, segundos de computação).
+    """
+    for key in [key for key in _alternates if key not in keep]:
+        del _alternates[key]
+    engine = _engine if alternate is None else _load_alternate(alternate)
+    started = time.perf_counter()
+    loaded = [_load_input(a) for a in audios]
+    audio_seconds = sum(len(a) for a in loaded) / SAMPLE_RATE
+    texts = engine.transcribe(loaded, language)
+    return texts, audio_seconds, time.perf_counter() - started
+
+
+def _load_alternate(engine):
+    loaded = _alternates.get(engine.key())
+    if loaded is None:
+        engine = _preloaded.get(engine.key(), engine)
+        engine.set_threads(_threads)
+        loaded = _alternates[engine.key()] = engine.load()
+    return loaded
+
+
+def _load_input(audio):
+    if isinstance(audio, str):
+        return _engine.load_audio(audio)
+    if hasattr(audio, "array"):
+        return audio.array()
+    return audio
+
+
+class ASRService:
+    def __init__(self, engine=None, workers: int = None, max_pending_per_channel: int = 8,
+                 max_batch: int = 8, alternates: tuple = ()):
+        cores = os.cpu_count() or 1
+        self.engine = engine or create_engine()
+        self.model_name = str(self.engine)
+        self.labels = {"engine": self.model_name}
+        self.workers = workers or max(1, cores // 2)
+        self.max_pending_per_channel = max_pending_per_channel
+        self.max_batch = max_batch
+        self.threads = max(1, cores // self.workers)
+        self.alternates = tuple(alternates)
+
+        if "fork" in mp.get_all_start_methods():
+            self._ctx = mp.get_context("fork")
+            # Só carrega os pesos (nenhuma inferência no pai antes do fork, para
+            # não herdar pools de threads do OpenMP em estado inconsistente)
+            self.engine.preload()
+            for alternate in self.alternates:
+                alternate.preload()
+        else:
+            self._ctx = mp.get_context("spawn")
+
+        self._pool = self._new_pool()
+        self._pool_lock = threading.Lock()
+        self.pool_restarts = 0
+
+        self._cond = threading.Condition()
+        self._queues = {}          # canal -> deque[(future, audio, language, motor alternativo)]
+        self._round_robin = deque()  # ordem de atendimento dos canais
+        self._alternates = {}      # key() do motor alternativo -> último submit (monotonic)
+        self._in_flight = 0
+        self._stats = {
+            "batches": 0,
+            "segments": 0,
+            "audio_seconds": 0.0,
+            "compute_seconds": 0.0,
+            "last_batch_size": 0,
+            "last_rtf": None,
+        }
+
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+        logger.info(f"ASRService iniciado: {self.model_name} ({self.engine.options}), "
+                    f"{self.workers} processo(s) x {self.threads} thread(s)")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._ctx,
+            initializer=_init_worker,
+            initargs=(self.engine, self.threads, self.alternates),
+        )
+
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor):
+        """
+        Um processo do pool morreu (OOM, crash): o ProcessPoolExecutor fica
+        inutilizável para sempre. Troca por um novo (uma vez por pool quebrado).
+        """
+        with self._pool_lock:
+            if self._pool is not broken:
+                return
+            self._pool = self._new_pool()
+            self.pool_restarts += 1
+        ASR_POOL_RESTARTS.inc(**self.labels)
+        logger.error(f"ASRService {self.model_name}: processo do pool morreu; pool recriado")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, channel: str, audio, language: str = "pt", engine=None) -> Future:
+        """
+        Enfileira um segmento para transcrição. Bloqueia se o canal já tiver
+        max_pending_per_channel segmentos aguardando (backpressure por canal).
+        engine: motor alternativo (create_engine, não carregado) para este
+        segmento, rodado nos mesmos processos do pool.
+        """
+        future = Future()
+        with self._cond:
+            queue = self._queues.get(channel)
+            if queue is None:
+                queue = self._queues[channel] = deque()
+                self._round_robin.append(channel)
+            while len(queue) >= self.max_pending_per_channel:
+                self._cond.wait()
+            if engine is not None:
+                self._alternates[engine.key()] = time.monotonic()
+            queue.append((future, audio, language, engine))
+            self._cond.notify_all()
+        return future
+
+    def release_engine(self, engine):
+        """O canal voltou ao motor principal: os processos descartam o alternativo no próximo lote."""
+        with self._cond:
+            self._alternates.pop(engine.key(), None)
+
+    def warm_up(self, seconds: float = 1.0, timeout: float = 300.0):
+        """
+        Decodifica `workers` trechos de silêncio: sobe os processos do pool e
+        passa uma vez por todo o caminho (mel, encoder, decoder) antes do
+        primeiro segmento de verdade.
+        """
+        import numpy as np
+
+        silence = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+        futures = [self.submit(WARMUP_CHANNEL, silence) for _ in range(self.workers)]
+        for future in futures:
+            future.result(timeout=timeout)
+        with self._cond:
+            # O aquecimento não entra nas métricas de fila nem no RTF acumulado
+            if not self._queues.get(WARMUP_CHANNEL):
+                self._queues.pop(WARMUP_CHANNEL, None)
+                if WARMUP_CHANNEL in self._round_robin:
+                    self._round_robin.remove(WARMUP_CHANNEL)
+            self._stats.update(batches=0, segments=0, audio_seconds=0.0, compute_seconds=0.0)
+
+    def pending(self) -> dict:
+        with self._cond:
+            return {channel: len(queue) for channel, queue in self._queues.items()}
+
+    def stats(self) -> dict:
+        """
+        Contadores do serviço. RTF = segundos de computação / segundos de áudio:
+        abaixo de 1 o backlog diminui, e 1 / RTF é quantas vezes mais rápido que
+        o tempo real ele está sendo drenado.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(queue) for queue in self._queues.values())
+        if stats["audio_seconds"]:
+            stats["rtf"] = stats["compute_seconds"] / stats["audio_seconds"]
+        else:
+            stats["rtf"] = None
+        return stats
+
+    def _next_batch(self):
+        """
+        Monta o próximo lote em round-robin entre os canais (mesmo idioma e motor).
+        O tamanho do lote acompanha o backlog: a fila é dividida entre os
+        processos livres, até max_batch por lote. Chamar com _cond.
+        """
+        pending = sum(len(queue) for queue in self._queues.values())
+        free = max(1, self.workers - self._in_flight)
+        size = min(self.max_batch, max(1, math.ceil(pending / free)))
+
+        batch = []
+        kind = None
+        progress = True
+        while len(batch) < size and progress:
+            progress = False
+            for _ in range(len(self._round_robin)):
+                channel = self._round_robin[0]
+                self._round_robin.rotate(-1)
+                queue = self._queues[channel]
+                if queue and (kind is None or _batch_kind(queue[0]) == kind):
+                    job = queue.popleft()
+                    kind = _batch_kind(job)
+                    batch.append(job)
+                    progress = True
+                    if len(batch) >= size:
+                        break
+        return batch
+
+    def _alternates_in_use(self) -> tuple:
+        """Chaves dos motores alternativos com submit recente. Chamar com _cond."""
+        now = time.monotonic()
+        for key, used in list(self._alternates.items()):
+            if now - used > ALTERNATE_IDLE_SECONDS:
+                del self._alternates[key]
+        return tuple(self._alternates)
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._in_flight < self.workers:
+                        batch = self._next_batch()
+                        if batch:
+                            break
+                    self._cond.wait()
+                self._in_flight += 1
+                keep = self._alternates_in_use()
+                self._cond.notify_all()
+
+            batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+            if not batch:
+                self._release()
+                continue
+            futures = [job[0] for job in batch]
+            pool = self._pool
+            try:
+                inner = pool.submit(_transcribe_batch, [job[1] for job in batch], batch[0][2], batch[0][3], keep)
+            except Exception as e:
+                # Pool quebrado (BrokenProcessPool) ou encerrado: o lote falha e o
+                # despachante segue vivo com um pool novo
+                self._fail(futures, e)
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_broken_pool(pool)
+                continue
+            inner.add_done_callback(lambda f, outer=futures, pool=pool: self._on_done(f, outer, pool))
+
+    def _fail(self, futures: list, error: Exception):
+        self._release()
+        ASR_ERRORS.inc(**self.labels)
+        for future in futures:
+            future.set_exception(error)
+
+    def _on_done(self, inner: Future, outer: list, pool: ProcessPoolExecutor):
+        error = inner.exception()
+        if error is not None:
+            self._fail(outer, error)
+            if isinstance(error, BrokenProcessPool):
+                self._replace_broken_pool(pool)
+            return
+        self._release()
+
+        texts, audio_seconds, compute_seconds = inner.result()
+        with self._cond:
+            self._stats["batches"] += 1
+            self._stats["segments"] += len(texts)
+            self._stats["audio_seconds"] += audio_seconds
+            self._stats["compute_seconds"] += compute_seconds
+            self._stats["last_batch_size"] = len(texts)
+            self._stats["last_rtf"] = compute_seconds / audio_seconds if audio_seconds else None
+        ASR_BATCH_SECONDS.observe(compute_seconds, **self.labels)
+        ASR_BATCH_SIZE.observe(len(texts), **self.labels)
+        ASR_AUDIO_SECONDS.inc(audio_seconds, **self.labels)
+        ASR_COMPUTE_SECONDS.inc(compute_seconds, **self.labels)
+        for future, text in zip(outer, texts):
+            future.set_result(text)
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+def _batch_kind(job) -> tuple:
+    """Segmentos só dividem um lote com o mesmo idioma e o mesmo motor."""
+    engine = job[3]
+    return job[2], engine.key() if engine is not None else None
+
+
+def _collect() -> list:
+    # Sem o lock: ele fica com quem está criando um serviço (carga do modelo)
+    services = list(_services.values())
+    pending, in_flight, rtf, last_rtf = [], [], [], []
+    for service in services:
+        stats = service.stats()
+        pending.extend((dict(service.labels, channel=channel), n) for channel, n in service.pending().items())
+        in_flight.append((service.labels, service._in_flight))
+        rtf.append((service.labels, stats["rtf"]))
+        last_rtf.append((service.labels, stats["last_rtf"]))
+    return [
+        ("dub_asr_pending", "gauge", "Segmentos aguardando o ASR por canal", pending),
+        ("dub_asr_in_flight", "gauge", "Lotes em execução nos processos do pool", in_flight),
+        ("dub_asr_rtf", "gauge", "Fator de tempo real acumulado do ASR (computação / áudio)", rtf),
+        ("dub_asr_last_rtf", "gauge", "Fator de tempo real do último lote", last_rtf),
+    ]
+
+
+# Um serviço por motor/opções (asr_engines.WhisperEngine.key): canais com a mesma config compartilham
+_services = {}
+_service_lock = threading.Lock()
+
+
+def get_asr_service(config=None) -> ASRService:
+    """
+    Serviço do motor configurado para o canal (config: ChannelConfig; sem
+    config, o padrão das variáveis de ambiente). Criado na primeira chamada.
+    """
+    engine = create_engine(config)
+    with _service_lock:
+        service = _services.get(engine.key())
+        if service is None:
+            if not _services:
+                metrics.add_collector(_collect)
+            workers = int(os.getenv("ASR_WORKERS", "0")) or None
+            max_batch = int(os.getenv("ASR_MAX_BATCH", "8"))
+            # Canais que compartilham o serviço com outro degrade_asr_model carregam o seu no primeiro lote
+            fast = create_fast_engine(config)
+            service = _services[engine.key()] = ASRService(engine, workers=workers, max_batch=max_batch,
+                                                           alternates=(fast,) if fast is not None else ())
+        return service
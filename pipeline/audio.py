@@ -0,0 +1,69 @@
+# livestream-w2-gaules/pipeline/audio.py
+
+"""
+Utilitários de áudio em memória (NumPy), para não precisar chamar o ffmpeg
+só para ler/converter um WAV a cada segmento.
+"""
+
+import io
+import subprocess
+import wave
+
+import numpy as np
+
+
+def read_wav(path: str):
+    """Lê um WAV PCM e devolve (amostras float32 mono em [-1, 1], sample_rate)."""
+    with open(path, "rb") as f:
+        return decode_audio_bytes(f.read())
+
+
+def decode_audio_bytes(data: bytes):
+    """
+    Decodifica bytes de áudio para (float32 mono, sample_rate).
+    WAV PCM é lido direto com o módulo wave; qualquer outro formato cai no ffmpeg.
+    """
+    try:
+        with wave.open(io.BytesIO(data), "rb") as w:
+            sr = w.getframerate()
+            channels = w.getnchannels()
+            width = w.getsampwidth()
+            raw = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        return _decode_with_ffmpeg(data)
+
+    if width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        return _decode_with_ffmpeg(data)
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sr
+
+
+def _decode_with_ffmpeg(data: bytes, sample_rate: int = 48000):
+    out = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=data, capture_output=True, check=True
+    )
+    return np.frombuffer(out.stdout, dtype=np.float32), sample_rate
+
+
+def resample(samples: np.ndarray, sr_in: int, sr_out: int) -> np.ndarray:
+    """Reamostragem linear vetorizada (suficiente para voz)."""
+    if sr_in == sr_out or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+    n_out = int(round(len(samples) * sr_out / sr_in))
+    x_out = np.arange(n_out, dtype=np.float64) * (sr_in / sr_out)
+    return np.interp(x_out, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def to_pcm16(samples: np.ndarray) -> bytes:
+    """float32 [-1, 1] → bytes s16le."""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
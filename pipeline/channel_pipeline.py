@@ -0,0 +1,263 @@
+# livestream-w2-gaules/pipeline/channel_pipeline.py
+
+"""
+Pipeline por canal: cada segmento capturado é transcrito UMA vez e a
+transcrição é distribuída para os ramos de idioma (tradução/TTS/HLS).
+
+Idiomas podem ser anexados e removidos com o canal rodando, sem reiniciar a
+captura nem o ASR.
+"""
+
+import os
+import queue
+import threading
+import time
+from queue import Queue
+
+from pipeline import metrics
+from pipeline.asr_engines import create_fast_engine
+from pipeline.asr_service import get_asr_service
+from pipeline.config import channel_config
+from pipeline.job_queue import remote_asr_service
+from pipeline.latency_controller import LatencyController
+from pipeline.segment_source import DirectorySegmentSource
+from pipeline.storage import get_storage_manager
+from pipeline.vad import VADGate
+from pipeline.worker import LanguageBranch
+
+VAD_SEGMENTS = metrics.counter("dub_vad_segments_total", "Segmentos avaliados pelo portão VAD, por decisão")
+ASR_WAIT_SECONDS = metrics.histogram(
+    "dub_asr_latency_seconds", "Do envio ao ASR até a transcrição (fila + lote), por canal"
+)
+
+
+class ChannelPipeline:
+    def __init__(self, audio_dir: str, log_queue: Queue, source=None):
+        self.audio_dir = audio_dir
+        self.channel = os.path.basename(os.path.abspath(audio_dir))
+        self.log_queue = log_queue
+        # Retenção e motor de ASR, lidos no início do canal
+        self.config = channel_config(self.channel)
+        # WAVs em audio_dir por padrão; RingSegmentSource na captura em memória
+        self.source = source or DirectorySegmentSource(audio_dir)
+        # Portão de voz antes do ASR (None se VAD_ENABLED=0)
+        self.vad = VADGate.from_env()
+        self.branches = {}
+        self._lock = threading.Lock()
+        # (segmento, future do ASR, idiomas) na ordem de chegada, aguardando o fan-out
+        self._transcripts = None
+        self._fan_out_thread = None
+        self._stopped = threading.Event()
+        # Último segmento descartado por não haver idioma anexado
+        self._skipped_seq = None
+        # Orçamento de latência: degrada em degraus quando o canal fica para trás
+        self.controller = LatencyController(self.channel, self.config.latency_budget,
+                                            segment_seconds=self.config.target_segment, log_queue=log_queue)
+        # Modelo menor do degrau fast_asr, rodado nos processos do serviço normal
+        self._fast_engine = None
+        self._fast_active = False
+        self._dropped = 0
+
+    def attach(self, lang: str) -> bool:
+        """Adiciona um idioma. Retorna False se ele já estava ativo."""
+        with self._lock:
+            if lang in self.branches:
+                return False
+            self.branches[lang] = LanguageBranch(self.channel, lang, self.log_queue, controller=self.controller)
+        self.log_queue.put(f"[pipeline:{self.channel}] Idioma {lang} anexado")
+        return True
+
+    def detach(self, lang: str) -> bool:
+        """Remove um idioma. Retorna False se ele não estava ativo."""
+        with self._lock:
+            branch = self.branches.pop(lang, None)
+        if branch is None:
+            return False
+        branch.close()
+        self.log_queue.put(f"[pipeline:{self.channel}] Idioma {lang} removido")
+        return True
+
+    def languages(self) -> list:
+        with self._lock:
+            return sorted(self.branches)
+
+    def retained_seq(self):
+        """
+        Maior seq de segmento que todos os idiomas já publicaram (os intermediários
+        até ele podem ser apagados), ou None se ainda não há nenhum.
+        """
+        with self._lock:
+            branches = list(self.branches.values())
+        if not branches:
+            return self._skipped_seq
+        published = [branch.packaged_seq for branch in branches]
+        return None if None in published else min(published)
+
+    def stop(self):
+        """Encerra o canal: run() e o fan-out saem no próximo ciclo e todos os idiomas são removidos."""
+        self._stopped.set()
+        get_storage_manager().untrack(self.channel)
+        self.controller.close()
+        for lang in self.languages():
+            self.detach(lang)
+
+    def run(self):
+        """
+        Loop contínuo que:
+          1. Recebe novos segmentos da fonte (WAVs em audio_dir ou ring buffer)
+             e descarta do ASR os que não têm voz (portão VAD)
+          2. Transcreve cada um uma única vez no serviço Whisper compartilhado
+             (em lote quando há backlog acumulado)
+          3. Entrega a transcrição a cada idioma anexado (thread de fan-out);
+             cada idioma traduz, sintetiza e empacota em estágios concorrentes
+        """
+        # Com JOB_QUEUE, a transcrição vira jobs para os workers (pipeline/job_worker.py,
+        # com o motor da config deles); senão, o serviço do motor configurado para o canal
+        remote = remote_asr_service()
+        asr = remote or get_asr_service(self.config)
+        if remote is None:
+            self._fast_engine = create_fast_engine(self.config)
+        self.log_queue.put(
+            f"[pipeline:{self.channel}] Usando serviço Whisper compartilhado "
+            f"({asr.model_name}, {asr.workers} processo(s))."
+        )
+        if self._fan_out_thread is None:
+            self._transcripts = queue.Queue(maxsize=asr.max_pending_per_channel)
+            self._fan_out_thread = threading.Thread(target=self._fan_out_loop, args=(asr,), daemon=True)
+            self._fan_out_thread.start()
+        # Varredura periódica dos intermediários já publicados (pipeline/storage.py)
+        get_storage_manager().track(self)
+
+        while not self._stopped.is_set():
+            for segment in self.source.poll(timeout=1.0):
+                with self._lock:
+                    branches = list(self.branches.values())
+                if not branches:
+                    # Nenhum idioma anexado: não gasta ASR com este segmento
+                    self._skipped_seq = segment.seq
+                    continue
+
+                self.log_queue.put(f"[pipeline:{self.channel}] Encontrado novo segmento: {segment}")
+                if not self._admit(segment, branches):
+                    continue
+                if self.vad is not None:
+                    samples, sr = segment.load()
+                    result = self.vad.analyze(samples, sr)
+                    VAD_SEGMENTS.inc(channel=self.channel, decision="speech" if result.is_speech else "skip")
+                    if not result.is_speech:
+                        stats = self.vad.stats(asr.stats()["rtf"])
+                        saved = stats["saved_asr_seconds"]
+                        self.log_queue.put(
+                            f"[pipeline:{self.channel}] VAD: {segment} {result}; pulando ASR/tradução/TTS "
+                            f"({stats['skipped']}/{stats['segments']} segmentos sem voz"
+                            + (f", ~{saved:.0f}s de inferência economizados)" if saved is not None else ")")
+                        )
+                        # Segue pela mesma fila para manter a ordem no empacotamento
+                        self._enqueue((segment, None, branches, None))
+                        continue
+
+                submitted_at = time.perf_counter()
+                if self._use_fast_engine(asr):
+                    self.controller.count("fast_asr")
+                    future = asr.submit(self.channel, segment.asr_input(), language="pt", engine=self._fast_engine)
+                else:
+                    future = asr.submit(self.channel, segment.asr_input(), language="pt")  # força Português
+                # Bloqueia se o fan-out estiver atrasado (backpressure até a fonte)
+                self._enqueue((segment, future, branches, submitted_at))
+            # Reavalia mesmo sem segmentos novos (pipeline parado também é atraso)
+            self.controller.evaluate()
+
+        if self._fast_active:
+            asr.release_engine(self._fast_engine)
+        # A fonte só é fechada aqui, fora de um poll() em andamento
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            close()
+
+    def _admit(self, segment, branches: list) -> bool:
+        """
+        Controle de latência na entrada: descarta segmentos velhos demais (degrau
+        drop) ou os manda direto ao empacotamento sem ASR/TTS (skip_tts).
+        Retorna False se o segmento já foi tratado.
+        """
+        age = time.time() - segment.captured_at
+        self.controller.observe_intake(age)
+        if self.controller.should_drop(age):
+            self.controller.count("drop")
+            self._dropped += 1
+            return False
+        if self._dropped:
+            self.log_queue.put(f"[pipeline:{self.channel}] {self._dropped} segmento(s) atrasado(s) descartado(s); "
+                               f"retomando em {segment} com descontinuidade")
+            segment.discontinuity = True
+            self._dropped = 0
+        if self.controller.skip_tts():
+            self.controller.count("skip_tts")
+            segment.passthrough = True
+            self._enqueue((segment, None, branches, None))
+            return False
+        return True
+
+    def _use_fast_engine(self, asr) -> bool:
+        """
+        Degrau fast_asr: o modelo menor roda nos mesmos processos do serviço (sem
+        pool extra); ao voltar ao normal, o serviço é avisado para descartá-lo.
+        """
+        if self._fast_engine is None:
+            return False
+        active = self.controller.use_fast_asr()
+        if self._fast_active and not active:
+            asr.release_engine(self._fast_engine)
+        self._fast_active = active
+        return active
+
+    def _enqueue(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._transcripts.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def queue_depths(self) -> dict:
+        """Itens aguardando em cada fila: {"asr": n, "<lang>": {"translate": n, "tts": n, "package": n}}."""
+        depths = {"asr": self._transcripts.qsize() if self._transcripts is not None else 0}
+        with self._lock:
+            branches = list(self.branches.values())
+        for branch in branches:
+            depths[branch.lang] = branch.queue_depths()
+        return depths
+
+    def _fan_out_loop(self, asr):
+        """
+        Espera as transcrições na ordem dos segmentos e entrega cada uma aos
+        idiomas. Os segmentos já enviados ao ASR e ainda não distribuídos ficam
+        em _transcripts: com backlog, vários ficam pendentes ao mesmo tempo e o
+        serviço pode decodificá-los em lote; em dia, há um só e o lote é 1.
+        """
+        while not self._stopped.is_set():
+            try:
+                segment, future, branches, submitted_at = self._transcripts.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if future is None:
+                # Sem voz (VAD): os ramos publicam o áudio original ou silêncio
+                for branch in branches:
+                    branch.submit(segment, None)
+                continue
+            try:
+                text = future.result()
+            except Exception as e:
+                self.log_queue.put(f"[pipeline:{self.channel}] ERRO ao transcrever {segment}: {e}")
+                continue
+
+            ASR_WAIT_SECONDS.observe(time.perf_counter() - submitted_at, channel=self.channel)
+            stats = asr.stats()
+            rtf = f"{stats['last_rtf']:.2f}" if stats["last_rtf"] is not None else "?"
+            self.log_queue.put(
+                f"[pipeline:{self.channel}] Transcrição (lote de {stats['last_batch_size']}, "
+                f"RTF {rtf}, filas {self.queue_depths()}): {text}"
+            )
+
+            for branch in branches:
+                branch.submit(segment, text)
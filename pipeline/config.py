@@ -0,0 +1,105 @@
+# livestream-w2-gaules/pipeline/config.py
+
+"""
+Configuração por canal.
+
+Lida de um JSON (CHANNEL_CONFIG, padrão channels.json) com uma seção
+"default" e uma por canal; o que não estiver no arquivo usa os padrões abaixo:
+
+    {
+      "default": {"target_segment": 5.0},
+      "gaules":  {"min_segment": 1.5, "target_segment": 4.0, "max_segment": 8.0}
+    }
+
+Segmentos curtos reduzem a latência glass-to-glass; segmentos longos dão mais
+contexto ao Whisper e lotes mais eficientes.
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger("config")
+
+DEFAULTS = {
+    "segmenter": "adaptive",  # "adaptive" (corta nas pausas) ou "fixed"
+    "min_segment": 2.0,
+    "target_segment": 5.0,
+    "max_segment": 10.0,
+    "segment_overlap": 0.3,
+    "min_pause": 0.3,
+    "ll_hls": False,  # saída Low-Latency HLS (partes + blocking reload)
+    "part_target": 1.0,
+    "dvr_window": 0.0,  # segundos além da janela ao vivo que a playlist HLS oferece para voltar
+    "keep_intermediates": 2,  # WAVs já publicados mantidos em audio_segments (depuração); 0 = nenhum
+    "archive_retention": 3600.0,  # segundos de arquivo WAV da captura PCM (ARCHIVE_WAV=1)
+    # ASR (pipeline/asr_engines.py); None = padrão das variáveis de ambiente
+    "asr_engine": None,  # "whisper", "whisper-int8" ou "faster-whisper"
+    "asr_model": None,  # ex.: "base", "small", "distil-large-v3" (faster-whisper)
+    "beam_size": None,  # 0 = guloso
+    "temperature": None,  # fallback, ex.: [0.0, 0.2, 0.4]
+    "without_timestamps": None,
+    # Orçamento de latência (pipeline/latency_controller.py); 0 desliga
+    "latency_budget": 30.0,  # segundos de atraso em relação ao ao vivo
+    "degrade_asr_model": "tiny",  # modelo do degrau fast_asr
+    # Casamento de duração do áudio dublado (pipeline/timing.py)
+    "duration_match": True,
+    "max_speedup": 1.25,  # aceleração máxima da fala do TTS
+    "max_slowdown": 0.9,  # desaceleração máxima (o resto vira silêncio)
+    "max_drift": 0.5,  # segundos que a faixa dublada pode ficar à frente da origem
+}
+
+
+class ChannelConfig:
+    def __init__(self, channel: str, **values):
+        self.channel = channel
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            logger.warning(f"[config] Chaves desconhecidas para {channel}: {sorted(unknown)}")
+        merged = dict(DEFAULTS, **{k: v for k, v in values.items() if k in DEFAULTS})
+        self.segmenter = merged["segmenter"]
+        self.min_segment = float(merged["min_segment"])
+        self.target_segment = float(merged["target_segment"])
+        self.max_segment = float(merged["max_segment"])
+        self.segment_overlap = float(merged["segment_overlap"])
+        self.min_pause = float(merged["min_pause"])
+        self.ll_hls = bool(merged["ll_hls"])
+        self.part_target = float(merged["part_target"])
+        self.dvr_window = float(merged["dvr_window"])
+        self.keep_intermediates = int(merged["keep_intermediates"])
+        self.archive_retention = float(merged["archive_retention"])
+        self.asr_engine = merged["asr_engine"]
+        self.asr_model = merged["asr_model"]
+        self.beam_size = merged["beam_size"]
+        self.temperature = merged["temperature"]
+        self.without_timestamps = merged["without_timestamps"]
+        self.latency_budget = float(merged["latency_budget"])
+        self.degrade_asr_model = merged["degrade_asr_model"]
+        self.duration_match = bool(merged["duration_match"])
+        self.max_speedup = float(merged["max_speedup"])
+        self.max_slowdown = float(merged["max_slowdown"])
+        self.max_drift = float(merged["max_drift"])
+        if not self.min_segment <= self.target_segment <= self.max_segment:
+            raise ValueError(
+                f"config de {channel}: esperado min_segment <= target_segment <= max_segment "
+                f"({self.min_segment}, {self.target_segment}, {self.max_segment})"
+            )
+
+    def as_dict(self) -> dict:
+        return {key: getattr(self, key) for key in DEFAULTS}
+
+
+def _load_file() -> dict:
+    path = os.getenv("CHANNEL_CONFIG", "channels.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def channel_config(channel: str) -> ChannelConfig:
+    """Configuração efetiva do canal (relida a cada chamada: vale no próximo /start)."""
+    data = _load_file()
+    values = dict(data.get("default", {}))
+    values.update(data.get(channel, {}))
+    return ChannelConfig(channel, **values)
@@ -0,0 +1,278 @@
+# livestream-w2-gaules/pipeline/hls_packager.py
+
+"""
+Empacotador HLS ao vivo incremental.
+
+Um encoder contínuo (pipeline/stream_encoder.py) entrega o áudio dublado já
+em AAC; cada segmento vira um .aac "packed audio" (tag ID3 com o timestamp +
+frames ADTS) anexado a uma playlist ao vivo com janela deslizante. Nada é
+reencodado por segmento: o custo de publicar fica constante, não importa há
+quanto tempo a live está rodando.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from pipeline import metrics
+
+HLS_WRITE_SECONDS = metrics.histogram(
+    "dub_hls_write_seconds", "Tempo para gravar um segmento e reescrever a playlist",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+HLS_SEGMENTS = metrics.counter("dub_hls_segments_total", "Segmentos publicados nas playlists HLS")
+HLS_DELETED = metrics.counter("dub_hls_deleted_files_total", "Segmentos e partes HLS apagados ao sair da playlist")
+
+# 00012.aac, 00012.3.aac (parte LL-HLS); 00012.ts de playlists antigas, só para limpeza
+MEDIA_FILE_RE = re.compile(r"^\d{5,}(\.\d+)?\.(aac|ts)$")
+
+
+class LiveHLSPackager:
+    """
+    Mantém uma playlist HLS ao vivo (index.m3u8) em hls_dir.
+
+    - Cada chamada a publish_packed_audio() publica um novo segmento .aac vindo
+      do encoder contínuo (ver pipeline/stream_encoder.py).
+    - A playlist guarda só os últimos list_size segmentos e avança
+      EXT-X-MEDIA-SEQUENCE / EXT-X-DISCONTINUITY-SEQUENCE conforme a janela anda.
+    - A tag ID3 de cada segmento carrega a linha do tempo acumulada, então
+      segmentos consecutivos são contínuos; descontinuidades só são marcadas
+      quando o chamador pede (mark_discontinuity) ou quando retomamos uma playlist
+      deixada por uma execução anterior.
+    - Com part_target (LL-HLS), o encoder publica também partes de ~part_target
+      segundos (publish_part) assim que ficam prontas; a playlist lista as partes
+      dos últimos PART_SEGMENTS segmentos e do segmento em andamento, anuncia a
+      próxima em EXT-X-PRELOAD-HINT e declara CAN-BLOCK-RELOAD (o hls_server.py
+      segura _HLS_msn/_HLS_part até a parte pedida existir).
+    - Com dvr_window, a playlist guarda também os últimos dvr_window segundos
+      (o player pode voltar). Segmentos e partes que saem da playlist são
+      apagados do disco depois da duração da playlist (RFC 8216, 6.2.2: quem
+      baixou a playlist anterior ainda consegue buscá-los); arquivos órfãos de
+      uma execução anterior também. O disco usado fica limitado à janela.
+    """
+
+    PART_SEGMENTS = 3
+
+    def __init__(self, hls_dir: str, list_size: int = 6, target_duration: int = 10,
+                 playlist_name: str = "index.m3u8", bitrate: str = "128k", labels: dict = None,
+                 part_target: float = None, dvr_window: float = 0.0):
+        self.hls_dir = hls_dir
+        self.part_target = part_target
+        self.labels = labels or {}
+        self.list_size = list_size + math.ceil(dvr_window / target_duration)
+        self.target_duration = target_duration
+        self.bitrate = bitrate
+        self.playlist_path = os.path.join(hls_dir, playlist_name)
+
+        # Cada entrada: (nome do arquivo, duração em segundos, tem descontinuidade antes?)
+        self.window = deque()
+        self.media_sequence = 0
+        self.discontinuity_sequence = 0
+        self.next_index = 0
+        self.timeline = 0.0
+        self._pending_discontinuity = False
+        self._lock = threading.Lock()
+
+        # LL-HLS: partes do segmento em andamento [(nome, duração)] e dos últimos segmentos completos
+        self.parts = []
+        self._segment_parts = OrderedDict()
+
+        # Arquivos fora da playlist aguardando a remoção: (nome, instante monotônico)
+        self._expired = deque()
+
+        os.makedirs(hls_dir, exist_ok=True)
+        self._resume()
+        self._expire_orphans()
+
+    # ------------------------------------------------------------------ API
+
+    def publish_packed_audio(self, adts_frames: bytes, duration: float) -> str:
+        """
+        Publica um segmento "packed audio" (.aac) já encodado por um encoder
+        contínuo: tag ID3 com o timestamp MPEG-2 do início + frames ADTS.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            index = self.next_index
+            offset = self.timeline
+        name = f"{index:05d}.aac"
+        path = os.path.join(self.hls_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(id3_timestamp_tag(offset))
+            f.write(adts_frames)
+        os.replace(tmp_path, path)
+
+        self._publish(name, duration)
+        HLS_WRITE_SECONDS.observe(time.perf_counter() - started, **self.labels)
+        HLS_SEGMENTS.inc(**self.labels)
+        return path
+
+    def publish_part(self, adts_frames: bytes, duration: float) -> str:
+        """
+        LL-HLS: publica uma parte do segmento em andamento ({índice}.{parte}.aac),
+        com a sua própria tag ID3 de timestamp. O segmento completo continua vindo
+        de publish_packed_audio() com os mesmos frames.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            name = f"{self.next_index:05d}.{len(self.parts)}.aac"
+            offset = self.timeline + sum(part_duration for _, part_duration in self.parts)
+        path = os.path.join(self.hls_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(id3_timestamp_tag(offset))
+            f.write(adts_frames)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.parts.append((name, duration))
+            self._write_playlist()
+        HLS_WRITE_SECONDS.observe(time.perf_counter() - started, **self.labels)
+        return path
+
+    def mark_discontinuity(self):
+        """O próximo segmento publicado será precedido de EXT-X-DISCONTINUITY."""
+        with self._lock:
+            self._pending_discontinuity = True
+
+    # ------------------------------------------------------------ internos
+
+    def _publish(self, name: str, duration: float):
+        with self._lock:
+            self.window.append((name, duration, self._pending_discontinuity))
+            self._pending_discontinuity = False
+            self.next_index += 1
+            self.timeline += duration
+            self.target_duration = max(self.target_duration, math.ceil(duration))
+            if self.part_target:
+                self._segment_parts[name] = self.parts
+                self.parts = []
+                while len(self._segment_parts) > self.PART_SEGMENTS:
+                    # Partes antigas saem da playlist (o segmento completo continua)
+                    _, old_parts = self._segment_parts.popitem(last=False)
+                    for part_name, _ in old_parts:
+                        self._expire(part_name)
+
+            while len(self.window) > self.list_size:
+                old_name, _, had_discontinuity = self.window.popleft()
+                self.media_sequence += 1
+                if had_discontinuity:
+                    self.discontinuity_sequence += 1
+                self._expire(old_name)
+
+            self._write_playlist()
+            self._delete_expired()
+
+    def _expire(self, name: str):
+        # Só some do disco depois de uma duração de playlist fora dela
+        grace = sum(duration for _, duration, _ in self.window) + self.target_duration
+        self._expired.append((name, time.monotonic() + grace))
+
+    def _delete_expired(self):
+        now = time.monotonic()
+        while self._expired and self._expired[0][1] <= now:
+            name, _ = self._expired.popleft()
+            try:
+                os.remove(os.path.join(self.hls_dir, name))
+                HLS_DELETED.inc(**self.labels)
+            except FileNotFoundError:
+                pass
+
+    def _write_playlist(self):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:6" if self.part_target else "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+        ]
+        if self.part_target:
+            lines.append(f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * self.part_target:.3f}")
+            lines.append(f"#EXT-X-PART-INF:PART-TARGET={self.part_target:.3f}")
+        lines.append(f"#EXT-X-MEDIA-SEQUENCE:{self.media_sequence}")
+        lines.append(f"#EXT-X-DISCONTINUITY-SEQUENCE:{self.discontinuity_sequence}")
+        for name, duration, discontinuity in self.window:
+            if discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.extend(self._part_lines(self._segment_parts.get(name, ())))
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self.part_target:
+            if self.parts and self._pending_discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.extend(self._part_lines(self.parts))
+            lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{self.next_index:05d}.{len(self.parts)}.aac"')
+
+        # Escrita atômica: o player nunca vê uma playlist pela metade
+        tmp_path = self.playlist_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+    @staticmethod
+    def _part_lines(parts) -> list:
+        # Áudio AAC: todo frame é independente
+        return [f'#EXT-X-PART:DURATION={duration:.3f},URI="{name}",INDEPENDENT=YES' for name, duration in parts]
+
+    def _resume(self):
+        """
+        Se já existe uma playlist deste canal/idioma (ex.: worker reiniciado),
+        continua a numeração a partir dela e marca uma descontinuidade.
+        """
+        if not os.path.exists(self.playlist_path):
+            return
+
+        pending_discontinuity = False
+        duration = None
+        with open(self.playlist_path) as f:
+            for raw in f:
+                line = raw.strip()
+                if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                    self.media_sequence = int(line.split(":", 1)[1])
+                elif line.startswith("#EXT-X-DISCONTINUITY-SEQUENCE:"):
+                    self.discontinuity_sequence = int(line.split(":", 1)[1])
+                elif line.startswith("#EXT-X-TARGETDURATION:"):
+                    self.target_duration = max(self.target_duration, int(line.split(":", 1)[1]))
+                elif line == "#EXT-X-DISCONTINUITY":
+                    pending_discontinuity = True
+                elif line.startswith("#EXTINF:"):
+                    duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+                elif line and not line.startswith("#") and duration is not None:
+                    self.window.append((line, duration, pending_discontinuity))
+                    self.timeline += duration
+                    pending_discontinuity = False
+                    duration = None
+
+        self.next_index = self.media_sequence + len(self.window)
+        if self.window:
+            self._pending_discontinuity = True
+
+    def _expire_orphans(self):
+        """Segmentos e partes de execuções anteriores que já não estão na playlist."""
+        listed = {name for name, _, _ in self.window}
+        for name in sorted(os.listdir(self.hls_dir)):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.hls_dir, name))
+            elif MEDIA_FILE_RE.match(name) and name not in listed:
+                if int(name.split(".", 1)[0]) >= self.next_index:
+                    # Vai ser reescrito por esta execução: agendar a remoção apagaria o novo
+                    os.remove(os.path.join(self.hls_dir, name))
+                else:
+                    self._expire(name)
+
+
+def id3_timestamp_tag(seconds: float) -> bytes:
+    """
+    Tag ID3v2.4 com o frame PRIV com.apple.streaming.transportStreamTimestamp,
+    exigido no início de segmentos HLS de áudio empacotado (RFC 8216, 3.4).
+    """
+    pts = int(round(seconds * 90000)) & ((1 << 33) - 1)
+    payload = b"com.apple.streaming.transportStreamTimestamp\x00" + pts.to_bytes(8, "big")
+    frame = b"PRIV" + _syncsafe(len(payload)) + b"\x00\x00" + payload
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
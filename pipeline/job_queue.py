@@ -0,0 +1,461 @@
+# livestream-w2-gaules/pipeline/job_queue.py
+
+"""
+Fila de jobs de segmento entre a captura e o empacotamento, para espalhar o
+ASR e o TTS por vários processos/máquinas (python -m pipeline.job_worker).
+
+- SQLiteJobQueue: implementação embutida, sem serviços externos. O arquivo
+  pode ficar num volume compartilhado entre hosts (journal padrão, sem WAL:
+  o WAL exige memória compartilhada e não funciona em sistemas de arquivos de
+  rede). Outros backends só precisam dos mesmos métodos (enqueue, lease,
+  heartbeat, complete, fail, collect) e de um esquema em open_job_queue().
+- Leases: um worker "aluga" o job por lease_seconds e o renova com
+  heartbeat() enquanto trabalha. Se o worker morre, o lease expira e o job
+  volta para a fila (até max_attempts tentativas; depois fica "failed").
+- O produtor (o processo do canal) continua dono da ordem: ele guarda os
+  Futures na ordem dos segmentos e o estágio de empacotamento é ordenado,
+  então os resultados podem voltar fora de ordem.
+- Áudio e resultados binários trafegam como arquivos no spool (mesmo volume):
+  todos os nós precisam montar o volume no mesmo caminho.
+
+Com JOB_QUEUE definido (ex.: sqlite:////shared/jobs.db), o pipeline usa
+QueueASRService/QueueTTSClient no lugar do Whisper e do cliente TTS locais.
+Os relógios dos nós precisam estar sincronizados (NTP): leases usam time.time().
+"""
+
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from pipeline import metrics
+from pipeline.audio import to_pcm16
+from pipeline.tts_client import TTSError
+
+logger = logging.getLogger("job_queue")
+
+JOB_WAIT_SECONDS = metrics.histogram("dub_job_wait_seconds", "Do enfileiramento ao resultado de um job remoto")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, kind, id);
+"""
+
+
+class JobFailed(Exception):
+    """O job esgotou as tentativas ou o worker o marcou como falho."""
+
+
+class Job:
+    def __init__(self, id: int, kind: str, channel: str, seq: int, payload: dict, attempts: int):
+        self.id = id
+        self.kind = kind
+        self.channel = channel
+        self.seq = seq
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind}, {self.channel}#{self.seq}, tentativa {self.attempts})"
+
+
+class SQLiteJobQueue:
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Uma conexão por thread; transações explícitas (isolation_level=None)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA busy_timeout = 30000")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    # ------------------------------------------------------------ produtor
+
+    def enqueue(self, kind: str, channel: str, seq: int, payload: dict) -> int:
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO jobs (kind, channel, seq, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, channel, seq, json.dumps(payload), self.max_attempts, now, now),
+            )
+            return cursor.lastrowid
+
+    def collect(self, job_ids: list) -> list:
+        """
+        Jobs terminados entre job_ids: [(id, "done"|"failed", resultado, erro)].
+        São apagados da fila ao serem coletados.
+        """
+        if not job_ids:
+            return []
+        self._expire_leases()
+        finished = []
+        with self._transaction() as db:
+            for chunk in _chunks(job_ids, 500):
+                marks = ",".join("?" * len(chunk))
+                rows = db.execute(
+                    f"SELECT id, state, result, error FROM jobs WHERE id IN ({marks}) AND state IN ('done', 'failed')",
+                    chunk,
+                ).fetchall()
+                finished.extend((job_id, state, json.loads(result) if result else None, error)
+                                for job_id, state, result, error in rows)
+            for chunk in _chunks([row[0] for row in finished], 500):
+                db.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        return finished
+
+    # ------------------------------------------------------------ workers
+
+    def lease(self, worker: str, kinds: tuple, lease_seconds: float = 30.0):
+        """Aluga o job mais antigo de um dos tipos `kinds`, ou None se não há nenhum."""
+        self._expire_leases()
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._transaction() as db:
+            row = db.execute(
+                f"SELECT id, kind, channel, seq, payload, attempts FROM jobs "
+                f"WHERE state = 'queued' AND kind IN ({marks}) ORDER BY id LIMIT 1",
+                tuple(kinds),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, channel, seq, payload, attempts = row
+            db.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (worker, now + lease_seconds, now, job_id),
+            )
+        return Job(job_id, kind, channel, seq, json.loads(payload), attempts + 1)
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float = 30.0) -> bool:
+        """Renova o lease. False se o job não é mais deste worker (expirou e foi realugado)."""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (now + lease_seconds, now, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: dict) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps(result), now, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, retry: bool = True) -> bool:
+        """Devolve o job à fila (retry e ainda há tentativas) ou o marca como falho."""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "worker = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (1 if retry else 0, error, now, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    # ------------------------------------------------------------ manutenção
+
+    def _expire_leases(self):
+        """Jobs de workers que sumiram (lease vencido) voltam para a fila ou falham."""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "error = 'lease expirado (worker perdido)', worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE state = 'leased' AND lease_expires < ?",
+                (now, now),
+            )
+
+    def counts(self) -> dict:
+        """{(tipo, estado): n}"""
+        rows = self._connect().execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state").fetchall()
+        return {(kind, state): n for kind, state, n in rows}
+
+    def purge(self, older_than: float = 3600.0) -> int:
+        """Apaga jobs terminados e nunca coletados (produtor encerrado) há mais de older_than segundos."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - older_than,),
+            )
+            return cursor.rowcount
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: o lock de escrita é pego no início (sem deadlock de upgrade)."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def open_job_queue(url: str):
+    """sqlite:///caminho/relativo.db, sqlite:////caminho/absoluto.db ou só o caminho do arquivo."""
+    if url.startswith("sqlite://"):
+        return SQLiteJobQueue(url[len("sqlite:///"):], max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+    if "://" in url:
+        raise ValueError(f"backend de fila desconhecido: {url}")
+    return SQLiteJobQueue(url, max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+
+
+def spool_dir() -> str:
+    """Diretório (no volume compartilhado) para áudio de entrada e saída dos jobs."""
+    url = os.environ["JOB_QUEUE"]
+    default = os.path.join(os.path.dirname(os.path.abspath(url.split("sqlite:///")[-1])), "spool")
+    return os.getenv("JOB_SPOOL_DIR", default)
+
+
+# ---------------------------------------------------------------- produtores
+
+
+class _ResultPoller:
+    """Thread que coleta os jobs terminados e resolve os Futures correspondentes."""
+
+    def __init__(self, queue, interval: float = 0.05):
+        self.queue = queue
+        self.interval = interval
+        self._pending = {}  # id -> (Future, enfileirado em)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="job-results", daemon=True).start()
+
+    def watch(self, job_id: int) -> Future:
+        future = Future()
+        with self._lock:
+            self._pending[job_id] = (future, time.monotonic())
+        return future
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                ids = list(self._pending)
+            if not ids:
+                continue
+            try:
+                finished = self.queue.collect(ids)
+            except sqlite3.Error as e:
+                logger.warning(f"[jobs] Erro ao coletar resultados: {e}")
+                continue
+            for job_id, state, result, error in finished:
+                with self._lock:
+                    future, enqueued_at = self._pending.pop(job_id)
+                JOB_WAIT_SECONDS.observe(time.monotonic() - enqueued_at)
+                if state == "done":
+                    future.set_result(result)
+                else:
+                    future.set_exception(JobFailed(error or "job falhou"))
+
+
+class QueueASRService:
+    """
+    Mesma interface do ASRService (submit -> Future[str], stats), mas cada
+    segmento vira um job "asr" processado por um job_worker.
+    """
+
+    model_name = "remoto (fila de jobs)"
+
+    def __init__(self, queue, spool: str, max_pending_per_channel: int = 8):
+        self.queue = queue
+        self.spool = spool
+        self.max_pending_per_channel = max_pending_per_channel
+        self._poller = _ResultPoller(queue)
+        self._lock = threading.Lock()
+        self._seq = {}
+        self._workers_seen = set()
+        self._stats = {"segments": 0, "audio_seconds": 0.0, "compute_seconds": 0.0,
+                       "last_batch_size": None, "last_rtf": None}
+        os.makedirs(spool, exist_ok=True)
+
+    @property
+    def workers(self) -> int:
+        """Workers distintos que já devolveram resultados."""
+        return len(self._workers_seen)
+
+    def submit(self, channel: str, audio, language: str = "pt") -> Future:
+        with self._lock:
+            seq = self._seq.get(channel, 0)
+            self._seq[channel] = seq + 1
+        path, temporary = self._input_path(channel, audio)
+        job_id = self.queue.enqueue("asr", channel, seq, {"path": path, "language": language,
+                                                          "delete_input": temporary})
+        inner = self._poller.watch(job_id)
+        outer = Future()
+        inner.add_done_callback(lambda done: self._on_done(done, outer))
+        return outer
+
+    def _input_path(self, channel: str, audio):
+        """O worker lê arquivos: caminho do WAV (já no volume) ou áudio do anel gravado no spool."""
+        if isinstance(audio, str):
+            return os.path.abspath(audio), False
+        samples = audio.array() if hasattr(audio, "array") else audio
+        sample_rate = getattr(audio, "sample_rate", 16000)
+        path = os.path.join(self.spool, channel, f"{uuid.uuid4().hex}.wav")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(sample_rate)
+            w.writeframes(to_pcm16(samples))
+        return path, True
+
+    def _on_done(self, inner: Future, outer: Future):
+        error = inner.exception()
+        if error is not None:
+            outer.set_exception(error)
+            return
+        result = inner.result()
+        with self._lock:
+            stats = self._stats
+            stats["segments"] += 1
+            stats["audio_seconds"] += result.get("audio_seconds") or 0.0
+            stats["compute_seconds"] += result.get("compute_seconds") or 0.0
+            stats["last_batch_size"] = result.get("batch_size", 1)
+            stats["last_rtf"] = result.get("rtf")
+            self._workers_seen.add(result.get("worker"))
+        outer.set_result(result["text"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._poller.pending()
+        stats["rtf"] = stats["compute_seconds"] / stats["audio_seconds"] if stats["audio_seconds"] else None
+        return stats
+
+
+class QueueTTSClient:
+    """Mesma interface do TTSClient (synthesize -> bytes); a síntese vira um job "tts"."""
+
+    def __init__(self, queue, spool: str, timeout: float = 120.0):
+        self.queue = queue
+        self.spool = spool
+        self.timeout = timeout
+        self._poller = _ResultPoller(queue)
+        self._seq = itertools.count()
+        os.makedirs(os.path.join(spool, "tts"), exist_ok=True)
+
+    def synthesize(self, text: str, voice_id: str, channel: str = "") -> bytes:
+        output = os.path.join(self.spool, "tts", f"{uuid.uuid4().hex}.audio")
+        job_id = self.queue.enqueue("tts", channel, next(self._seq), {"text": text, "voice_id": voice_id, "output": output})
+        try:
+            self._poller.watch(job_id).result(timeout=self.timeout)
+        except JobFailed as e:
+            raise TTSError(f"job de síntese falhou: {e}") from e
+        except FutureTimeoutError as e:
+            raise TTSError(f"job de síntese sem resultado em {self.timeout:.0f}s") from e
+        try:
+            with open(output, "rb") as f:
+                return f.read()
+        finally:
+            try:
+                os.remove(output)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {"cache_hits": 0, "cache_misses": 0, "retried": 0, "hedged": 0}
+
+
+_queue = None
+_asr = None
+_tts = None
+_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Fila do processo (JOB_QUEUE), ou None se o processamento é local."""
+    global _queue
+    url = os.getenv("JOB_QUEUE")
+    if not url:
+        return None
+    with _lock:
+        if _queue is None:
+            _queue = open_job_queue(url)
+            metrics.add_collector(_collect)
+        return _queue
+
+
+def remote_asr_service():
+    """QueueASRService se JOB_QUEUE estiver definido, senão None (ASR local)."""
+    global _asr
+    queue = get_job_queue()
+    if queue is None:
+        return None
+    with _lock:
+        if _asr is None:
+            _asr = QueueASRService(queue, spool_dir(),
+                                   max_pending_per_channel=int(os.getenv("ASR_MAX_PENDING", "8")))
+        return _asr
+
+
+def remote_tts_client():
+    """QueueTTSClient se JOB_QUEUE estiver definido, senão None (TTS local)."""
+    global _tts
+    queue = get_job_queue()
+    if queue is None:
+        return None
+    with _lock:
+        if _tts is None:
+            _tts = QueueTTSClient(queue, spool_dir(), timeout=float(os.getenv("JOB_RESULT_TIMEOUT", "120")))
+        return _tts
+
+
+def _collect() -> list:
+    counts = _queue.counts()
+    return [("dub_jobs", "gauge", "Jobs na fila por tipo e estado",
+             [({"kind": kind, "state": state}, n) for (kind, state), n in counts.items()])]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -0,0 +1,160 @@
+# livestream-w2-gaules/pipeline/job_worker.py
+
+"""
+Worker sem estado para a fila de jobs (pipeline/job_queue.py).
+
+Puxa jobs "asr" (transcrição com o ASRService local, em lote quando há vários
+em andamento) e/ou "tts" (síntese com o cliente TTS local) e devolve os
+resultados na fila. Pode rodar no mesmo host do backend ou em outros, desde
+que todos montem o volume compartilhado (fila + spool) no mesmo caminho.
+
+Uso:
+    JOB_QUEUE=sqlite:////shared/jobs.db python -m pipeline.job_worker --kinds asr --concurrency 4
+    JOB_QUEUE=sqlite:////shared/jobs.db python -m pipeline.job_worker --kinds tts --concurrency 8
+
+Enquanto processa, o worker renova o lease (heartbeat) a cada lease/3
+segundos; se o processo morrer, o job volta para a fila quando o lease vencer.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+import wave
+
+from pipeline.job_queue import default_worker_id, open_job_queue
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("job_worker")
+
+
+class JobWorker:
+    def __init__(self, queue, kinds: tuple, worker_id: str = None, concurrency: int = 1,
+                 lease_seconds: float = 30.0, idle_sleep: float = 0.2):
+        self.queue = queue
+        self.kinds = tuple(kinds)
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.idle_sleep = idle_sleep
+        self.done = 0
+        self.failed = 0
+        self._stopped = threading.Event()
+        self._handlers = {"asr": self._run_asr, "tts": self._run_tts}
+
+    def run(self):
+        threads = [threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        logger.info(f"[job_worker] {self.worker_id} puxando {', '.join(self.kinds)} com {self.concurrency} thread(s)")
+        for thread in threads:
+            thread.join()
+        logger.info(f"[job_worker] Encerrado: {self.done} job(s) concluído(s), {self.failed} com erro")
+
+    def stop(self):
+        """Termina os jobs em andamento e para de alugar novos."""
+        self._stopped.set()
+
+    def _loop(self):
+        # Cada thread tem o seu id de worker: um lease é de uma thread só
+        worker = f"{self.worker_id}/{threading.current_thread().name}"
+        while not self._stopped.is_set():
+            job = self.queue.lease(worker, self.kinds, self.lease_seconds)
+            if job is None:
+                self._stopped.wait(self.idle_sleep)
+                continue
+            self._process(worker, job)
+
+    def _process(self, worker: str, job):
+        lost = threading.Event()
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(self.lease_seconds / 3):
+                if not self.queue.heartbeat(job.id, worker, self.lease_seconds):
+                    lost.set()
+                    return
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            result = self._handlers[job.kind](job)
+        except Exception as e:
+            finished.set()
+            self.failed += 1
+            logger.error(f"[job_worker] {job} falhou: {e}")
+            self.queue.fail(job.id, worker, f"{type(e).__name__}: {e}")
+            return
+        finished.set()
+        result["worker"] = self.worker_id
+        if lost.is_set() or not self.queue.complete(job.id, worker, result):
+            # O lease venceu (ex.: pausa longa) e outro worker pegou o job: o resultado dele vale
+            logger.warning(f"[job_worker] Lease de {job} perdido; resultado descartado")
+            return
+        self.done += 1
+
+    def _run_asr(self, job) -> dict:
+        from pipeline.asr_service import get_asr_service
+
+        payload = job.payload
+        asr = get_asr_service()
+        audio_seconds = _wav_seconds(payload["path"])
+        started = time.perf_counter()
+        text = asr.submit(job.channel, payload["path"], language=payload.get("language", "pt")).result()
+        stats = asr.stats()
+        if payload.get("delete_input"):
+            try:
+                os.remove(payload["path"])
+            except FileNotFoundError:
+                pass
+        return {
+            "text": text,
+            "compute_seconds": time.perf_counter() - started,
+            "audio_seconds": audio_seconds,
+            "batch_size": stats["last_batch_size"],
+            "rtf": stats["last_rtf"],
+        }
+
+    def _run_tts(self, job) -> dict:
+        from pipeline.tts_client import get_tts_client
+
+        payload = job.payload
+        audio = get_tts_client().synthesize(payload["text"], payload["voice_id"])
+        tmp_path = payload["output"] + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, payload["output"])
+        return {"bytes": len(audio)}
+
+
+def _wav_seconds(path: str):
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de jobs de segmento (ASR/TTS)")
+    parser.add_argument("--queue", default=os.getenv("JOB_QUEUE"), help="URL da fila (padrão: JOB_QUEUE)")
+    parser.add_argument("--kinds", default="asr,tts", help="tipos de job a processar")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs em paralelo")
+    parser.add_argument("--lease", type=float, default=30.0, help="duração do lease (s)")
+    parser.add_argument("--worker-id", help="identificador (padrão: host:pid)")
+    args = parser.parse_args()
+    if not args.queue:
+        parser.error("defina --queue ou JOB_QUEUE")
+
+    worker = JobWorker(open_job_queue(args.queue), args.kinds.split(","), worker_id=args.worker_id,
+                       concurrency=args.concurrency, lease_seconds=args.lease)
+    # SIGTERM/SIGINT: termina os jobs em andamento e sai (os outros ficam na fila)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
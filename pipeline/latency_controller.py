@@ -0,0 +1,163 @@
+# livestream-w2-gaules/pipeline/latency_controller.py
+
+"""
+Controle do orçamento de latência de um canal.
+
+Quando o pipeline fica para trás, o backlog só cresce e o espectador se
+afasta cada vez mais do ao vivo. O controlador compara o atraso do canal com
+latency_budget (config do canal) e degrada em degraus, um por vez:
+
+  0 normal
+  1 fast_asr: transcreve com um modelo menor (degrade_asr_model)
+  2 skip_tts: sem tradução/TTS; publica o áudio original
+  3 drop:     descarta, antes do ASR, segmentos mais velhos que o orçamento
+              (o próximo publicado vem com EXT-X-DISCONTINUITY)
+
+Sobe um degrau se o atraso passa do orçamento por `dwell` segundos seguidos;
+desce um se fica abaixo de recover_ratio × orçamento por `recover` segundos.
+
+O atraso é o maior entre: a média móvel da idade dos segmentos ao publicar,
+a idade do último segmento na entrada (backlog na fonte) e, se nada é
+publicado há um tempo com segmentos entrando, a idade projetada do próximo.
+
+Cada mudança vira um evento no log do canal e nas métricas
+dub_latency_level / dub_latency_transitions_total; cada segmento afetado
+conta em dub_latency_degraded_segments_total.
+"""
+
+import threading
+import time
+from collections import deque
+
+from pipeline import metrics
+
+NORMAL, FAST_ASR, SKIP_TTS, DROP = range(4)
+LEVEL_NAMES = ("normal", "fast_asr", "skip_tts", "drop")
+
+LATENCY_LEVEL = metrics.gauge("dub_latency_level", "Degrau de degradação do canal (0 normal, 1 fast_asr, 2 skip_tts, 3 drop)")
+LATENCY_LAG = metrics.gauge("dub_latency_lag_seconds", "Atraso estimado do canal usado pelo controle de latência")
+LATENCY_TRANSITIONS = metrics.counter("dub_latency_transitions_total", "Mudanças de degrau do controle de latência")
+LATENCY_DEGRADED = metrics.counter("dub_latency_degraded_segments_total",
+                                   "Segmentos afetados pela degradação, por ação")
+
+
+class LatencyController:
+    def __init__(self, channel: str, budget: float, segment_seconds: float = 5.0, log_queue=None,
+                 dwell: float = 10.0, recover: float = 30.0, recover_ratio: float = 0.5, alpha: float = 0.3):
+        self.channel = channel
+        self.budget = budget
+        self.segment_seconds = segment_seconds
+        self.log_queue = log_queue
+        self.dwell = dwell
+        self.recover = recover
+        self.recover_ratio = recover_ratio
+        self.alpha = alpha
+
+        self.level = NORMAL
+        self.history = deque(maxlen=50)  # últimas decisões (para /status)
+        self._published_age = None  # média móvel da idade ao publicar
+        self._last_published = None  # (instante, idade)
+        self._last_intake = None  # (instante, idade)
+        self._over_since = None
+        self._under_since = None
+        self._lock = threading.Lock()
+        self.labels = {"channel": channel}
+        LATENCY_LEVEL.set(NORMAL, **self.labels)
+
+    # ------------------------------------------------------------ observações
+
+    def observe_intake(self, age: float):
+        """Idade de um segmento ao sair da fonte (antes do ASR)."""
+        with self._lock:
+            self._last_intake = (time.monotonic(), age)
+        self.evaluate()
+
+    def observe_published(self, age: float):
+        """Idade de um segmento ao ser publicado (chamado por cada idioma)."""
+        with self._lock:
+            self._last_published = (time.monotonic(), age)
+            if self._published_age is None:
+                self._published_age = age
+            else:
+                self._published_age += self.alpha * (age - self._published_age)
+        self.evaluate()
+
+    def lag(self) -> float:
+        with self._lock:
+            return self._lag(time.monotonic())
+
+    def _lag(self, now: float) -> float:
+        lag = self._published_age or 0.0
+        if self._last_intake is not None:
+            lag = max(lag, self._last_intake[1])
+            if self._last_published is not None and self._last_intake[0] > self._last_published[0]:
+                # Há segmentos entrando e nada saindo: o próximo a publicar já está pelo menos tão velho
+                published_at, age = self._last_published
+                lag = max(lag, age + (now - published_at) - self.segment_seconds)
+        return lag
+
+    # ------------------------------------------------------------ decisões
+
+    def evaluate(self):
+        """Reavalia o degrau (chamado a cada observação e periodicamente pelo pipeline)."""
+        if self.budget <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            lag = self._lag(now)
+            LATENCY_LAG.set(lag, **self.labels)
+            if lag > self.budget:
+                self._under_since = None
+                self._over_since = self._over_since or now
+                if self.level < DROP and now - self._over_since >= self.dwell:
+                    self._change(self.level + 1, lag)
+                    self._over_since = now
+            elif lag < self.budget * self.recover_ratio:
+                self._over_since = None
+                self._under_since = self._under_since or now
+                if self.level > NORMAL and now - self._under_since >= self.recover:
+                    self._change(self.level - 1, lag)
+                    self._under_since = now
+            else:
+                self._over_since = None
+                self._under_since = None
+
+    def _change(self, level: int, lag: float):
+        previous, self.level = self.level, level
+        direction = "up" if level > previous else "down"
+        LATENCY_LEVEL.set(level, **self.labels)
+        LATENCY_TRANSITIONS.inc(direction=direction, level=LEVEL_NAMES[level], **self.labels)
+        self.history.append({"at": time.time(), "from": LEVEL_NAMES[previous], "to": LEVEL_NAMES[level],
+                             "lag_seconds": round(lag, 2)})
+        if self.log_queue is not None:
+            verb = "degradando" if direction == "up" else "recuperando"
+            self.log_queue.put(
+                f"[latency:{self.channel}] {verb}: {LEVEL_NAMES[previous]} → {LEVEL_NAMES[level]} "
+                f"(atraso {lag:.1f}s, orçamento {self.budget:.0f}s)"
+            )
+
+    # ------------------------------------------------------------ consultas do pipeline
+
+    def use_fast_asr(self) -> bool:
+        return self.level >= FAST_ASR
+
+    def skip_tts(self) -> bool:
+        return self.level >= SKIP_TTS
+
+    def should_drop(self, age: float) -> bool:
+        """Em drop: descarta segmentos que já chegam mais velhos que o orçamento."""
+        return self.level >= DROP and age > self.budget
+
+    def count(self, action: str, **labels):
+        LATENCY_DEGRADED.inc(action=action, **self.labels, **labels)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            lag = self._lag(time.monotonic())
+            history = list(self.history)
+        return {"budget_seconds": self.budget, "level": LEVEL_NAMES[self.level], "lag_seconds": round(lag, 2),
+                "history": history}
+
+    def close(self):
+        for metric in (LATENCY_LEVEL, LATENCY_LAG):
+            metric.remove(**self.labels)
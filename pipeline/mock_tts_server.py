@@ -0,0 +1,85 @@
+# livestream-w2-gaules/pipeline/mock_tts_server.py
+
+"""
+Servidor TTS falso, compatível com POST /v1/tts/audio do Speechify, para testes
+de carga sem a API real. Devolve {"audioData": <WAV base64>} com um tom cuja
+duração acompanha o tamanho do texto, com latência e taxa de erro configuráveis.
+
+Uso:
+    python -m pipeline.mock_tts_server --port 8089 --latency 0.4 --jitter 0.3 --error-rate 0.05
+    SPEECHIFY_API_URL=http://127.0.0.1:8089/v1/tts/audio SPEECHIFY_API_KEY=x SPEECHIFY_VOICE_ID=mock ...
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import wave
+from base64 import b64encode
+
+import numpy as np
+from aiohttp import web
+
+SAMPLE_RATE = 24000
+CHARS_PER_SECOND = 15.0
+
+
+def synth_wav(text: str, sample_rate: int = SAMPLE_RATE) -> bytes:
+    seconds = max(0.5, len(text) / CHARS_PER_SECOND)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.2 * np.sin(2 * np.pi * 220.0 * t)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((tone * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def make_app(latency: float = 0.3, jitter: float = 0.2, error_rate: float = 0.0,
+             slow_rate: float = 0.0, slow_latency: float = 5.0) -> web.Application:
+    stats = {"requests": 0, "errors": 0, "slow": 0}
+
+    async def tts_audio(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        body = await request.json()
+        if not body.get("voiceId") or "input" not in body:
+            return web.json_response({"error": "voiceId e input são obrigatórios"}, status=400)
+
+        delay = latency + random.uniform(0, jitter)
+        if random.random() < slow_rate:
+            stats["slow"] += 1
+            delay = slow_latency
+        await asyncio.sleep(delay)
+
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": "erro simulado"}, status=random.choice((429, 503)))
+        return web.json_response({"audioData": b64encode(synth_wav(body["input"])).decode(), "audioFormat": "wav"})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/v1/tts/audio", tts_audio)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor TTS falso (API Speechify)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="latência base (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latência extra aleatória (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 429/503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fração de respostas lentas (cauda)")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args()
+    app = make_app(args.latency, args.jitter, args.error_rate, args.slow_rate, args.slow_latency)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# livestream-w2-gaules/pipeline/profiler.py
+
+"""
+Profiler por amostragem para um worker em produção.
+
+Uma thread lê sys._current_frames() a cada `interval` segundos e conta as
+pilhas de todas as outras threads no formato "collapsed" (uma linha por
+pilha: frames separados por ';' seguidos da contagem), que flamegraph.pl e
+speedscope abrem direto. Não instrumenta nada: desligado custa zero, ligado
+custa uma leitura de pilhas por intervalo.
+
+Acionado pelo backend (POST /debug/profile, só com PROFILER_ENABLED=1).
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+
+_lock = threading.Lock()  # um perfil por vez
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample(seconds: float = 10.0, interval: float = 0.01, include_idle: bool = False) -> str:
+    """
+    Amostra todas as threads por `seconds` segundos e devolve as pilhas no
+    formato collapsed. Sem include_idle, threads paradas em wait/select/sleep
+    (filas vazias) são descartadas.
+    """
+    if not _lock.acquire(blocking=False):
+        raise RuntimeError("já existe um perfil em andamento")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not include_idle and frame.f_code.co_name in ("wait", "select", "poll", "sleep", "_wait_for_tstate_lock"):
+                    continue
+                stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    finally:
+        _lock.release()
@@ -0,0 +1,174 @@
+# livestream-w2-gaules/pipeline/segment_source.py
+
+"""
+Fontes de segmentos para o ChannelPipeline.
+
+- DirectorySegmentSource: WAVs gravados pelo recorder em audio_dir (modo clássico).
+- RingSegmentSource: fatias do PCMRingBuffer da captura em memória (CAPTURE_MODE=pcm),
+  sem passar pelo disco; de tamanho fixo ou cortadas nas pausas da fala
+  (capture/segmenter.py).
+"""
+
+import os
+import time
+import wave
+
+from capture.ring_buffer import RingClosed
+from pipeline.audio import read_wav
+from pipeline.segment_watcher import SegmentWatcher
+
+
+class Segment:
+    """
+    Um trecho de áudio capturado. Vem de um arquivo (path) ou de uma fatia do
+    ring buffer (ring_slice); work_dir é onde os ramos gravam seus intermediários.
+    Na fatia, as primeiras `context` amostras são o final do segmento anterior:
+    vão para o ASR, mas não para o empacotamento. captured_at é o instante
+    (time.time()) em que a última amostra foi capturada: a idade do segmento
+    ao ser publicado mede o atraso do pipeline em relação ao ao vivo.
+    passthrough e discontinuity são marcados pelo controle de latência:
+    publicar o áudio original sem ASR/TTS e marcar a quebra depois de segmentos
+    descartados.
+    """
+
+    def __init__(self, seq: int, name: str, work_dir: str, path: str = None, ring_slice=None, context: int = 0,
+                 captured_at: float = None):
+        self.seq = seq
+        self.captured_at = captured_at if captured_at is not None else time.time()
+        self.name = name
+        self.work_dir = work_dir
+        self.path = path
+        self.ring_slice = ring_slice
+        self.context = context
+        self.passthrough = False
+        self.discontinuity = False
+
+    def asr_input(self):
+        """O que mandar ao serviço de ASR: caminho do arquivo ou fatia do anel (copiada só no processo do pool)."""
+        return self.path if self.path is not None else self.ring_slice
+
+    def load(self):
+        """(amostras float32 mono, sample_rate) do áudio original, sem o contexto."""
+        if self.path is not None:
+            return read_wav(self.path)
+        return self.ring_slice.array()[self.context:], self.ring_slice.sample_rate
+
+    def duration(self) -> float:
+        """Segundos que o segmento ocupa na linha do tempo da origem (sem o contexto)."""
+        if self.path is not None:
+            try:
+                with wave.open(self.path, "rb") as w:
+                    return w.getnframes() / w.getframerate()
+            except wave.Error:
+                samples, sr = self.load()
+                return len(samples) / sr
+        return (len(self.ring_slice) - self.context) / self.ring_slice.sample_rate
+
+    def dubbed_path(self, lang: str) -> str:
+        return os.path.join(self.work_dir, f"{self.name}_{lang}.wav")
+
+    def __str__(self):
+        return self.path or f"{self.name} (ring buffer)"
+
+
+class DirectorySegmentSource:
+    """
+    Segmentos WAV do recorder, entregues pelo SegmentWatcher assim que o muxer
+    os fecha. start_seq: -segment_start_number da captura (padrão: depois do
+    maior segmento já em disco).
+    """
+
+    def __init__(self, audio_dir: str, start_seq: int = None):
+        self.audio_dir = audio_dir
+        self.watcher = SegmentWatcher(audio_dir, start_seq=start_seq)
+
+    def poll(self, timeout: float = 1.0) -> list:
+        """Segmentos novos desde a última chamada (espera até `timeout` se não houver nenhum)."""
+        segments = []
+        for seq, path in self.watcher.poll(timeout):
+            try:
+                captured_at = os.stat(path).st_mtime  # o muxer fecha o arquivo logo após a última amostra
+            except FileNotFoundError:
+                continue
+            segments.append(Segment(seq, os.path.basename(path)[:-len(".wav")], self.audio_dir, path=path,
+                                    captured_at=captured_at))
+        return segments
+
+    def close(self):
+        self.watcher.close()
+
+
+class RingSegmentSource:
+    """
+    Corta o PCM do anel em segmentos conforme o áudio chega: de segment_seconds
+    fixos ou, com um SpeechSegmenter, nas pausas da fala.
+    """
+
+    def __init__(self, ring, work_dir: str, segment_seconds: float = 10.0, log_queue=None, segmenter=None):
+        self.ring = ring
+        self.work_dir = work_dir
+        self.segment_samples = int(segment_seconds * ring.sample_rate)
+        self.log_queue = log_queue
+        self.segmenter = segmenter
+        self._cursor = ring.oldest()  # fixo: início do próximo segmento; adaptativo: próxima amostra a analisar
+        self._seq = 0
+        if segmenter is not None:
+            segmenter.reset(self._cursor)
+
+    def poll(self, timeout: float = 1.0) -> list:
+        try:
+            if self.segmenter is not None:
+                return self._poll_adaptive(timeout)
+            return self._poll_fixed(timeout)
+        except RingClosed:
+            # Captura encerrada antes do pipeline: o run() sai no próximo ciclo
+            return []
+
+    def _poll_fixed(self, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        while self.ring.write_pos - self._cursor < self.segment_samples and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self._check_overrun(self._cursor)
+
+        new = []
+        while self.ring.write_pos - self._cursor >= self.segment_samples:
+            new.append(self._segment(self._cursor, self._cursor, self._cursor + self.segment_samples))
+            self._cursor += self.segment_samples
+        return new
+
+    def _poll_adaptive(self, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._check_overrun(self.segmenter.segment_start):
+                self.segmenter.reset(self._cursor)
+            available = self.ring.write_pos - self._cursor
+            cuts = []
+            if available > 0:
+                # Só o áudio novo passa pelo segmentador
+                cuts = self.segmenter.feed(self.ring.read(self._cursor, available))
+                self._cursor += available
+            if cuts or time.monotonic() >= deadline:
+                oldest = self.ring.oldest()
+                return [self._segment(max(context_start, oldest), start, end) for context_start, start, end in cuts]
+            time.sleep(0.02)
+
+    def _check_overrun(self, start: int) -> bool:
+        """Se o pipeline ficou para trás além da capacidade do anel, pula para o áudio mais antigo ainda válido."""
+        if self.ring.valid(start):
+            return False
+        skipped = self.ring.oldest() - start
+        self._cursor = self.ring.oldest()
+        if self.log_queue is not None:
+            self.log_queue.put(
+                f"[source] Pipeline atrasado além da capacidade do anel; "
+                f"{skipped / self.ring.sample_rate:.1f}s de áudio descartados"
+            )
+        return True
+
+    def _segment(self, context_start: int, start: int, end: int) -> Segment:
+        ring_slice = self.ring.slice(context_start, end - context_start)
+        segment = Segment(self._seq, f"segment_{self._seq:05d}", self.work_dir,
+                          ring_slice=ring_slice, context=start - context_start)
+        self._seq += 1
+        return segment
@@ -0,0 +1,166 @@
+# livestream-w2-gaules/pipeline/segment_watcher.py
+
+"""
+Descoberta de segmentos orientada a eventos.
+
+O recorder grava segment_000.wav, segment_001.wav, ... em sequência. Em vez de
+listar o diretório a cada segundo e guardar um set de nomes que só cresce, o
+watcher acompanha um único número de sequência (o próximo esperado):
+
+- Linux: inotify (IN_CLOSE_WRITE) avisa assim que o muxer de segmentos fecha o
+  arquivo, sem espera de polling e sem pegar arquivo pela metade.
+- Outros sistemas: polling barato só do próximo arquivo esperado (os.stat, sem
+  listdir). Um segmento é considerado fechado quando o seguinte já existe, já
+  que o muxer só abre o próximo depois de fechar o atual (ou quando ninguém
+  escreve nele há stale_after segundos, ex.: captura encerrada).
+
+A memória é constante: só o próximo número esperado e, no máximo, alguns
+segmentos já fechados fora de ordem.
+
+Segmentos que sobraram de uma execução anterior não são entregues: sem
+start_seq, o watcher começa depois do maior número já em disco (quem inicia
+a captura deve passar o -segment_start_number dela).
+"""
+
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import time
+
+SEGMENT_RE = re.compile(r"^segment_(\d+)\.wav$")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def segment_path(audio_dir: str, seq: int) -> str:
+    # Mesmo formato do recorder (segment_%03d.wav)
+    return os.path.join(audio_dir, f"segment_{seq:03d}.wav")
+
+
+def _open_inotify(path: str):
+    """Retorna o fd do inotify observando path, ou None se indisponível."""
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class SegmentWatcher:
+    def __init__(self, audio_dir: str, start_seq: int = None, use_inotify: bool = True,
+                 poll_interval: float = 0.25, stale_after: float = 5.0):
+        self.audio_dir = audio_dir
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        os.makedirs(audio_dir, exist_ok=True)
+
+        # O inotify é aberto antes da varredura inicial para não perder nenhum fechamento
+        self._fd = _open_inotify(audio_dir) if use_inotify else None
+        self._closed = set()  # sequências >= next_seq já fechadas (só as que chegaram fora de ordem)
+
+        if start_seq is None:
+            # Única listagem do diretório: o que já existe é de antes (não é ao vivo)
+            existing = [int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(audio_dir)) if m]
+            start_seq = max(existing) + 1 if existing else 0
+        self.next_seq = start_seq
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._fd is not None else "polling"
+
+    def poll(self, timeout: float = 1.0) -> list:
+        """
+        Devolve [(seq, caminho)] dos segmentos fechados e prontos, em ordem,
+        esperando até `timeout` segundos se ainda não houver nenhum.
+        """
+        ready = self._drain()
+        if ready:
+            return ready
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            if self._fd is not None:
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+                if readable:
+                    self._read_events()
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+            ready = self._drain()
+            if ready:
+                return ready
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode(errors="ignore")
+            offset += name_len
+            match = SEGMENT_RE.match(name)
+            if match and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                seq = int(match.group(1))
+                if seq >= self.next_seq:
+                    self._closed.add(seq)
+
+    def _is_closed(self, seq: int) -> bool:
+        if seq in self._closed:
+            return True
+        # O muxer é sequencial: se um posterior já fechou, este também fechou
+        if any(later > seq for later in self._closed):
+            return True
+        # Fechado quando o muxer já abriu o seguinte
+        if os.path.exists(segment_path(self.audio_dir, seq + 1)):
+            return True
+        # Ou quando ninguém escreve nele há um bom tempo (ex.: captura encerrada)
+        try:
+            return time.time() - os.stat(segment_path(self.audio_dir, seq)).st_mtime > self.stale_after
+        except FileNotFoundError:
+            return False
+
+    def _drain(self) -> list:
+        ready = []
+        while True:
+            if self._is_closed(self.next_seq):
+                path = segment_path(self.audio_dir, self.next_seq)
+                self._closed.discard(self.next_seq)
+                if os.path.exists(path):
+                    ready.append((self.next_seq, path))
+                self.next_seq += 1
+                continue
+            # Buraco na sequência (arquivo perdido/removido): pula se já há um posterior
+            if not os.path.exists(segment_path(self.audio_dir, self.next_seq)):
+                later = [seq for seq in self._closed if seq > self.next_seq]
+                if not later and os.path.exists(segment_path(self.audio_dir, self.next_seq + 1)):
+                    later = [self.next_seq + 1]
+                if later:
+                    self.next_seq = min(later)
+                    continue
+            break
+        return ready
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,149 @@
+# livestream-w2-gaules/pipeline/stages.py
+
+"""
+Estágios concorrentes ligados por filas limitadas.
+
+Cada Stage tem N threads que aplicam `fn` aos itens da sua fila e entregam o
+resultado ao estágio seguinte. Enquanto um estágio espera a rede (DeepL,
+Speechify), o anterior continua trabalhando; a vazão tende à do estágio mais
+lento em vez da soma de todos.
+
+- Filas limitadas (maxsize): se um estágio atrasa, put() bloqueia e a pressão
+  volta até a fonte, em vez de acumular memória.
+- Os itens carregam um número de sequência denso (0, 1, 2, ...). Um estágio
+  `ordered` só processa o próximo número esperado, restaurando a ordem na saída
+  mesmo que os estágios anteriores tenham vários workers. O limite dele é uma
+  janela de sequência (seq < próximo + maxsize), aplicada só quando o próximo
+  já chegou; enquanto ele está atrasado num estágio anterior, o estágio
+  ordenado aceita tudo (buffer de reordenação), senão os itens seguintes
+  travariam os workers de que o atrasado precisa para chegar.
+- Falhas viram None e seguem adiante, para não deixar buracos na sequência.
+- depth() expõe quantos itens aguardam em cada fila (onde está o gargalo).
+"""
+
+import threading
+import time
+from collections import deque
+
+from pipeline import metrics
+
+STAGE_SECONDS = metrics.histogram("dub_stage_seconds", "Tempo de processamento de um item em cada estágio")
+STAGE_ITEMS = metrics.counter("dub_stage_items_total", "Itens processados por estágio e resultado")
+
+
+class Stage:
+    def __init__(self, name: str, fn, workers: int = 1, maxsize: int = 4, ordered: bool = False, log_queue=None,
+                 labels: dict = None):
+        self.name = name
+        # Labels das métricas: o nome sem o sufixo ":<idioma>" + os do chamador (canal, idioma)
+        self.labels = dict(labels or {}, stage=name.split(":")[0])
+        self.fn = fn
+        self.workers = 1 if ordered else workers
+        self.maxsize = maxsize
+        self.ordered = ordered
+        self.log_queue = log_queue
+        self.downstream = None
+
+        self.processed = 0
+        self.busy_seconds = 0.0
+
+        self._cond = threading.Condition()
+        self._items = {} if ordered else deque()
+        self._next_seq = 0
+        self._stopped = False
+        self._threads = []
+
+    def then(self, downstream: "Stage") -> "Stage":
+        """Liga a saída deste estágio à entrada de downstream (e o devolve, para encadear)."""
+        self.downstream = downstream
+        return downstream
+
+    def start(self) -> "Stage":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def put(self, seq: int, item):
+        """Enfileira um item. Bloqueia enquanto a fila estiver cheia (backpressure)."""
+        with self._cond:
+            while not self._stopped and not self._has_room(seq):
+                self._cond.wait()
+            if self._stopped:
+                return
+            if self.ordered:
+                self._items[seq] = item
+            else:
+                self._items.append((seq, item))
+            self._cond.notify_all()
+
+    def _has_room(self, seq: int) -> bool:
+        """Chamar com _cond."""
+        if self.ordered:
+            return seq < self._next_seq + self.maxsize or self._next_seq not in self._items
+        return len(self._items) < self.maxsize
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def stop(self):
+        """Para os workers; itens ainda na fila são descartados."""
+        with self._cond:
+            self._stopped = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        """Depois de stop(), espera os workers saírem. Retorna False se algum ainda roda ao fim do timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        threads = [thread for thread in self._threads if thread is not threading.current_thread()]
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads)
+
+    def _take(self):
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                if self.ordered:
+                    if self._next_seq in self._items:
+                        seq = self._next_seq
+                        self._next_seq += 1
+                        item = self._items.pop(seq)
+                        self._cond.notify_all()
+                        return seq, item
+                elif self._items:
+                    job = self._items.popleft()
+                    self._cond.notify_all()
+                    return job
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            seq, item = job
+            result = None
+            if item is not None:
+                started = time.perf_counter()
+                outcome = "ok"
+                try:
+                    result = self.fn(item)
+                    if result is None and self.downstream is not None:
+                        outcome = "dropped"
+                except Exception as e:
+                    outcome = "error"
+                    if self.log_queue is not None:
+                        self.log_queue.put(f"[{self.name}] ERRO no item {seq}: {e}")
+                elapsed = time.perf_counter() - started
+                with self._cond:
+                    self.processed += 1
+                    self.busy_seconds += elapsed
+                STAGE_SECONDS.observe(elapsed, **self.labels)
+                STAGE_ITEMS.inc(result=outcome, **self.labels)
+            if self.downstream is not None:
+                self.downstream.put(seq, result)
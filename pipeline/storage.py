@@ -0,0 +1,240 @@
+# livestream-w2-gaules/pipeline/storage.py
+
+"""
+Retenção e uso de disco dos intermediários de cada canal.
+
+Sem isto, segment_XXX.wav, os _<lang>.wav dublados, os .mp3 de depuração e o
+arquivo WAV da captura PCM crescem para sempre. O StorageManager roda uma
+varredura periódica (STORAGE_SWEEP_SECONDS) por canal em execução:
+
+- Intermediários em audio_dir: apagados assim que TODOS os idiomas publicaram
+  o segmento (ChannelPipeline.retained_seq()), mantendo só os últimos
+  keep_intermediates (config do canal) para depuração. O último WAV gravado
+  pela captura nunca é apagado: o supervisor continua a numeração a partir dele.
+- Arquivo da captura PCM (audio_dir/archive): janela de archive_retention segundos.
+- processed/ (saída do worker antigo): arquivos com mais de archive_retention segundos.
+
+Os segmentos HLS são apagados pelo próprio LiveHLSPackager quando saem da
+playlist (ver dvr_window na config do canal).
+
+Caches compartilhados entre canais (o de áudio do TTS) se registram com
+add_cache(): a varredura chama evict() deles, e usage()/dub_storage_bytes os
+mostram na área de mesmo nome.
+
+Intermediários podem ficar em memória: AUDIO_SEGMENTS_DIR aponta a raiz para
+outro lugar (ex.: um tmpfs) e STORAGE_TMPFS=1 usa /dev/shm/livestream-w2.
+"""
+
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from pipeline import metrics
+
+logger = logging.getLogger("storage")
+
+STORAGE_DELETED_BYTES = metrics.counter("dub_storage_deleted_bytes_total", "Bytes apagados pela retenção, por área")
+
+# segment_007.wav (captura), segment_00007_en.wav (dublado), segment_007_debug.mp3, ...
+INTERMEDIATE_RE = re.compile(r"^segment_(\d+)(_[\w-]+)?\.(wav|mp3)$")
+CAPTURE_RE = re.compile(r"^segment_(\d+)\.wav$")
+
+
+def audio_root() -> str:
+    """Raiz dos intermediários (audio_segments/<canal>)."""
+    if os.getenv("AUDIO_SEGMENTS_DIR"):
+        return os.environ["AUDIO_SEGMENTS_DIR"]
+    if os.getenv("STORAGE_TMPFS") == "1" and os.path.isdir("/dev/shm"):
+        return "/dev/shm/livestream-w2/audio_segments"
+    return "audio_segments"
+
+
+def hls_root() -> str:
+    return os.getenv("HLS_DIR", "hls")
+
+
+def dir_usage(path: str) -> dict:
+    """{"bytes": n, "files": n} de path (recursivo); zeros se não existe."""
+    total = files = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except FileNotFoundError:
+                    continue
+    return {"bytes": total, "files": files}
+
+
+def _remove(path: str) -> int:
+    """Apaga path; retorna os bytes liberados (0 se já não existia)."""
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+class StorageManager:
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._pipelines = {}
+        self._caches = {}  # área -> cache com evict() e usage()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def track(self, pipeline):
+        """Passa a aplicar a retenção ao canal do pipeline (chamado por ChannelPipeline.run)."""
+        with self._lock:
+            self._pipelines[pipeline.channel] = pipeline
+            self._ensure_thread()
+
+    def add_cache(self, area: str, cache):
+        """Passa a limitar um cache compartilhado (evict() a cada varredura)."""
+        with self._lock:
+            self._caches[area] = cache
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="storage-sweep", daemon=True)
+            self._thread.start()
+
+    def untrack(self, channel: str):
+        with self._lock:
+            self._pipelines.pop(channel, None)
+
+    def sweep(self) -> dict:
+        """Uma varredura de todos os canais e caches. Retorna {canal ou área: bytes apagados}."""
+        with self._lock:
+            pipelines = list(self._pipelines.values())
+            caches = dict(self._caches)
+        freed = {}
+        for pipeline in pipelines:
+            try:
+                freed[pipeline.channel] = self._sweep_channel(pipeline)
+            except OSError as e:
+                logger.warning(f"[storage] Falha na retenção de {pipeline.channel}: {e}")
+        for area, cache in caches.items():
+            try:
+                freed[area] = cache.evict()
+            except OSError as e:
+                logger.warning(f"[storage] Falha na evicção de {area}: {e}")
+                continue
+            if freed[area]:
+                STORAGE_DELETED_BYTES.inc(freed[area], area=area)
+        return freed
+
+    def usage(self, channel: str = None) -> dict:
+        """
+        Uso de disco por canal: {"channels": {canal: {"audio_segments": {...}, "hls": {...}}},
+        "caches": {área: {"bytes", "files", "max_bytes"}}, "filesystems": {raiz: {"total", "used", "free"}}}.
+        """
+        channels = set()
+        for root in (audio_root(), hls_root()):
+            if os.path.isdir(root):
+                channels.update(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+        if channel is not None:
+            channels &= {channel}
+        result = {"channels": {}, "caches": {}, "filesystems": {}}
+        for name in sorted(channels):
+            result["channels"][name] = {
+                "audio_segments": dir_usage(os.path.join(audio_root(), name)),
+                "hls": dir_usage(os.path.join(hls_root(), name)),
+            }
+        roots = [audio_root(), hls_root()]
+        if channel is None:
+            with self._lock:
+                caches = dict(self._caches)
+            for area, cache in caches.items():
+                # Antes da primeira varredura do cache, percorre o diretório uma vez
+                usage = cache.usage() or dir_usage(cache.directory)
+                result["caches"][area] = dict(usage, max_bytes=cache.max_bytes)
+                roots.append(cache.directory)
+        for root in roots:
+            if os.path.isdir(root) and root not in result["filesystems"]:
+                result["filesystems"][root] = shutil.disk_usage(root)._asdict()
+        return result
+
+    # ------------------------------------------------------------ internos
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            self.sweep()
+
+    def _sweep_channel(self, pipeline) -> int:
+        config = pipeline.config
+        audio_dir = pipeline.audio_dir
+        freed = 0
+
+        # Intermediários de segmentos que todos os idiomas já publicaram
+        retained = pipeline.retained_seq()
+        if retained is not None and os.path.isdir(audio_dir):
+            limit = retained - config.keep_intermediates
+            names = os.listdir(audio_dir)
+            captured = [int(m.group(1)) for m in map(CAPTURE_RE.match, names) if m]
+            newest_capture = max(captured) if captured else None
+            for name in names:
+                match = INTERMEDIATE_RE.match(name)
+                if match is None or int(match.group(1)) > limit:
+                    continue
+                if CAPTURE_RE.match(name) and int(match.group(1)) == newest_capture:
+                    continue
+                freed += _remove(os.path.join(audio_dir, name))
+        if freed:
+            STORAGE_DELETED_BYTES.inc(freed, channel=pipeline.channel, area="intermediates")
+
+        # Janela do arquivo WAV da captura PCM e do diretório do worker antigo
+        cutoff = time.time() - config.archive_retention
+        for area in ("archive", "processed"):
+            area_freed = 0
+            path = os.path.join(audio_dir, area)
+            if not os.path.isdir(path):
+                continue
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                            area_freed += _remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+            if area_freed:
+                STORAGE_DELETED_BYTES.inc(area_freed, channel=pipeline.channel, area=area)
+            freed += area_freed
+        return freed
+
+
+def _collect() -> list:
+    usage = get_storage_manager().usage()
+    samples = []
+    for channel, areas in usage["channels"].items():
+        samples.extend(({"channel": channel, "area": area}, value["bytes"]) for area, value in areas.items())
+    samples.extend(({"area": area}, value["bytes"]) for area, value in usage["caches"].items())
+    return [("dub_storage_bytes", "gauge", "Bytes em disco por canal e área (intermediários, HLS, caches)", samples)]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = StorageManager(interval=float(os.getenv("STORAGE_SWEEP_SECONDS", "10")))
+            metrics.add_collector(_collect)
+        return _manager
@@ -0,0 +1,249 @@
+# livestream-w2-gaules/pipeline/stream_encoder.py
+
+"""
+Encoder AAC contínuo: um único ffmpeg de vida longa por canal/idioma.
+
+O worker escreve PCM dublado no stdin do ffmpeg; o ffmpeg devolve frames ADTS
+no stdout, que são agrupados em segmentos e publicados pelo LiveHLSPackager.
+Nada de spawn de ffmpeg, init de codec ou ida e volta ao disco por segmento.
+Se o ffmpeg morrer, ele é reiniciado (com backoff) e a playlist ganha uma
+descontinuidade.
+"""
+
+import subprocess
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from pipeline import metrics
+from pipeline.audio import to_pcm16
+
+ENCODER_LATENCY = metrics.histogram(
+    "dub_encoder_latency_seconds", "Do PCM escrito no ffmpeg ao frame AAC correspondente",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+ENCODER_RESTARTS = metrics.counter("dub_encoder_restarts_total", "Reinícios do ffmpeg contínuo")
+
+
+class StreamEncoder:
+    """
+    Encoder supervisionado alimentado por PCM float32 mono em sample_rate.
+
+    Latência do encoder: tempo entre entregar uma amostra ao ffmpeg e receber o
+    frame AAC que a contém (média móvel em `latency`, último valor em `last_latency`).
+    As últimas ENCODER_LOOKAHEAD amostras de cada escrita ficam retidas no encoder
+    até chegar mais áudio, então a medição usa o ponto logo antes delas.
+    """
+
+    ENCODER_LOOKAHEAD = 2048
+
+    def __init__(self, packager, sample_rate: int = 48000, segment_time: float = 4.0,
+                 bitrate: str = "128k", log_queue=None, max_backoff: float = 30.0):
+        self.packager = packager
+        self.sample_rate = sample_rate
+        self.segment_time = segment_time
+        self.bitrate = bitrate
+        self.log_queue = log_queue
+        self.max_backoff = max_backoff
+
+        self.latency = None
+        self.last_latency = None
+        self.restarts = 0
+        self._failures = 0
+
+        self._proc = None
+        self._reader = None
+        self._proc_lock = threading.Lock()
+        self._closing = False
+        self._started_at = 0.0
+
+        # (amostras acumuladas até o fim da escrita, instante da escrita)
+        self._writes = deque()
+        self._writes_lock = threading.Lock()
+        self._samples_written = 0
+        self._samples_emitted = 0
+
+        self._segment = bytearray()
+        self._segment_samples = 0
+        # LL-HLS (packager.part_target): parte em andamento
+        self._part = bytearray()
+        self._part_samples = 0
+
+    # ------------------------------------------------------------------ API
+
+    def start(self):
+        self._spawn()
+        return self
+
+    def write(self, samples: np.ndarray):
+        """Entrega amostras ao encoder. Bloqueia se o ffmpeg estiver atrasado (backpressure)."""
+        data = to_pcm16(samples)
+        for _ in range(2):
+            with self._proc_lock:
+                proc = self._proc
+                with self._writes_lock:
+                    mark = self._samples_written + max(1, len(samples) - self.ENCODER_LOOKAHEAD)
+                    self._samples_written += len(samples)
+                    self._writes.append((mark, time.monotonic()))
+                try:
+                    proc.stdin.write(data)
+                    proc.stdin.flush()
+                    return
+                except (BrokenPipeError, ValueError, OSError):
+                    pass
+            # O processo morreu no meio da escrita: espera o supervisor subir outro
+            self._wait_restart(proc)
+        raise RuntimeError("Encoder ffmpeg indisponível após reinício")
+
+    def close(self):
+        self._closing = True
+        with self._proc_lock:
+            proc = self._proc
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+        proc.wait()
+        self._reader.join(timeout=10)
+
+    def stats(self) -> dict:
+        return {
+            "pid": self._proc.pid if self._proc else None,
+            "latency": self.latency,
+            "last_latency": self.last_latency,
+            "restarts": self.restarts,
+        }
+
+    # ------------------------------------------------------------ internos
+
+    def _log(self, msg: str):
+        if self.log_queue is not None:
+            self.log_queue.put(msg)
+
+    def _spawn(self):
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(self.sample_rate), "-ac", "1", "-i", "pipe:0",
+            "-c:a", "aac", "-b:a", self.bitrate,
+            "-flush_packets", "1", "-f", "adts", "pipe:1",
+        ]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        with self._writes_lock:
+            self._writes.clear()
+            self._samples_written = 0
+            self._samples_emitted = 0
+        self._proc = proc
+        self._started_at = time.monotonic()
+        self._reader = threading.Thread(target=self._read_loop, args=(proc,), daemon=True)
+        self._reader.start()
+        self._log(f"[encoder] ffmpeg contínuo iniciado (PID {proc.pid}) para {self.packager.hls_dir}")
+
+    def _wait_restart(self, proc, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while self._proc is proc and not self._closing and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _read_loop(self, proc):
+        buf = bytearray()
+        while True:
+            chunk = proc.stdout.read1(65536)
+            if not chunk:
+                break
+            buf += chunk
+            pos = 0
+            while len(buf) - pos >= 7:
+                # Sincroniza no syncword ADTS (0xFFF)
+                if buf[pos] != 0xFF or (buf[pos + 1] & 0xF0) != 0xF0:
+                    pos += 1
+                    continue
+                length = ((buf[pos + 3] & 0x03) << 11) | (buf[pos + 4] << 3) | (buf[pos + 5] >> 5)
+                if length < 7:
+                    pos += 1
+                    continue
+                if len(buf) - pos < length:
+                    break
+                blocks = (buf[pos + 6] & 0x03) + 1
+                self._on_frame(bytes(buf[pos:pos + length]), 1024 * blocks)
+                pos += length
+            del buf[:pos]
+        self._on_exit(proc)
+
+    def _on_frame(self, frame: bytes, n_samples: int):
+        if self.packager.part_target:
+            self._on_frame_parts(frame, n_samples)
+        else:
+            limit = self.segment_time * self.sample_rate
+            if self._segment_samples and self._segment_samples + n_samples > limit:
+                self._flush_segment()
+            self._segment += frame
+            self._segment_samples += n_samples
+
+        now = time.monotonic()
+        written_at = None
+        with self._writes_lock:
+            self._samples_emitted += n_samples
+            while self._writes and self._writes[0][0] <= self._samples_emitted:
+                written_at = self._writes.popleft()[1]
+        if written_at is not None:
+            self.last_latency = now - written_at
+            ENCODER_LATENCY.observe(self.last_latency, **self.packager.labels)
+            if self.latency is None:
+                self.latency = self.last_latency
+            else:
+                self.latency = 0.9 * self.latency + 0.1 * self.last_latency
+
+    def _on_frame_parts(self, frame: bytes, n_samples: int):
+        """
+        LL-HLS: frames viram partes de até part_target segundos, publicadas assim
+        que fecham; o segmento é feito de partes inteiras e fecha antes de passar
+        de segment_time.
+        """
+        part_limit = self.packager.part_target * self.sample_rate
+        if self._part_samples and self._part_samples + n_samples > part_limit:
+            self._flush_part()
+            if self._segment_samples + part_limit > self.segment_time * self.sample_rate:
+                self._flush_segment()
+        self._part += frame
+        self._part_samples += n_samples
+
+    def _flush_part(self):
+        if not self._part_samples:
+            return
+        self.packager.publish_part(bytes(self._part), self._part_samples / self.sample_rate)
+        self._segment += self._part
+        self._segment_samples += self._part_samples
+        self._part = bytearray()
+        self._part_samples = 0
+
+    def _flush_segment(self):
+        self._flush_part()
+        if not self._segment_samples:
+            return
+        self.packager.publish_packed_audio(bytes(self._segment), self._segment_samples / self.sample_rate)
+        self._segment = bytearray()
+        self._segment_samples = 0
+        # LL-HLS (packager.part_target): parte em andamento
+        self._part = bytearray()
+        self._part_samples = 0
+
+    def _on_exit(self, proc):
+        self._flush_segment()
+        code = proc.wait()
+        if self._closing:
+            return
+
+        # Backoff exponencial; zera se o processo ficou de pé por um bom tempo
+        if time.monotonic() - self._started_at > 60:
+            self._failures = 0
+        self._failures += 1
+        self.restarts += 1
+        ENCODER_RESTARTS.inc(**self.packager.labels)
+        delay = min(self.max_backoff, 0.5 * 2 ** (self._failures - 1))
+        self._log(f"[encoder] ffmpeg saiu com código {code}; reiniciando em {delay:.1f}s")
+        time.sleep(delay)
+        self.packager.mark_discontinuity()
+        with self._proc_lock:
+            if not self._closing:
+                self._spawn()
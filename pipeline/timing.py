@@ -0,0 +1,152 @@
+# livestream-w2-gaules/pipeline/timing.py
+
+"""
+Casamento de duração do áudio dublado com o segmento original.
+
+O TTS quase nunca devolve um trecho com a duração exata do segmento de
+origem; publicados um após o outro, os trechos fazem a faixa dublada derivar
+segundos por minuto em relação ao vídeo. Cada ramo de idioma tem um
+DurationMatcher que, em duas etapas:
+
+1. stretch() (estágio tts, em paralelo): acelera ou desacelera a fala com
+   WSOLA em NumPy (muda a duração sem mudar o tom) em direção à duração do
+   segmento menos a deriva acumulada, dentro de [max_slowdown, max_speedup];
+2. place() (estágio package, na ordem): completa com silêncio o que ficou
+   curto ou, se a deriva passaria de max_drift, corta o excesso (com fade),
+   e contabiliza a deriva: segundos publicados - segundos da origem.
+
+A deriva positiva que sobra (fala que não coube nem acelerada) é compensada
+nos trechos seguintes, que miram uma duração menor. O áudio original
+(segmentos sem fala ou canal atrasado) não é esticado, só completado/cortado.
+
+Métricas: dub_timing_stretch_ratio, dub_timing_drift_seconds e
+dub_timing_adjustments_total{action=stretch|pad|trim}.
+"""
+
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from pipeline import metrics
+
+TIMING_STRETCH = metrics.histogram(
+    "dub_timing_stretch_ratio", "Fator de tempo aplicado ao áudio dublado (>1 acelera)",
+    buckets=(0.8, 0.9, 0.95, 1.0, 1.05, 1.1, 1.2, 1.3, 1.5),
+)
+TIMING_DRIFT = metrics.gauge("dub_timing_drift_seconds",
+                             "Deriva acumulada da faixa dublada em relação à linha do tempo original")
+TIMING_ADJUSTMENTS = metrics.counter("dub_timing_adjustments_total", "Ajustes de duração do áudio dublado, por ação")
+
+FADE_SECONDS = 0.01
+
+
+def time_stretch(samples: np.ndarray, rate: float, sample_rate: int,
+                 frame_seconds: float = 0.04, tolerance_seconds: float = 0.01) -> np.ndarray:
+    """
+    WSOLA: devolve ~len(samples)/rate amostras com o mesmo tom (rate > 1 acelera).
+
+    Quadros de frame_seconds com janela de Hann e 50% de sobreposição na
+    saída; cada quadro é lido da entrada na posição nominal ± tolerance_seconds,
+    onde melhor continua o quadro anterior (correlação calculada em ~8 kHz,
+    vetorizada sobre todos os deslocamentos candidatos).
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    frame = int(sample_rate * frame_seconds) // 2 * 2
+    if abs(rate - 1.0) < 1e-3 or frame < 4 or len(samples) < 2 * frame:
+        return samples
+    hop = frame // 2
+    tolerance = int(sample_rate * tolerance_seconds)
+    step = max(1, sample_rate // 8000)
+    n_out = int(round(len(samples) / rate))
+    n_frames = max(1, -(-(n_out - frame) // hop) + 1)
+
+    # Margens de silêncio para os candidatos fora do áudio nas pontas
+    padded = np.concatenate([np.zeros(tolerance, np.float32), samples,
+                             np.zeros(frame + 2 * tolerance + hop + int(hop * rate) + 1, np.float32)])
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+    out = np.zeros((n_frames - 1) * hop + frame, np.float32)
+    weight = np.zeros_like(out)
+
+    previous = tolerance
+    for k in range(n_frames):
+        nominal = tolerance + int(round(k * hop * rate))
+        if k == 0:
+            position = nominal
+        else:
+            # Continuação natural do quadro anterior vs. candidatos em torno da posição nominal
+            reference = padded[previous + hop:previous + hop + frame:step]
+            region = padded[nominal - tolerance:nominal + tolerance + frame]
+            candidates = sliding_window_view(region, frame)[::step, ::step]
+            position = nominal - tolerance + int(np.argmax(candidates @ reference)) * step
+        start = k * hop
+        out[start:start + frame] += padded[position:position + frame] * window
+        weight[start:start + frame] += window
+        previous = position
+
+    out = np.divide(out, weight, out=out, where=weight > 1e-3)
+    return out[:n_out]
+
+
+class DurationMatcher:
+    """
+    Duração e deriva da faixa dublada de um ramo (canal, idioma). stretch()
+    pode ser chamado de várias threads; place() deve ser chamado na ordem de
+    publicação (estágio package, worker único).
+    """
+
+    def __init__(self, max_speedup: float = 1.25, max_slowdown: float = 0.9, max_drift: float = 0.5,
+                 labels: dict = None):
+        self.max_speedup = max_speedup
+        self.max_slowdown = max_slowdown
+        self.max_drift = max_drift
+        self.labels = labels or {}
+        self.drift = 0.0  # segundos publicados a mais que a origem
+        self._lock = threading.Lock()
+        TIMING_DRIFT.set(0.0, **self.labels)
+
+    def stretch(self, samples: np.ndarray, sample_rate: int, source_seconds: float) -> np.ndarray:
+        """Aproxima a fala da duração do segmento (menos a deriva atual), dentro dos limites."""
+        with self._lock:
+            target = source_seconds - max(self.drift, 0.0)
+        if len(samples) == 0 or target <= 0:
+            return samples
+        rate = min(max(len(samples) / sample_rate / target, self.max_slowdown), self.max_speedup)
+        TIMING_STRETCH.observe(rate, **self.labels)
+        if abs(rate - 1.0) < 0.01:
+            return samples
+        TIMING_ADJUSTMENTS.inc(action="stretch", **self.labels)
+        return time_stretch(samples, rate, sample_rate)
+
+    def place(self, samples: np.ndarray, sample_rate: int, source_seconds: float) -> np.ndarray:
+        """
+        Completa com silêncio ou corta o trecho para que a faixa dublada volte
+        à linha do tempo da origem (deriva entre 0 e max_drift) e atualiza a deriva.
+        """
+        with self._lock:
+            drift = self.drift
+        target = int(round((source_seconds - drift) * sample_rate))
+        limit = target + int(self.max_drift * sample_rate)
+        n = len(samples)
+        if n < target:
+            samples = np.concatenate([samples, np.zeros(target - n, dtype=np.float32)])
+            TIMING_ADJUSTMENTS.inc(action="pad", **self.labels)
+        elif n > limit:
+            samples = np.array(samples[:max(limit, 0)], dtype=np.float32)
+            fade = min(len(samples), int(FADE_SECONDS * sample_rate))
+            if fade:
+                samples[-fade:] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)
+            TIMING_ADJUSTMENTS.inc(action="trim", **self.labels)
+        with self._lock:
+            self.drift = drift + len(samples) / sample_rate - source_seconds
+            TIMING_DRIFT.set(self.drift, **self.labels)
+        return samples
+
+    def reset(self):
+        """Quebra na linha do tempo (segmentos descartados): a deriva recomeça do zero."""
+        with self._lock:
+            self.drift = 0.0
+        TIMING_DRIFT.set(0.0, **self.labels)
+
+    def close(self):
+        TIMING_DRIFT.remove(**self.labels)
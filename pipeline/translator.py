@@ -0,0 +1,294 @@
+# livestream-w2-gaules/pipeline/translator.py
+
+"""
+Camada de tradução compartilhada por todos os canais e idiomas.
+
+- Uma sessão HTTP com pool de conexões (keep-alive) para o DeepL, em vez de
+  um DeeplTranslator novo por segmento.
+- As frases de vários segmentos pendentes são agrupadas em uma única chamada
+  (a API do DeepL aceita vários `text` por requisição): quem chama translate()
+  espera no máximo `linger` segundos para o lote encher. Até `workers` lotes
+  ficam em voo ao mesmo tempo (um pool de threads do tamanho do pool de
+  conexões): um idioma lento ou uma chamada com retry não segura os outros.
+- Cache LRU com TTL chaveado por (origem, destino, texto normalizado): bordões
+  de caster, "vamo", "que isso" e nomes de jogadores não são pagos de novo.
+  Opcionalmente persistido em disco entre reinícios.
+- O backend é trocável: FakeTranslateBackend permite testar e medir offline.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pipeline import metrics
+
+TRANSLATE_REQUEST_SECONDS = metrics.histogram("dub_translate_request_seconds", "Latência de cada chamada ao backend de tradução")
+TRANSLATE_BATCH_TEXTS = metrics.histogram(
+    "dub_translate_batch_texts", "Frases distintas por chamada ao backend de tradução",
+    buckets=(1, 2, 5, 10, 20, 50),
+)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def split_sentences(text: str) -> list:
+    return [s for s in (p.strip() for p in _SENTENCE_RE.split(text)) if s]
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class DeepLBackend:
+    """Cliente REST do DeepL (v2/translate) com sessão e retries."""
+
+    def __init__(self, api_key: str = None, timeout: float = 10.0, pool_size: int = 8):
+        self.api_key = api_key or os.getenv("DEEPL_API_KEY")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        free = (self.api_key or "").endswith(":fx")
+        self.url = "https://api-free.deepl.com/v2/translate" if free else "https://api.deepl.com/v2/translate"
+
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["POST"]))
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+
+    def translate_batch(self, texts: list, source: str, target: str) -> list:
+        if not self.api_key:
+            raise ValueError("DEEPL_API_KEY não encontrada no ambiente.")
+        data = {"text": texts, "target_lang": target.upper()}
+        if source and source != "auto":
+            data["source_lang"] = source.upper()
+        response = self.session.post(
+            self.url,
+            data=data,
+            headers={"Authorization": f"DeepL-Auth-Key {self.api_key}"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return [t["text"] for t in response.json()["translations"]]
+
+
+class FakeTranslateBackend:
+    """Backend local para testes e benchmarks: latência configurável, sem rede."""
+
+    def __init__(self, latency: float = 0.0, per_text_latency: float = 0.0):
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self.texts = 0
+
+    def translate_batch(self, texts: list, source: str, target: str) -> list:
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        self.calls += 1
+        self.texts += len(texts)
+        return [f"[{target}] {text}" for text in texts]
+
+
+class PhraseCache:
+    """LRU + TTL, thread-safe, com persistência opcional em JSON."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 7 * 24 * 3600, path: str = None,
+                 save_every: int = 50):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # chave -> (tradução, instante de inserção)
+        self._lock = threading.Lock()
+        self._dirty = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def key(source: str, target: str, text: str) -> str:
+        return f"{source}|{target}|{normalize(text)}"
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty += 1
+            should_save = self.path and self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+            self._dirty = 0
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (value, inserted) in items[-self.max_entries:]:
+            if now - inserted <= self.ttl:
+                self._entries[key] = (value, inserted)
+
+
+class Translator:
+    def __init__(self, backend, cache: PhraseCache = None, max_batch: int = 50, linger: float = 0.05,
+                 workers: int = None):
+        self.backend = backend
+        self.cache = cache or PhraseCache()
+        self.max_batch = max_batch
+        self.linger = linger
+        # Lotes em voo: por padrão, um por conexão do pool do backend
+        self.workers = workers or getattr(backend, "pool_size", 4)
+        self.requests = 0
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()  # (source, target) -> [(texto, Future)]
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="translate")
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+        metrics.add_collector(self._collect)
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        """Traduz text frase a frase: cache primeiro, o resto vai no próximo lote."""
+        sentences = split_sentences(text)
+        results = []
+        for sentence in sentences:
+            cached = self.cache.get(PhraseCache.key(source, target, sentence))
+            if cached is not None:
+                results.append(cached)
+            else:
+                results.append(self._enqueue(sentence, source, target))
+        return " ".join(r.result() if isinstance(r, Future) else r for r in results)
+
+    def _enqueue(self, sentence: str, source: str, target: str) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.setdefault((source, target), []).append((sentence, future))
+            self._cond.notify_all()
+        return future
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                # Com todos os workers ocupados, as frases seguem acumulando no lote
+                while not self._pending or self._in_flight >= self.workers:
+                    self._cond.wait()
+                # Dá um tempo curto para frases de outros segmentos entrarem no mesmo lote
+                deadline = time.monotonic() + self.linger
+                while time.monotonic() < deadline:
+                    if any(len(items) >= self.max_batch for items in self._pending.values()):
+                        break
+                    self._cond.wait(deadline - time.monotonic())
+                (source, target), items = next(iter(self._pending.items()))
+                batch, rest = items[:self.max_batch], items[self.max_batch:]
+                if rest:
+                    self._pending[(source, target)] = rest
+                    self._pending.move_to_end((source, target))
+                else:
+                    del self._pending[(source, target)]
+                self._in_flight += 1
+            self._executor.submit(self._send, batch, source, target)
+
+    def _send(self, batch: list, source: str, target: str):
+        """Executa no pool: uma chamada ao backend e entrega das traduções do lote."""
+        try:
+            self._send_batch(batch, source, target)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _send_batch(self, batch: list, source: str, target: str):
+        # Frases repetidas dentro do lote vão uma vez só
+        unique = list(OrderedDict.fromkeys(sentence for sentence, _ in batch))
+        started = time.perf_counter()
+        try:
+            translated = self.backend.translate_batch(unique, source, target)
+        except Exception as e:
+            TRANSLATE_REQUEST_SECONDS.observe(time.perf_counter() - started, target=target, result="error")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._cond:
+            self.requests += 1
+        TRANSLATE_REQUEST_SECONDS.observe(time.perf_counter() - started, target=target, result="ok")
+        TRANSLATE_BATCH_TEXTS.observe(len(unique))
+        by_text = dict(zip(unique, translated))
+        for sentence, value in by_text.items():
+            self.cache.put(PhraseCache.key(source, target, sentence), value)
+        for sentence, future in batch:
+            future.set_result(by_text[sentence])
+
+    def _collect(self) -> list:
+        stats = self.stats()
+        return [
+            ("dub_translate_cache_hits_total", "counter", "Frases servidas pelo cache de tradução", [({}, stats["cache_hits"])]),
+            ("dub_translate_cache_misses_total", "counter", "Frases que foram ao backend de tradução",
+             [({}, stats["cache_misses"])]),
+            ("dub_translate_cache_entries", "gauge", "Entradas no cache de frases", [({}, stats["cache_entries"])]),
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_entries": len(self.cache._entries),
+        }
+
+
+_translator = None
+_translator_lock = threading.Lock()
+
+
+def get_translator() -> Translator:
+    """
+    Tradutor único do processo. TRANSLATE_BACKEND=fake usa o backend local;
+    TRANSLATION_CACHE_PATH persiste o cache de frases em disco; TRANSLATE_WORKERS
+    limita as chamadas simultâneas ao backend.
+    """
+    global _translator
+    with _translator_lock:
+        if _translator is None:
+            workers = int(os.getenv("TRANSLATE_WORKERS", "8"))
+            if os.getenv("TRANSLATE_BACKEND", "deepl") == "fake":
+                backend = FakeTranslateBackend(latency=float(os.getenv("FAKE_TRANSLATE_LATENCY", "0")))
+            else:
+                backend = DeepLBackend(pool_size=workers)
+            cache = PhraseCache(
+                max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000")),
+                ttl=float(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600))),
+                path=os.getenv("TRANSLATION_CACHE_PATH"),
+            )
+            _translator = Translator(backend, cache, workers=workers)
+        return _translator
@@ -0,0 +1,352 @@
+# livestream-w2-gaules/pipeline/tts_client.py
+
+"""
+Cliente TTS assíncrono (Speechify) compartilhado por todos os ramos de idioma.
+
+- Um único event loop asyncio numa thread própria, com uma aiohttp.ClientSession
+  e pool de conexões keep-alive: sem handshake TLS a cada segmento.
+- Limite de concorrência (semáforo) para não estourar o rate limit da API.
+- Timeout por tentativa e retries com backoff exponencial e jitter total em
+  erros transitórios (timeout, conexão, 429, 5xx). 4xx restantes não são
+  repetidos.
+- Hedging opcional: se a tentativa passar de `hedge_after` segundos, dispara
+  uma segunda em paralelo e fica com a que terminar primeiro (corta a cauda
+  de latência).
+- Cache em disco por (voice id, texto): bordões repetidos não voltam à rede.
+  Limitado por tamanho e idade (TTS_CACHE_MAX_MB, TTS_CACHE_MAX_AGE): a
+  varredura do StorageManager apaga os menos usados recentemente.
+- SPEECHIFY_API_URL permite apontar para o mock local (pipeline/mock_tts_server.py).
+
+As threads dos estágios chamam synthesize(), que bloqueia só a thread chamadora.
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from base64 import b64decode
+
+import aiohttp
+
+from pipeline import metrics
+from pipeline.storage import get_storage_manager
+
+DEFAULT_API_URL = "https://api.sws.speechify.com/v1/tts/audio"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+TTS_REQUEST_SECONDS = metrics.histogram("dub_tts_request_seconds", "Latência de cada requisição ao TTS")
+TTS_SYNTHESIS_SECONDS = metrics.histogram(
+    "dub_tts_synthesis_seconds", "Latência da síntese vista pelo chamador (com retries e hedging)"
+)
+
+
+class TTSError(Exception):
+    """Falha definitiva na síntese (esgotou os retries ou erro não transitório)."""
+
+
+class _TransientError(Exception):
+    pass
+
+
+class TTSAudioCache:
+    """
+    Áudios sintetizados em disco, um arquivo por (voz, texto). O mtime marca o
+    último uso; evict() apaga os mais velhos que max_age e, acima de max_bytes,
+    os usados há mais tempo até voltar ao limite.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = None, max_age: float = None,
+                 rescan_interval: float = 3600.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.rescan_interval = rescan_interval
+        self.hits = 0
+        self.misses = 0
+        self._bytes = None  # tamanho da última varredura + o que entrou desde então
+        self._files = 0
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, voice_id: str, text: str) -> str:
+        digest = hashlib.sha256(f"{voice_id}\0{text.strip()}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".audio")
+
+    def get(self, voice_id: str, text: str):
+        try:
+            with open(self.path(voice_id, text), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(self.path(voice_id, text))  # uso recente: último a sair na evicção
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, voice_id: str, text: str, data: bytes):
+        path = self.path(voice_id, text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data)
+                self._files += 1
+
+    def usage(self) -> dict:
+        """{"bytes", "files"} da última varredura (mais o que entrou depois); None antes da primeira."""
+        with self._lock:
+            if self._bytes is None:
+                return None
+            return {"bytes": self._bytes, "files": self._files}
+
+    def evict(self) -> int:
+        """
+        Chamado pela varredura do StorageManager. Só percorre o diretório se
+        passou do limite de tamanho ou a cada rescan_interval. Retorna os bytes apagados.
+        """
+        now = time.time()
+        with self._lock:
+            over = self.max_bytes is not None and self._bytes is not None and self._bytes > self.max_bytes
+            if not over and self._bytes is not None and now - self._scanned_at < self.rescan_interval:
+                return 0
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".audio"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        freed = removed = 0
+        for mtime, size, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (self.max_bytes is None or total - freed <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+            removed += 1
+        with self._lock:
+            self._bytes = total - freed
+            self._files = len(entries) - removed
+            self._scanned_at = now
+        return freed
+
+
+class TTSClient:
+    def __init__(self, api_key: str = None, api_url: str = None, concurrency: int = 4,
+                 timeout: float = 15.0, retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 hedge_after: float = None, cache_dir: str = None, cache_max_bytes: int = None,
+                 cache_max_age: float = None):
+        self.api_key = api_key or os.getenv("SPEECHIFY_API_KEY")
+        self.api_url = api_url or os.getenv("SPEECHIFY_API_URL", DEFAULT_API_URL)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.cache = None
+        if cache_dir:
+            self.cache = TTSAudioCache(cache_dir, max_bytes=cache_max_bytes, max_age=cache_max_age)
+            get_storage_manager().add_cache("tts_cache", self.cache)
+
+        self.requests = 0
+        self.retried = 0
+        self.hedged = 0
+        self.failures = 0
+        self.latency = None  # EWMA da síntese que chegou (s)
+        self._inflight = {}  # (voz, texto) -> Future de uma síntese em andamento
+
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        threading.Thread(target=self._run_loop, name="tts-client", daemon=True).start()
+        self._ready.wait()
+        metrics.add_collector(self._collect)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector)
+        self._ready.set()
+        self._loop.run_forever()
+
+    # ------------------------------------------------------------ API síncrona
+
+    def synthesize(self, text: str, voice_id: str) -> bytes:
+        """Devolve o áudio (bytes) de text na voz voice_id. Levanta TTSError."""
+        return asyncio.run_coroutine_threadsafe(self.synthesize_async(text, voice_id), self._loop).result()
+
+    def close(self):
+        async def _close():
+            await self._session.close()
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "failures": self.failures,
+            "cache_hits": self.cache.hits if self.cache else 0,
+            "cache_misses": self.cache.misses if self.cache else 0,
+            "latency": self.latency,
+        }
+
+    def _collect(self) -> list:
+        stats = self.stats()
+        return [
+            ("dub_tts_retries_total", "counter", "Retentativas de síntese", [({}, stats["retried"])]),
+            ("dub_tts_hedged_total", "counter", "Requisições de síntese duplicadas por hedging", [({}, stats["hedged"])]),
+            ("dub_tts_failures_total", "counter", "Sínteses que falharam de vez", [({}, stats["failures"])]),
+            ("dub_tts_cache_hits_total", "counter", "Sínteses servidas pelo cache em disco", [({}, stats["cache_hits"])]),
+            ("dub_tts_cache_misses_total", "counter", "Sínteses que foram à rede", [({}, stats["cache_misses"])]),
+        ]
+
+    # ------------------------------------------------------------ async
+
+    async def synthesize_async(self, text: str, voice_id: str) -> bytes:
+        if self.cache is not None:
+            data = self.cache.get(voice_id, text)
+            if data is not None:
+                return data
+
+        # A mesma frase pedida por vários ramos ao mesmo tempo vai à rede uma vez só
+        key = (voice_id, text.strip())
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        self._inflight[key] = self._loop.create_future()
+        try:
+            data = await self._synthesize_uncached(text, voice_id)
+        except Exception as e:
+            waiter = self._inflight.pop(key)
+            waiter.set_exception(e)
+            waiter.exception()  # sem outros interessados o erro não deve virar aviso do asyncio
+            raise
+        self._inflight.pop(key).set_result(data)
+        return data
+
+    async def _synthesize_uncached(self, text: str, voice_id: str) -> bytes:
+        started = time.monotonic()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                # Jitter total: espalha os retries de vários ramos no tempo
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            try:
+                data = await self._hedged(text, voice_id)
+                break
+            except _TransientError as e:
+                last_error = e
+            except TTSError:
+                self.failures += 1
+                raise
+        else:
+            self.failures += 1
+            raise TTSError(f"síntese falhou após {self.retries + 1} tentativas: {last_error}")
+
+        elapsed = time.monotonic() - started
+        TTS_SYNTHESIS_SECONDS.observe(elapsed)
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        if self.cache is not None:
+            await self._loop.run_in_executor(None, self.cache.put, voice_id, text, data)
+        return data
+
+    async def _hedged(self, text: str, voice_id: str) -> bytes:
+        if not self.hedge_after:
+            return await self._request(text, voice_id)
+
+        first = asyncio.ensure_future(self._request(text, voice_id))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        tasks = {first, asyncio.ensure_future(self._request(text, voice_id))}
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in tasks:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def _request(self, text: str, voice_id: str) -> bytes:
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = {"voiceId": voice_id, "input": text}
+        async with self._semaphore:
+            self.requests += 1
+            started = time.monotonic()
+            result = "error"
+            try:
+                async with self._session.post(self.api_url, json=payload, headers=headers,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                    result = str(response.status)
+                    if response.status in RETRY_STATUSES:
+                        raise _TransientError(f"HTTP {response.status}")
+                    if response.status != 200:
+                        raise TTSError(f"Speechify ({response.status}): {await response.text()}")
+                    body = await response.json(content_type=None)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                result = type(e).__name__
+                raise _TransientError(f"{type(e).__name__}: {e}") from e
+            except asyncio.CancelledError:
+                result = "cancelled"  # perdeu a corrida do hedging
+                raise
+            finally:
+                TTS_REQUEST_SECONDS.observe(time.monotonic() - started, result=result)
+
+        audio_data = body.get("audioData")
+        if not audio_data:
+            raise TTSError("resposta Speechify sem campo audioData")
+        return b64decode(audio_data)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_tts_client() -> TTSClient:
+    """
+    Cliente TTS único do processo, configurado por env: SPEECHIFY_API_URL,
+    TTS_CONCURRENCY, TTS_TIMEOUT, TTS_RETRIES, TTS_HEDGE_AFTER, TTS_CACHE_DIR
+    (vazio desliga o cache em disco), TTS_CACHE_MAX_MB e TTS_CACHE_MAX_AGE
+    (segundos; 0 desliga o limite).
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            hedge_after = os.getenv("TTS_HEDGE_AFTER")
+            _client = TTSClient(
+                concurrency=int(os.getenv("TTS_CONCURRENCY", "4")),
+                timeout=float(os.getenv("TTS_TIMEOUT", "15")),
+                retries=int(os.getenv("TTS_RETRIES", "3")),
+                hedge_after=float(hedge_after) if hedge_after else None,
+                cache_dir=os.getenv("TTS_CACHE_DIR", "tts_cache") or None,
+                cache_max_bytes=int(float(os.getenv("TTS_CACHE_MAX_MB", "1024")) * 1024 * 1024) or None,
+                cache_max_age=float(os.getenv("TTS_CACHE_MAX_AGE", str(30 * 24 * 3600))) or None,
+            )
+        return _client
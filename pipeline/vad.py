@@ -0,0 +1,164 @@
+# livestream-w2-gaules/pipeline/vad.py
+
+"""
+Portão de atividade de voz (VAD) antes do ASR.
+
+Telas de loading, intervalos e trechos só de música produzem texto vazio ou
+alucinado do Whisper, que ainda pagaríamos para traduzir e sintetizar. O
+portão analisa o segmento inteiro de uma vez, vetorizado em NumPy (alguns ms
+para 10 s de áudio), com três medidas por quadro de 30 ms:
+
+- energia (dBFS), comparada ao piso de ruído: o percentil baixo do segmento,
+  limitado a floor_cap_db, para que música ou ruído contínuos do jogo não
+  virem o "piso" e escondam a fala por cima deles;
+- fração da energia na banda de voz (300-3400 Hz);
+- planura espectral (ruído é plano, voz tem harmônicos).
+
+E o ritmo silábico: a modulação (dB) entre 2 e 8 Hz do envelope da banda de
+1-3,4 kHz (F2/F3 das vogais), medida em janelas de 1 s e ficando com a
+maior. Fala liga e desliga várias vezes por segundo nessa banda; música
+sustentada e ruído quase não modulam. Uma pausa longa no segmento não dilui
+a medida, e fala sobre o áudio do jogo continua modulando.
+
+Na dúvida (só uma das evidências), o segmento segue para o ASR: só é
+descartado o que é claramente silêncio, música ou ruído. Segmentos sem voz
+pulam ASR, tradução e TTS e vão direto ao empacotamento (áudio original ou
+silêncio).
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+_EPS = 1e-10
+
+
+class VADResult:
+    def __init__(self, is_speech: bool, speech_ratio: float, modulation: float, level_db: float, reason: str):
+        self.is_speech = is_speech
+        self.speech_ratio = speech_ratio  # fração dos quadros classificados como voz
+        self.modulation = modulation  # modulação silábica (dB) da melhor janela
+        self.level_db = level_db  # nível RMS do segmento (dBFS)
+        self.reason = reason
+
+    def __str__(self):
+        kind = "voz" if self.is_speech else f"sem voz ({self.reason})"
+        return (f"{kind}: {self.speech_ratio:.0%} dos quadros, modulação {self.modulation:.1f} dB, "
+                f"nível {self.level_db:.0f} dBFS")
+
+
+class VADGate:
+    def __init__(self, frame_ms: float = 30.0, silence_db: float = -55.0, margin_db: float = 6.0,
+                 floor_cap_db: float = -50.0, min_band_ratio: float = 0.4, max_flatness: float = 0.4,
+                 min_speech_ratio: float = 0.05, min_modulation: float = 10.0, window_seconds: float = 1.0):
+        self.frame_ms = frame_ms
+        self.silence_db = silence_db
+        self.margin_db = margin_db
+        self.floor_cap_db = floor_cap_db
+        self.min_band_ratio = min_band_ratio
+        self.max_flatness = max_flatness
+        self.min_speech_ratio = min_speech_ratio
+        self.min_modulation = min_modulation  # dB; abaixo da metade, claramente sem ritmo de fala
+        self.window_seconds = window_seconds
+
+        self.segments = 0
+        self.skipped = 0
+        self.skipped_seconds = 0.0
+        self.gate_seconds = 0.0  # tempo gasto no próprio portão
+        self._lock = threading.Lock()
+
+    def analyze(self, samples: np.ndarray, sr: int) -> VADResult:
+        started = time.perf_counter()
+        result = self._analyze(np.asarray(samples, dtype=np.float32), sr)
+        with self._lock:
+            self.segments += 1
+            self.gate_seconds += time.perf_counter() - started
+            if not result.is_speech:
+                self.skipped += 1
+                self.skipped_seconds += len(samples) / sr
+        return result
+
+    def _analyze(self, samples: np.ndarray, sr: int) -> VADResult:
+        frame = max(1, int(sr * self.frame_ms / 1000))
+        n = len(samples) // frame
+        level_db = 10 * np.log10(np.mean(samples.astype(np.float64) ** 2) + _EPS) if len(samples) else -100.0
+        if n < 4 or level_db < self.silence_db:
+            return VADResult(False, 0.0, 0.0, level_db, "silêncio")
+
+        frames = samples[:n * frame].reshape(n, frame)
+        energy_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + _EPS)
+
+        spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame), axis=1)) ** 2
+        freqs = np.fft.rfftfreq(frame, 1.0 / sr)
+        total = spectrum.sum(axis=1) + _EPS
+        band = (freqs >= 300) & (freqs <= 3400)
+        band_ratio = spectrum[:, band].sum(axis=1) / total
+        voice = spectrum[:, (freqs >= 100) & (freqs <= 4000)] + _EPS
+        flatness = np.exp(np.mean(np.log(voice), axis=1)) / np.mean(voice, axis=1)
+
+        # Piso de ruído do segmento, mas nunca acima de floor_cap_db (fundo contínuo)
+        # nem o limiar abaixo do silêncio absoluto
+        floor = min(np.percentile(energy_db, 10), self.floor_cap_db)
+        active = energy_db > max(floor + self.margin_db, self.silence_db)
+        speech = active & (band_ratio >= self.min_band_ratio) & (flatness <= self.max_flatness)
+        speech_ratio = float(speech.mean())
+        modulation = self._modulation(spectrum[:, (freqs >= 1000) & (freqs <= 3400)].sum(axis=1), total, active)
+
+        voiced = speech_ratio >= self.min_speech_ratio
+        if not voiced and modulation < self.min_modulation:
+            return VADResult(False, speech_ratio, modulation, level_db, "sem quadros de voz")
+        if voiced and modulation < self.min_modulation / 2:
+            return VADResult(False, speech_ratio, modulation, level_db, "sem ritmo de fala (música/ruído)")
+        # Inclui os casos incertos (só uma das evidências): melhor transcrever que perder fala
+        return VADResult(True, speech_ratio, modulation, level_db, "voz")
+
+    def _modulation(self, band_energy: np.ndarray, total_energy: np.ndarray, active: np.ndarray) -> float:
+        """
+        Maior modulação (RMS em dB, 2-8 Hz) do envelope entre as janelas de
+        window_seconds (passo de meia janela) com maioria de quadros ativos.
+        """
+        n = len(band_energy)
+        size = min(n, max(4, int(self.window_seconds * 1000 / self.frame_ms)))
+        hop = max(1, size // 2)
+        # Quedas abaixo de 20 dB do pico (pausas) contam como 20 dB, e a banda só conta
+        # quando tem parte relevante da energia do quadro (vazamento de música grave não)
+        envelope = 10 * np.log10(np.maximum(band_energy, total_energy * 1e-3) + _EPS)
+        envelope = np.maximum(envelope, envelope.max() - 20.0)
+        # Mediana de 3 quadros: cliques e transientes isolados não são sílabas (5-10 quadros)
+        padded = np.pad(envelope, 1, mode="edge")
+        envelope = np.median(np.stack([padded[:-2], padded[1:-1], padded[2:]]), axis=0)
+        taper = np.hanning(size)
+        freqs = np.fft.rfftfreq(size, self.frame_ms / 1000)
+        syllabic = (freqs >= 2) & (freqs <= 8)
+        best = 0.0
+        for start in range(0, n - size + 1, hop):
+            if active[start:start + size].mean() < 0.5:
+                continue
+            window = envelope[start:start + size]
+            mod = np.abs(np.fft.rfft((window - window.mean()) * taper)) ** 2
+            best = max(best, float(np.sqrt(2 * mod[syllabic].sum() / (taper ** 2).sum())))
+        return best
+
+    @classmethod
+    def from_env(cls):
+        """VAD_ENABLED=0 desliga o portão; VAD_MIN_SPEECH ajusta a fração mínima de quadros de voz."""
+        if os.getenv("VAD_ENABLED", "1") == "0":
+            return None
+        return cls(min_speech_ratio=float(os.getenv("VAD_MIN_SPEECH", "0.05")))
+
+    def stats(self, asr_rtf: float = None) -> dict:
+        """
+        Contadores do portão. Com o RTF do ASR (compute / áudio), estima quanto
+        tempo de inferência foi economizado.
+        """
+        with self._lock:
+            stats = {
+                "segments": self.segments,
+                "skipped": self.skipped,
+                "skipped_seconds": self.skipped_seconds,
+                "gate_seconds": self.gate_seconds,
+            }
+        stats["saved_asr_seconds"] = self.skipped_seconds * asr_rtf if asr_rtf is not None else None
+        return stats
@@ -0,0 +1,459 @@
+# livestream-w2-gaules/pipeline/vod.py
+
+"""
+Dublagem em lote de transmissões gravadas (VOD/backfill).
+
+O caminho ao vivo processa um segmento por vez no ritmo da captura; aqui o
+arquivo inteiro já existe, então:
+
+1. decode: o ffmpeg converte a fonte (arquivo local ou URL que o ffmpeg
+   leia) uma vez para PCM float32 48 kHz mono em work/source.f32, lido
+   depois via memmap;
+2. segmentação: SpeechSegmenter (capture/segmenter.py) corta nas pausas da
+   fala, em trechos maiores que os do ao vivo (padrão ~20 s, até 28 s: o
+   Whisper decodifica sempre janelas de 30 s);
+3. dublagem: `concurrency` threads pegam os trechos; o ASRService os
+   decodifica em lote no pool de processos (no máximo `asr_slots` trechos no
+   pool de uma vez, para não tomar os processos dos canais ao vivo), o
+   Translator junta as frases de trechos diferentes no mesmo pedido e o TTS
+   roda com a concorrência do cliente. A fala sintetizada é esticada
+   (pipeline/timing.py) e gravada por trecho;
+4. saída: uma única passada do ffmpeg por idioma, alimentada com o PCM dos
+   trechos na ordem (duração casada com a origem), gera {lang}.mp4 (com o
+   vídeo da fonte copiado, se houver) ou {lang}/index.m3u8 (HLS VOD). Com a
+   saída pronta, work/source.f32 (~690 MB por hora) é apagado.
+
+Progresso retomável: cada etapa grava o resultado em work/ (manifest.json,
+chunks/NNNNN.json com a transcrição, chunks/NNNNN_{lang}.wav com a fala);
+rodar de novo o mesmo job pula o que já está pronto (o PCM da fonte é
+decodificado de novo se já tinha sido apagado). A vazão é reportada em
+horas de áudio por hora de relógio (só o que foi processado nesta execução).
+
+Uso:
+    python -m pipeline.vod gravacao.mp4 --langs en,es
+    python -m pipeline.vod gravacao.mkv --langs en --format hls --output vod/gaules-0412
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from capture.segmenter import SpeechSegmenter
+from pipeline import metrics
+from pipeline.asr_service import get_asr_service
+from pipeline.audio import decode_audio_bytes, read_wav, resample, to_pcm16
+from pipeline.config import channel_config
+from pipeline.job_queue import remote_asr_service, remote_tts_client
+from pipeline.timing import DurationMatcher
+from pipeline.translator import get_translator
+from pipeline.tts_client import get_tts_client
+
+logger = logging.getLogger("vod")
+
+SAMPLE_RATE = 48000
+ASR_SAMPLE_RATE = 16000
+
+VOD_AUDIO_SECONDS = metrics.counter("dub_vod_audio_seconds_total", "Segundos de áudio de VOD dublados, por job")
+VOD_CHUNK_ERRORS = metrics.counter("dub_vod_chunk_errors_total", "Trechos de VOD que falharam (refeitos ao retomar)")
+
+FINISHED_STATES = ("done", "incomplete", "failed")
+
+
+def vod_root() -> str:
+    """Onde ficam os jobs de VOD (VOD_DIR, padrão "vod")."""
+    return os.getenv("VOD_DIR", "vod")
+
+
+def job_id_for(source: str) -> str:
+    """Id estável a partir da fonte: o mesmo arquivo/URL cai no mesmo job (e retoma)."""
+    stem = os.path.splitext(os.path.basename(source.rstrip("/").split("?")[0]))[0]
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", stem).strip("-")[:40] or "vod"
+    return f"{slug}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    tmp = path + ".tmp"
+    with wave.open(tmp, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(to_pcm16(samples))
+    os.replace(tmp, path)
+
+
+class VODJob:
+    def __init__(self, source: str, langs: list, output_dir: str = None, fmt: str = "mp4", channel: str = "vod",
+                 concurrency: int = 16, min_seconds: float = 8.0, target_seconds: float = 20.0,
+                 max_seconds: float = 28.0, log_queue=None, asr_slots: int = None):
+        if fmt not in ("mp4", "hls"):
+            raise ValueError(f"formato de saída desconhecido: {fmt} (mp4 ou hls)")
+        self.source = source
+        self.langs = list(langs)
+        self.id = job_id_for(source)
+        self.output_dir = output_dir or os.path.join(vod_root(), self.id)
+        self.work_dir = os.path.join(self.output_dir, "work")
+        self.chunks_dir = os.path.join(self.work_dir, "chunks")
+        self.fmt = fmt
+        # Segmentação, motor de ASR e limites de esticamento vêm da config deste "canal"
+        self.config = channel_config(channel)
+        self.concurrency = concurrency
+        self.min_seconds = min_seconds
+        self.target_seconds = target_seconds
+        self.max_seconds = max_seconds
+        # Trechos no pool do ASR ao mesmo tempo (None: sem limite, como no CLI)
+        self._asr_slots = threading.BoundedSemaphore(asr_slots) if asr_slots else None
+        self.log_queue = log_queue
+        self.nonspeech = os.getenv("VAD_NONSPEECH", "passthrough")
+        self.labels = {"job": self.id}
+
+        self.state = "pending"  # pending → decoding → segmenting → dubbing → writing → done | incomplete | failed
+        self.error = None
+        self.chunks = []  # [(início com contexto, início, fim)] em amostras de SAMPLE_RATE
+        self.audio_seconds = 0.0
+        self.done_chunks = 0
+        self.failed_chunks = 0
+        self.processed_seconds = 0.0  # áudio dublado nesta execução
+        self.started_at = None
+        self.finished_at = None
+        self.outputs = {}
+        self._lock = threading.Lock()
+        self._pcm = None
+
+    def _log(self, msg: str):
+        line = f"[vod:{self.id}] {msg}"
+        if self.log_queue is not None:
+            self.log_queue.put(line)
+        else:
+            logger.info(line)
+
+    # ------------------------------------------------------------ execução
+
+    def run(self) -> dict:
+        self.started_at = time.time()
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        try:
+            self._prepare()
+            self.state = "dubbing"
+            self._dub_all()
+            if self.failed_chunks:
+                self.state = "incomplete"
+                self._log(f"{self.failed_chunks} trecho(s) falharam; rode o job de novo para retomar")
+            else:
+                self.state = "writing"
+                # Um ffmpeg por idioma (o encoder AAC usa um núcleo só): em paralelo
+                with ThreadPoolExecutor(len(self.langs)) as pool:
+                    self.outputs = dict(zip(self.langs, pool.map(self._write_output, self.langs)))
+                self._release_pcm()
+                self.state = "done"
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            self._log(f"ERRO: {self.error}")
+        finally:
+            self.finished_at = time.time()
+        status = self.as_dict()
+        self._log(f"{self.state}: {status['processed_hours']:.2f} h de áudio dubladas em "
+                  f"{status['wall_hours']:.2f} h ({status['hours_per_hour']:.1f} h/h)")
+        return status
+
+    def _prepare(self):
+        manifest_path = os.path.join(self.work_dir, "manifest.json")
+        pcm_path = os.path.join(self.work_dir, "source.f32")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.chunks = [tuple(chunk) for chunk in manifest["chunks"]]
+            if not os.path.exists(pcm_path):
+                self._decode(pcm_path)  # apagado ao terminar: job refeito (outros idiomas, por exemplo)
+            self._pcm = np.memmap(pcm_path, dtype=np.float32, mode="r")
+            self.audio_seconds = len(self._pcm) / SAMPLE_RATE
+            self._log(f"Retomando: {len(self.chunks)} trecho(s), {self.audio_seconds / 3600:.2f} h de áudio")
+            return
+
+        self._decode(pcm_path)
+        self._pcm = np.memmap(pcm_path, dtype=np.float32, mode="r")
+        self.audio_seconds = len(self._pcm) / SAMPLE_RATE
+
+        self.state = "segmenting"
+        segmenter = SpeechSegmenter(SAMPLE_RATE, min_seconds=self.min_seconds, target_seconds=self.target_seconds,
+                                    max_seconds=self.max_seconds, overlap_seconds=self.config.segment_overlap,
+                                    min_pause=self.config.min_pause)
+        block = 60 * SAMPLE_RATE
+        chunks = []
+        for offset in range(0, len(self._pcm), block):
+            chunks.extend(segmenter.feed(np.asarray(self._pcm[offset:offset + block])))
+        last = segmenter.flush()
+        if last is not None:
+            chunks.append(last)
+        # Resto menor que um quadro do segmentador vai no último trecho
+        context_start, start, _ = chunks[-1] if chunks else (0, 0, 0)
+        chunks[-1:] = [(context_start, start, len(self._pcm))]
+        self.chunks = chunks
+        _write_json(manifest_path, {"source": self.source, "sample_rate": SAMPLE_RATE,
+                                    "audio_seconds": self.audio_seconds, "chunks": chunks})
+        self._log(f"{self.audio_seconds / 3600:.2f} h de áudio em {len(chunks)} trecho(s)")
+
+    def _decode(self, pcm_path: str):
+        self.state = "decoding"
+        self._log(f"Decodificando {self.source} ...")
+        tmp = pcm_path + ".tmp"
+        with open(tmp, "wb") as out:
+            subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-i", self.source,
+                            "-vn", "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+                           stdout=out, stderr=subprocess.PIPE, check=True)
+        if not os.path.getsize(tmp):
+            os.remove(tmp)
+            raise RuntimeError("a fonte não tem áudio")
+        os.replace(tmp, pcm_path)
+
+    def _release_pcm(self):
+        """Saída gravada: o PCM da fonte só servia para os trechos e a saída."""
+        pcm_path = os.path.join(self.work_dir, "source.f32")
+        self._pcm = None
+        size = os.path.getsize(pcm_path)
+        os.remove(pcm_path)
+        self._log(f"{pcm_path} apagado ({size / 1e6:.0f} MB)")
+
+    # ------------------------------------------------------------ dublagem
+
+    def _transcript_path(self, i: int) -> str:
+        return os.path.join(self.chunks_dir, f"{i:05d}.json")
+
+    def _speech_path(self, i: int, lang: str) -> str:
+        return os.path.join(self.chunks_dir, f"{i:05d}_{lang}.wav")
+
+    def _chunk_done(self, i: int) -> bool:
+        path = self._transcript_path(i)
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            text = json.load(f)["text"]
+        if not text.strip() or self._tts is None:
+            return True  # sem fala (ou sem TTS): não há áudio sintetizado por idioma
+        return all(os.path.exists(self._speech_path(i, lang)) for lang in self.langs)
+
+    def _dub_all(self):
+        # Com JOB_QUEUE, a síntese roda nos job workers, que têm a chave
+        self._tts = remote_tts_client()
+        if self._tts is None and os.getenv("SPEECHIFY_API_KEY"):
+            self._tts = get_tts_client()
+        self._voice_id = os.getenv("SPEECHIFY_VOICE_ID")
+        if self._tts is None or not self._voice_id:
+            self._tts = None
+            self._log("AVISO: SPEECHIFY_API_KEY ou SPEECHIFY_VOICE_ID não definido; usando o áudio original")
+
+        pending = [i for i in range(len(self.chunks)) if not self._chunk_done(i)]
+        self.done_chunks = len(self.chunks) - len(pending)
+        if not pending:
+            return
+        self._log(f"Dublando {len(pending)} trecho(s) em {', '.join(self.langs)} "
+                  f"({self.concurrency} em paralelo, {self.done_chunks} já prontos)")
+        self._asr = remote_asr_service() or get_asr_service(self.config)
+        self._matchers = {lang: DurationMatcher(self.config.max_speedup, self.config.max_slowdown,
+                                                self.config.max_drift, labels={"channel": self.id, "lang": lang})
+                          for lang in self.langs}
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix=f"vod-{self.id}") as pool:
+            for _ in pool.map(self._dub_chunk, pending):
+                pass
+        for matcher in self._matchers.values():
+            matcher.close()
+
+    def _dub_chunk(self, i: int):
+        context_start, start, end = self.chunks[i]
+        seconds = (end - start) / SAMPLE_RATE
+        try:
+            path = self._transcript_path(i)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    text = json.load(f)["text"]
+            else:
+                # Com o contexto do trecho anterior, como no ao vivo
+                audio = resample(np.asarray(self._pcm[context_start:end]), SAMPLE_RATE, ASR_SAMPLE_RATE)
+                text = self._transcribe(audio)
+                _write_json(path, {"text": text, "start": start / SAMPLE_RATE, "end": end / SAMPLE_RATE})
+            if text.strip() and self._tts is not None:
+                for lang in self.langs:
+                    if not os.path.exists(self._speech_path(i, lang)):
+                        self._synthesize(i, text, lang, seconds)
+        except Exception as e:
+            VOD_CHUNK_ERRORS.inc(**self.labels)
+            with self._lock:
+                self.failed_chunks += 1
+            self._log(f"ERRO no trecho {i} ({start / SAMPLE_RATE:.1f}s): {type(e).__name__}: {e}")
+            return
+        VOD_AUDIO_SECONDS.inc(seconds, **self.labels)
+        with self._lock:
+            self.done_chunks += 1
+            self.processed_seconds += seconds
+            done = self.done_chunks
+        if done % 50 == 0 or done == len(self.chunks):
+            self._log(f"{done}/{len(self.chunks)} trecho(s) ({self.hours_per_hour():.1f} h/h)")
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        if self._asr_slots is None:
+            return self._asr.submit(f"vod:{self.id}", audio, language="pt").result()
+        with self._asr_slots:
+            return self._asr.submit(f"vod:{self.id}", audio, language="pt").result()
+
+    def _synthesize(self, i: int, text: str, lang: str, seconds: float):
+        translated = get_translator().translate(text, "pt", lang)
+        samples, sr = decode_audio_bytes(self._tts.synthesize(translated, self._voice_id))
+        samples = self._matchers[lang].stretch(samples, sr, seconds)
+        _write_wav(self._speech_path(i, lang), resample(samples, sr, SAMPLE_RATE), SAMPLE_RATE)
+
+    # ------------------------------------------------------------ saída
+
+    def _chunk_audio(self, i: int, lang: str) -> np.ndarray:
+        _, start, end = self.chunks[i]
+        path = self._speech_path(i, lang)
+        if os.path.exists(path):
+            return read_wav(path)[0]
+        original = np.asarray(self._pcm[start:end], dtype=np.float32)
+        with open(self._transcript_path(i), encoding="utf-8") as f:
+            speech = bool(json.load(f)["text"].strip())
+        # Sem fala (ou sem TTS): áudio original, ou silêncio com VAD_NONSPEECH=silence
+        if not speech and self.nonspeech == "silence":
+            return np.zeros_like(original)
+        return original
+
+    def _write_output(self, lang: str) -> str:
+        """Uma passada do ffmpeg: PCM dos trechos na ordem, com a duração casada com a origem."""
+        if self.fmt == "mp4":
+            path = os.path.join(self.output_dir, f"{lang}.mp4")
+            tmp = path + ".tmp"
+            command = ["-i", self.source, "-map", "1:v?", "-map", "0:a", "-c:v", "copy",
+                       "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", "-f", "mp4", tmp]
+        else:
+            hls_dir = os.path.join(self.output_dir, lang)
+            os.makedirs(hls_dir, exist_ok=True)
+            path = tmp = os.path.join(hls_dir, "index.m3u8")
+            command = ["-map", "0:a", "-c:a", "aac", "-b:a", "128k", "-f", "hls", "-hls_time", "4",
+                       "-hls_playlist_type", "vod", "-hls_segment_filename", os.path.join(hls_dir, "%05d.ts"), tmp]
+        self._log(f"Gerando {path} ...")
+        proc = subprocess.Popen(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                                 "-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0"] + command,
+                                stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        matcher = DurationMatcher(self.config.max_speedup, self.config.max_slowdown, self.config.max_drift,
+                                  labels={"channel": self.id, "lang": lang})
+        try:
+            for i, (_, start, end) in enumerate(self.chunks):
+                samples = matcher.place(self._chunk_audio(i, lang), SAMPLE_RATE, (end - start) / SAMPLE_RATE)
+                proc.stdin.write(samples.astype(np.float32, copy=False).tobytes())
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        finally:
+            matcher.close()
+        stderr = proc.stderr.read().decode(errors="replace")
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg falhou ao gerar {path}: {stderr.strip()[-500:]}")
+        if tmp != path:
+            os.replace(tmp, path)
+        return path
+
+    # ------------------------------------------------------------ estado
+
+    def hours_per_hour(self) -> float:
+        """Horas de áudio dubladas nesta execução por hora de relógio."""
+        if self.started_at is None:
+            return 0.0
+        wall = (self.finished_at or time.time()) - self.started_at
+        return self.processed_seconds / wall if wall > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        wall = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "source": self.source,
+            "langs": self.langs,
+            "format": self.fmt,
+            "state": self.state,
+            "error": self.error,
+            "chunks": len(self.chunks),
+            "done_chunks": self.done_chunks,
+            "failed_chunks": self.failed_chunks,
+            "audio_hours": round(self.audio_seconds / 3600, 4),
+            "processed_hours": round(self.processed_seconds / 3600, 4),
+            "wall_hours": round(wall / 3600, 4),
+            "hours_per_hour": round(self.hours_per_hour(), 2),
+            "outputs": self.outputs,
+        }
+
+
+# ------------------------------------------------------------ jobs do backend
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_vod_job(source: str, langs: list, fmt: str = "mp4", log_queue=None, asr_slots: int = None) -> dict:
+    """
+    Roda (ou retoma) o job da fonte numa thread; idempotente enquanto ele roda.
+    Pela API, use ChannelSupervisor.start_vod (orçamento de computação).
+    """
+    job = VODJob(source, langs, fmt=fmt, log_queue=log_queue, asr_slots=asr_slots)
+    with _jobs_lock:
+        current = _jobs.get(job.id)
+        if current is not None and current.state not in FINISHED_STATES:
+            return current.as_dict()
+        _jobs[job.id] = job
+    threading.Thread(target=job.run, name=f"vod-{job.id}", daemon=True).start()
+    return job.as_dict()
+
+
+def running_vod_jobs() -> int:
+    with _jobs_lock:
+        return sum(1 for job in _jobs.values() if job.state not in FINISHED_STATES)
+
+
+def vod_status(job_id: str = None):
+    with _jobs_lock:
+        jobs = dict(_jobs)
+    if job_id is not None:
+        job = jobs.get(job_id)
+        return job.as_dict() if job is not None else None
+    return {job_id: job.as_dict() for job_id, job in jobs.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dublagem em lote de uma transmissão gravada (VOD)")
+    parser.add_argument("source", help="arquivo gravado (ou URL que o ffmpeg leia)")
+    parser.add_argument("--langs", required=True, help="idiomas separados por vírgula")
+    parser.add_argument("--format", default="mp4", choices=("mp4", "hls"))
+    parser.add_argument("--output", help="diretório do job (padrão: VOD_DIR/<id>)")
+    parser.add_argument("--channel", default="vod", help="config de canal a usar (channels.json)")
+    parser.add_argument("--concurrency", type=int, default=16, help="trechos em andamento ao mesmo tempo")
+    parser.add_argument("--target-seconds", type=float, default=20.0, help="duração alvo dos trechos")
+    parser.add_argument("--max-seconds", type=float, default=28.0, help="duração máxima dos trechos")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    job = VODJob(args.source, [lang.strip() for lang in args.langs.split(",") if lang.strip()],
+                 output_dir=args.output, fmt=args.format, channel=args.channel, concurrency=args.concurrency,
+                 min_seconds=min(8.0, args.target_seconds), target_seconds=args.target_seconds,
+                 max_seconds=args.max_seconds)
+    status = job.run()
+    print(json.dumps(status, indent=2, ensure_ascii=False))
+    return 0 if status["state"] == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,157 +2,215 @@
 
 import os
 import time
-import whisper
-from deep_translator import DeeplTranslator
-import requests
-import subprocess
 from queue import Queue
-
-def worker_loop(audio_dir: str, lang: str, log_queue: Queue):
+import numpy as np
+from pipeline import metrics
+from pipeline.audio import decode_audio_bytes, resample
+from pipeline.config import channel_config
+from pipeline.hls_packager import LiveHLSPackager
+from pipeline.job_queue import remote_tts_client
+from pipeline.stages import Stage
+from pipeline.storage import hls_root
+from pipeline.stream_encoder import StreamEncoder
+from pipeline.timing import DurationMatcher
+from pipeline.translator import get_translator
+from pipeline.tts_client import TTSError, get_tts_client
+
+SEGMENT_AGE = metrics.histogram(
+    "dub_segment_age_seconds", "Idade do segmento (desde a captura) ao ser publicado no HLS",
+    buckets=(1, 2, 4, 6, 8, 10, 15, 20, 30, 45, 60, 120),
+)
+CHANNEL_LAG = metrics.gauge("dub_channel_lag_seconds", "Atraso do último segmento publicado em relação ao ao vivo")
+
+
+class LanguageBranch:
     """
-    Loop contínuo que:
-      1. Monitora novos .wav em audio_dir
-      2. Transcreve com Whisper
-      3. Traduz com DeepL
-      4. Sintetiza com Speechify (ou Coqui, se quiser)
-      5. Gera HLS em hls/{channel}/{lang}/
-      6. Cada passo envia uma mensagem para log_queue.put("texto")
+    Ramo de um idioma dentro do pipeline do canal. Recebe a transcrição (feita
+    uma única vez pelo ChannelPipeline) de cada segmento e a passa por estágios
+    concorrentes ligados por filas limitadas:
+      1. translate: traduz com DeepL (tradutor compartilhado: lotes, pool HTTP e cache de frases)
+      2. tts: sintetiza com Speechify (cliente assíncrono compartilhado, com cache de áudio)
+      3. package: publica o trecho dublado, na ordem original, na playlist HLS
+         ao vivo em hls/{channel}/{lang}/
+    Segmentos sem fala (text None ou vazio) pulam tradução e TTS e são
+    publicados como o áudio original ou silêncio (VAD_NONSPEECH=passthrough|silence).
+    Com duration_match, cada trecho é ajustado à duração do segmento de origem
+    (pipeline/timing.py) para a faixa dublada não derivar em relação ao vídeo.
+    Cada passo envia uma mensagem para log_queue.put("texto").
     """
-    # 1) Carrega o modelo Whisper
-    model = whisper.load_model("base")
-    log_queue.put("[worker] Modelo Whisper carregado (base).")
-
-    # 2) Configura credenciais Speechify (via env var SPEECHIFY_API_KEY)
-    speechify_key = os.getenv("SPEECHIFY_API_KEY")
-    speechify_voice_id = os.getenv("SPEECHIFY_VOICE_ID")  # ex: "3af44bf3-..."
-    if not speechify_key or not speechify_voice_id:
-        log_queue.put("[worker] AVISO: SPEECHIFY_API_KEY ou SPEECHIFY_VOICE_ID não definido. TTS será pulado.")
-    else:
-        log_queue.put("[worker] Speechify configurado corretamente.")
-
-    processed = set()
-
-    while True:
-        # 3) Para cada arquivo .wav não processado:
-        for filename in sorted(os.listdir(audio_dir)):
-            if not filename.endswith(".wav") or filename in processed:
-                continue
-
-            wav_path = os.path.join(audio_dir, filename)
-            log_queue.put(f"[worker] Encontrado novo segmento: {wav_path}")
 
+    def __init__(self, channel: str, lang: str, log_queue: Queue,
+                 translate_workers: int = 4, tts_workers: int = 3, queue_size: int = 4, controller=None):
+        self.channel = channel
+        self.lang = lang
+        self.log_queue = log_queue
+        # Controle de latência do canal (recebe a idade de cada segmento publicado)
+        self.controller = controller
+        self.nonspeech = os.getenv("VAD_NONSPEECH", "passthrough")
+
+        # 1) Configura credenciais Speechify (via env var SPEECHIFY_API_KEY)
+        #    Com JOB_QUEUE a síntese roda nos job workers, que têm a chave
+        self.remote_tts = remote_tts_client()
+        self.speechify_key = os.getenv("SPEECHIFY_API_KEY") or (self.remote_tts is not None)
+        self.speechify_voice_id = os.getenv("SPEECHIFY_VOICE_ID")  # ex: "3af44bf3-..."
+        if not self.speechify_key or not self.speechify_voice_id:
+            log_queue.put(f"[worker:{lang}] AVISO: SPEECHIFY_API_KEY ou SPEECHIFY_VOICE_ID não definido. TTS será pulado.")
+        else:
+            log_queue.put(f"[worker:{lang}] Speechify configurado corretamente.")
+
+        # 2) Encoder AAC contínuo (um ffmpeg só, alimentado por PCM via pipe) que
+        #    publica segmentos na playlist HLS ao vivo com janela deslizante
+        #    (com ll_hls na config do canal: partes de part_target s e blocking reload;
+        #    com dvr_window, a playlist guarda também os últimos dvr_window segundos)
+        self.labels = {"channel": channel, "lang": lang}
+        config = channel_config(channel)
+        self.packager = LiveHLSPackager(os.path.join(hls_root(), channel, lang), target_duration=4,
+                                        labels=self.labels,
+                                        part_target=config.part_target if config.ll_hls else None,
+                                        dvr_window=config.dvr_window)
+        self.encoder = StreamEncoder(self.packager, segment_time=4.0, log_queue=log_queue).start()
+        self.timing = DurationMatcher(config.max_speedup, config.max_slowdown, config.max_drift,
+                                      labels=self.labels) if config.duration_match else None
+
+        # 3) Estágios: a rede (DeepL/Speechify) corre em paralelo com o ASR e entre
+        #    segmentos; o empacotamento é ordenado e tem um único worker
+        self.stages = [
+            Stage(f"translate:{lang}", self._translate, translate_workers, queue_size, log_queue=log_queue,
+                  labels=self.labels),
+            Stage(f"tts:{lang}", self._synthesize, tts_workers, queue_size, log_queue=log_queue, labels=self.labels),
+            Stage(f"package:{lang}", self._package, maxsize=queue_size, ordered=True, log_queue=log_queue,
+                  labels=self.labels),
+        ]
+        self.stages[0].then(self.stages[1]).then(self.stages[2])
+        for stage in self.stages:
+            stage.start()
+        self._seq = 0
+        # Guarda a cópia do áudio dublado em audio_segments só se a retenção mantém intermediários
+        self.keep_dubbed = config.keep_intermediates > 0
+        # Último segmento publicado (seq da fonte): antes dele, a retenção pode apagar os intermediários
+        self.packaged_seq = None
+
+    def submit(self, segment, text: str):
+        """
+        Entrega um segmento transcrito ao ramo. Chamado por uma única thread (o
+        fan-out do canal); bloqueia se a fila de tradução estiver cheia.
+        """
+        self.stages[0].put(self._seq, {"segment": segment, "text": text})
+        self._seq += 1
+
+    def queue_depths(self) -> dict:
+        return {stage.name.split(":")[0]: stage.depth() for stage in self.stages}
+
+    # ------------------------------------------------------------ estágios
+
+    def _translate(self, job: dict) -> dict:
+        lang = self.lang
+        if job["segment"].passthrough or not (job["text"] or "").strip():
+            job["translated"] = None
+            return job
+        self.log_queue.put(f"[worker:{lang}] Traduzindo para {lang} ...")
+        translator = get_translator()
+        # O ASR é forçado para português, então a origem é conhecida (melhor para o cache)
+        job["translated"] = translator.translate(job["text"], "pt", lang)
+        stats = translator.stats()
+        self.log_queue.put(
+            f"[worker:{lang}] Tradução (cache {stats['cache_hits']}/{stats['cache_hits'] + stats['cache_misses']}): "
+            f"{job['translated']}"
+        )
+        return job
+
+    def _synthesize(self, job: dict):
+        log_queue = self.log_queue
+        lang = self.lang
+        segment = job["segment"]
+
+        if job["translated"] is None:
+            samples, sr = segment.load()
+            if segment.passthrough:
+                # Canal atrasado (controle de latência): áudio original, sem TTS
+                log_queue.put(f"[worker:{lang}] {segment} atrasado; publicando áudio original")
+                job["samples"], job["sample_rate"] = samples, sr
+                return job
+            if self.nonspeech == "silence":
+                samples = np.zeros_like(samples)
+            kind = "silêncio" if self.nonspeech == "silence" else "áudio original"
+            log_queue.put(f"[worker:{lang}] {segment} sem fala; publicando {kind}")
+            job["samples"], job["sample_rate"] = samples, sr
+            return job
+
+        # --- Síntese Speechify (cliente assíncrono compartilhado: pool, retries e cache) ---
+        if self.speechify_key and self.speechify_voice_id:
+            log_queue.put(f"[worker:{lang}] Sintetizando com Speechify ...")
+            tts = self.remote_tts or get_tts_client()
             try:
-                # --- Transcrição ---
-                log_queue.put(f"[worker] Transcrevendo {wav_path} ...")
-                result = model.transcribe(wav_path, language="pt")  # força Português
-                text = result["text"].strip()
-                log_queue.put(f"[worker] Transcrição: {text}")
-
-                # --- Tradução DeepL ---
-                log_queue.put(f"[worker] Traduzindo para {lang} ...")
-                translator = DeeplTranslator(source="auto", target=lang)
-                translated = translator.translate(text)
-                log_queue.put(f"[worker] Tradução: {translated}")
-
-                # --- Síntese Speechify (via HTTP) ---
-                if speechify_key and speechify_voice_id:
-                    log_queue.put("[worker] Sintetizando com Speechify ...")
-                    # Monta payload para Speechify:
-                    headers = {
-                        "Authorization": f"Bearer {speechify_key}",
-                        "Content-Type": "application/json"
-                    }
-                    payload = {
-                        "voiceId": speechify_voice_id,
-                        "input": translated
-                    }
-                    # Faz request:
-                    response = requests.post(
-                        "https://api.sws.speechify.com/v1/tts/audio",
-                        json=payload,
-                        headers=headers
-                    )
-                    if response.status_code != 200:
-                        log_queue.put(f"[worker] Erro Speechify ({response.status_code}): {response.text}")
-                        processed.add(filename)
-                        continue
-
-                    audio_data_base64 = response.json().get("audioData")
-                    if not audio_data_base64:
-                        log_queue.put(f"[worker] Erro: resposta Speechify sem campo audioData.")
-                        processed.add(filename)
-                        continue
-
-                    # Converte base64 → binário e salva em wav temporário:
-                    from base64 import b64decode
-                    temp_wav = wav_path.replace(".wav", f"_{lang}.wav")
-                    with open(temp_wav, "wb") as f:
-                        f.write(b64decode(audio_data_base64))
-                    log_queue.put(f"[worker] Áudio Speechify salvo em {temp_wav}")
-                else:
-                    log_queue.put(
-                        "[worker] Pulando síntese: credenciais Speechify não configuradas. Usando áudio original."
-                    )
-                    temp_wav = wav_path
-
-                # --- Converte wav para mp3 (para concatenar) ---
-                log_queue.put(f"[worker] Convertendo WAV para MP3: {temp_wav}")
-                mp3_path = temp_wav.replace(".wav", ".mp3")
-                subprocess.run(
-                    ["ffmpeg", "-y", "-i", temp_wav, "-codec:a", "libmp3lame", mp3_path],
-                    check=True
-                )
-                log_queue.put(f"[worker] MP3 gerado: {mp3_path}")
-
-                # --- Concatena no “concat.mp3” contínuo ---
-                channel = os.path.basename(audio_dir)
-                processed_dir = os.path.join(audio_dir, "processed")
-                os.makedirs(processed_dir, exist_ok=True)
-                concat_mp3 = os.path.join(processed_dir, "concat.mp3")
-                if not os.path.exists(concat_mp3):
-                    # Se não existe, cria um mp3 vazio com um segundo de silêncio
-                    silent = os.path.join(processed_dir, "silent.wav")
-                    subprocess.run(
-                        ["ffmpeg", "-y", "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono", 
-                         "-t", "0.1", "-q:a", "9", silent],
-                        check=True
-                    )
-                    subprocess.run(
-                        ["ffmpeg", "-y", "-i", silent, "-codec:a", "libmp3lame", concat_mp3],
-                        check=True
-                    )
-                    log_queue.put(f"[worker] Arquivo inicial concat.mp3 criado em {concat_mp3}")
-
-                # Agora concatena: concat|novo → temp → substitui
-                log_queue.put(f"[worker] Adicionando {mp3_path} ao concat.mp3")
-                temp_out = concat_mp3 + ".temp"
-                subprocess.run(
-                    ["ffmpeg", "-y", "-i", f"concat:{concat_mp3}|{mp3_path}", "-acodec", "copy", temp_out],
-                    check=True
-                )
-                os.replace(temp_out, concat_mp3)
-                log_queue.put(f"[worker] concat.mp3 atualizado com {mp3_path}")
-
-                # --- Gera HLS ---
-                hls_dir = os.path.join("hls", channel, lang)
-                os.makedirs(hls_dir, exist_ok=True)
-                ts_pattern = os.path.join(hls_dir, "%03d.ts")
-                output_index = os.path.join(hls_dir, "index.m3u8")
-                log_queue.put(f"[worker] Gerando HLS em {output_index} ...")
-                subprocess.run([
-                    "ffmpeg", "-y", "-i", concat_mp3,
-                    "-c:a", "aac", "-b:a", "128k", "-vn",
-                    "-hls_time", "10",
-                    "-hls_playlist_type", "event",
-                    "-hls_segment_filename", ts_pattern,
-                    output_index
-                ], check=True)
-                log_queue.put(f"[worker] HLS gerado em {output_index}")
-
-                processed.add(filename)
-
-            except Exception as e:
-                log_queue.put(f"[worker] ERRO ao processar {wav_path}: {e}")
-                processed.add(filename)
-
-        time.sleep(1)
+                audio = tts.synthesize(job["translated"], self.speechify_voice_id)
+            except TTSError as e:
+                log_queue.put(f"[worker:{lang}] Erro Speechify: {e}")
+                return None
+
+            # Guarda o áudio dublado junto do segmento (útil para depuração; apagado pela retenção)
+            if self.keep_dubbed:
+                with open(segment.dubbed_path(lang), "wb") as f:
+                    f.write(audio)
+            stats = tts.stats()
+            log_queue.put(
+                f"[worker:{lang}] Áudio Speechify recebido ({len(audio)} bytes, "
+                f"cache {stats['cache_hits']}/{stats['cache_hits'] + stats['cache_misses']}, "
+                f"retries {stats['retried']}, hedges {stats['hedged']})"
+            )
+            samples, sr = decode_audio_bytes(audio)
+            job["tts_seconds"] = len(samples) / sr
+            job["source_seconds"] = segment.duration()
+            if self.timing is not None:
+                samples = self.timing.stretch(samples, sr, job["source_seconds"])
+            job["samples"], job["sample_rate"] = samples, sr
+        else:
+            log_queue.put(
+                f"[worker:{lang}] Pulando síntese: credenciais Speechify não configuradas. Usando áudio original."
+            )
+            job["samples"], job["sample_rate"] = segment.load()
+        return job
+
+    def _package(self, job: dict):
+        # --- Envia o PCM dublado ao encoder contínuo ---
+        samples, sr = job["samples"], job["sample_rate"]
+        if job["segment"].discontinuity:
+            # Segmentos descartados antes deste (controle de latência)
+            self.packager.mark_discontinuity()
+            if self.timing is not None:
+                self.timing.reset()
+        details = []
+        if self.timing is not None:
+            # Sem TTS (áudio original/silêncio) o trecho já tem a duração da origem
+            samples = self.timing.place(samples, sr, job.get("source_seconds", len(samples) / sr))
+            if "tts_seconds" in job:
+                details.append(f"TTS {job['tts_seconds']:.1f}s → {len(samples) / sr:.1f}s")
+            details.append(f"deriva {self.timing.drift:+.2f}s")
+        self.encoder.write(resample(samples, sr, self.encoder.sample_rate))
+        latency = self.encoder.latency
+        if latency is not None:
+            details.insert(0, f"latência do encoder: {latency * 1000:.0f} ms")
+        self.packaged_seq = job["segment"].seq
+        # Publicação ≈ entrega ao encoder + latência do encoder
+        age = time.time() - job["segment"].captured_at + (latency or 0.0)
+        SEGMENT_AGE.observe(age, **self.labels)
+        CHANNEL_LAG.set(age, **self.labels)
+        if self.controller is not None:
+            self.controller.observe_published(age)
+        self.log_queue.put(
+            f"[worker:{self.lang}] {len(samples) / sr:.1f}s enviados ao encoder de {self.packager.playlist_path}"
+            + (f" ({', '.join(details)})" if details else "")
+        )
+
+    def close(self):
+        for stage in self.stages:
+            stage.stop()
+        # O encoder (e o áudio que os estágios leem) só é liberado depois que os workers saem
+        deadline = time.monotonic() + 5.0
+        for stage in self.stages:
+            if not stage.join(timeout=max(0.0, deadline - time.monotonic())):
+                self.log_queue.put(f"[worker:{self.lang}] Estágio {stage.name} ainda ocupado ao encerrar")
+        self.encoder.close()
+        if self.timing is not None:
+            self.timing.close()
+        CHANNEL_LAG.remove(**self.labels)
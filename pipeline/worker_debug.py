@@ -5,12 +5,12 @@ import os
 import time
 import sys
 import traceback
-import whisper
 from deep_translator import DeeplTranslator
 import subprocess
 import logging
 import shutil
 from dotenv import load_dotenv
+from pipeline.asr_service import get_asr_service
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -39,14 +39,14 @@ def process_single_segment(wav_path, lang):
     try:
         logger.debug(f"[DEBUG] Iniciando processamento do segmento: {wav_path}")
         
-        # 1) Transcrição com Whisper
-        logger.debug(f"[DEBUG] Carregando modelo Whisper...")
-        model = whisper.load_model("base")
-        logger.debug(f"[DEBUG] Modelo Whisper carregado com sucesso")
+        # 1) Transcrição com Whisper (serviço compartilhado, modelo carregado uma vez)
+        logger.debug(f"[DEBUG] Obtendo serviço Whisper compartilhado...")
+        asr = get_asr_service()
+        logger.debug(f"[DEBUG] Serviço Whisper pronto (modelo {asr.model_name})")
         
         logger.debug(f"[DEBUG] Transcrevendo {wav_path} com idioma forçado para português...")
-        result = model.transcribe(wav_path, language="pt")
-        text = result["text"].strip()
+        channel = os.path.basename(os.path.dirname(wav_path))
+        text = asr.submit(channel, wav_path, language="pt").result()
         logger.debug(f"[DEBUG] Transcrição concluída: {text}")
 
         # 2) Tradução com DeepL
@@ -159,7 +159,7 @@ def process_single_segment(wav_path, lang):
 if __name__ == "__main__":
     # Verificar se foi passado um arquivo WAV como argumento
     if len(sys.argv) < 2:
-        logger.error("Uso: python worker_debug.py <caminho_para_wav>")
+        logger.error("Uso: python -m pipeline.worker_debug <caminho_para_wav> [idioma]")
         sys.exit(1)
     
     wav_path = sys.argv[1]
@@ -6,7 +6,9 @@ import threading
 import traceback
 import logging
 from queue import Queue
-from pipeline.worker import worker_loop
+from pipeline import metrics
+from pipeline.channel_pipeline import ChannelPipeline
+from pipeline.storage import hls_root
 
 # Configuração de logging
 logging.basicConfig(
@@ -19,55 +21,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger("worker_thread")
 
-def worker_wrapper(audio_dir: str, lang: str, log_queue: Queue):
+# Um pipeline (e uma thread) por canal: canal -> (ChannelPipeline, Thread)
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def worker_wrapper(pipeline: ChannelPipeline):
     """
-    Wrapper para capturar exceções no worker_loop
+    Wrapper para capturar exceções no loop do pipeline do canal
     """
     try:
-        logger.info(f"Iniciando worker_loop para {audio_dir} e idioma {lang}")
-        worker_loop(audio_dir, lang, log_queue)
+        logger.info(f"Iniciando pipeline do canal {pipeline.channel} ({pipeline.audio_dir})")
+        pipeline.run()
     except Exception as e:
-        logger.error(f"ERRO CRÍTICO no worker_loop: {e}")
+        logger.error(f"ERRO CRÍTICO no pipeline do canal {pipeline.channel}: {e}")
         logger.error(f"Traceback completo: {traceback.format_exc()}")
-        # Tentar reiniciar o worker após um erro crítico
-        logger.info("Tentando reiniciar o worker após erro crítico...")
+        # Tentar reiniciar o loop após um erro crítico (os idiomas anexados são mantidos)
+        logger.info("Tentando reiniciar o pipeline após erro crítico...")
         time.sleep(5)  # Aguardar um pouco antes de reiniciar
         try:
-            worker_loop(audio_dir, lang, log_queue)
+            pipeline.run()
         except Exception as e2:
-            logger.error(f"Falha ao reiniciar worker após erro: {e2}")
+            logger.error(f"Falha ao reiniciar pipeline após erro: {e2}")
+
+
+def _collect_queue_depths() -> list:
+    """Profundidade de cada fila de cada canal, lida na hora do scrape."""
+    with _channels_lock:
+        pipelines = [entry[0] for entry in _channels.values()]
+    samples = []
+    for pipeline in pipelines:
+        for key, value in pipeline.queue_depths().items():
+            if isinstance(value, dict):
+                samples.extend(({"channel": pipeline.channel, "lang": key, "queue": queue}, depth)
+                               for queue, depth in value.items())
+            else:
+                samples.append(({"channel": pipeline.channel, "queue": key}, value))
+    return [("dub_queue_depth", "gauge", "Itens aguardando em cada fila do pipeline", samples)]
+
+
+metrics.add_collector(_collect_queue_depths)
 
-def start_worker_thread(audio_dir: str, lang: str, log_queue: Queue):
+
+def is_channel_running(channel: str) -> bool:
+    with _channels_lock:
+        entry = _channels.get(channel)
+        return entry is not None and entry[1].is_alive()
+
+
+def start_worker_thread(audio_dir: str, lang: str, log_queue: Queue, source=None):
     """
-    Inicia o worker_loop em uma thread separada para evitar
-    bloqueio do event loop do FastAPI.
+    Anexa o idioma ao pipeline do canal, iniciando o pipeline em uma thread
+    separada (para evitar bloqueio do event loop do FastAPI) se ele ainda não
+    estiver rodando. source: fonte de segmentos (padrão: WAVs em audio_dir).
     """
     # Garantir que o diretório de áudio existe
     os.makedirs(audio_dir, exist_ok=True)
-    
+
     # Garantir que o diretório HLS existe
     channel = os.path.basename(os.path.abspath(audio_dir))
-    hls_dir = os.path.join("hls", channel, lang)
+    hls_dir = os.path.join(hls_root(), channel, lang)
     os.makedirs(hls_dir, exist_ok=True)
-    
-    # Criar diretório para arquivos processados
-    processed_dir = os.path.join(audio_dir, "processed")
-    os.makedirs(processed_dir, exist_ok=True)
-    
-    # Iniciar o worker em uma thread separada
-    worker_thread = threading.Thread(
-        target=worker_wrapper,
-        args=(audio_dir, lang, log_queue),
-        daemon=True
-    )
-    worker_thread.start()
-    logger.info(f"Worker iniciado em thread separada para {audio_dir} e idioma {lang}")
-    
-    # Verificar se a thread está realmente rodando
-    time.sleep(1)
-    if worker_thread.is_alive():
-        logger.info("Thread do worker está rodando corretamente")
+
+    with _channels_lock:
+        entry = _channels.get(channel)
+        started = entry is None or not entry[1].is_alive()
+        if started:
+            pipeline = entry[0] if entry else ChannelPipeline(audio_dir, log_queue, source=source)
+            worker_thread = threading.Thread(
+                target=worker_wrapper,
+                args=(pipeline,),
+                daemon=True
+            )
+            _channels[channel] = (pipeline, worker_thread)
+            worker_thread.start()
+        else:
+            pipeline, worker_thread = entry
+
+    pipeline.attach(lang)
+
+    if started:
+        # Sem esperar aqui: se a thread morrer, o supervisor a reinicia (e /status mostra pipeline_alive)
+        logger.info(f"Pipeline iniciado em thread separada para {audio_dir}; idioma {lang} anexado")
     else:
-        logger.error("ERRO: Thread do worker não está rodando!")
-    
+        logger.info(f"Idioma {lang} anexado ao pipeline já em execução de {audio_dir}")
+
     return worker_thread
+
+
+def stop_worker(channel: str, lang: str) -> bool:
+    """Remove o idioma do pipeline do canal (captura e ASR continuam rodando)."""
+    with _channels_lock:
+        entry = _channels.get(channel)
+    if entry is None:
+        return False
+    return entry[0].detach(lang)
+
+
+def stop_channel(channel: str) -> bool:
+    """Encerra o pipeline do canal inteiro (todos os idiomas). Retorna False se não existia."""
+    with _channels_lock:
+        entry = _channels.pop(channel, None)
+    if entry is None:
+        return False
+    pipeline, worker_thread = entry
+    pipeline.stop()
+    worker_thread.join(timeout=5)
+    if worker_thread.is_alive():
+        # A captura pode ser fechada mesmo assim: leituras do anel fechado levantam RingClosed
+        logger.warning(f"Pipeline do canal {channel} ainda não saiu do ciclo atual; seguindo com o encerramento")
+    logger.info(f"Pipeline do canal {channel} encerrado")
+    return True
+
+
+def channel_latency(channel: str):
+    """Estado do controle de latência do canal (degrau, atraso, decisões), ou None."""
+    with _channels_lock:
+        entry = _channels.get(channel)
+    return entry[0].controller.as_dict() if entry is not None else None
+
+
+def channel_languages(channel: str) -> list:
+    with _channels_lock:
+        entry = _channels.get(channel)
+    return entry[0].languages() if entry is not None else []
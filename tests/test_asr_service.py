@@ -0,0 +1,53 @@
+# livestream-w2-gaules/tests/test_asr_service.py
+
+import os
+
+import numpy as np
+
+from pipeline.asr_engines import create_fast_engine
+from pipeline.asr_service import ASRService
+from pipeline.config import ChannelConfig
+
+
+class FakeEngine:
+    """Transcreve como o PID do processo que carregou o modelo."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = None
+        self.options = "fake"
+
+    def key(self) -> tuple:
+        return ("fake", self.model_name)
+
+    def __str__(self):
+        return f"fake:{self.model_name}"
+
+    def preload(self):
+        if self.model is None:
+            self.model = os.getpid()
+
+    def load(self):
+        self.preload()
+        return self
+
+    def set_threads(self, threads: int):
+        pass
+
+    def transcribe(self, audios: list, language: str) -> list:
+        return [str(self.model) for _ in audios]
+
+
+def test_fast_engine_uses_the_degrade_model():
+    fast = create_fast_engine(ChannelConfig("gaules", asr_model="base", degrade_asr_model="tiny"))
+    assert fast.model_name == "tiny"
+    assert create_fast_engine(ChannelConfig("gaules", asr_model="tiny", degrade_asr_model="tiny")) is None
+    assert create_fast_engine(ChannelConfig("gaules", degrade_asr_model=None)) is None
+
+
+def test_alternate_is_loaded_in_the_parent_before_fork():
+    service = ASRService(FakeEngine("base"), workers=2, alternates=(FakeEngine("tiny"),))
+    audio = np.zeros(1600, dtype=np.float32)
+    # O canal manda um motor novo (não carregado), como o ChannelPipeline
+    futures = [service.submit("gaules", audio, engine=FakeEngine("tiny")) for _ in range(4)]
+    assert {future.result(timeout=30) for future in futures} == {str(os.getpid())}
@@ -0,0 +1,85 @@
+# livestream-w2-gaules/tests/test_ring_buffer.py
+
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+
+from capture import ring_buffer
+from capture.ring_buffer import PCMRingBuffer, RingClosed
+
+
+def _ring(samples: int = 1000) -> PCMRingBuffer:
+    ring = PCMRingBuffer(samples)
+    ring.write(np.arange(samples, dtype=np.float32))
+    return ring
+
+
+def test_slice_outlives_the_ring():
+    ring = _ring()
+    samples = ring.slice(100, 50).array()
+    ring.close()
+    ring.unlink()
+    # Era uma view do segmento desmapeado: ler derrubava o processo
+    assert samples.sum() == sum(range(100, 150))
+
+
+def test_reads_after_close_raise():
+    ring = _ring()
+    ring_slice = ring.slice(0, 10)
+    ring.close()
+    ring.unlink()
+    with pytest.raises(RingClosed):
+        ring.read(0, 10)
+    with pytest.raises(RingClosed):
+        ring.write_pos
+    with pytest.raises(RingClosed):
+        ring_slice.array()
+
+
+def test_concurrent_readers_survive_close():
+    ring = _ring(16000)
+    errors = []
+    started = threading.Barrier(5)
+
+    def reader():
+        started.wait()
+        try:
+            while True:
+                ring.read(0, 16000).sum()
+        except RingClosed:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    ring.close()
+    ring.unlink()
+    for thread in threads:
+        thread.join(5)
+    assert not errors
+
+
+def _read_in_child(ring_slice, queue):
+    samples = ring_slice.array()
+    queue.put((float(samples.sum()), sorted(ring_buffer._attached)))
+
+
+def test_forked_reader_does_not_keep_the_ring_attached():
+    ring = _ring()
+    try:
+        ctx = multiprocessing.get_context("fork")
+        queue = ctx.Queue()
+        child = ctx.Process(target=_read_in_child, args=(ring.slice(10, 5), queue))
+        child.start()
+        total, attached = queue.get(timeout=10)
+        child.join(10)
+        assert total == sum(range(10, 15))
+        assert attached == []
+    finally:
+        ring.close()
+        ring.unlink()
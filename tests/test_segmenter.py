@@ -0,0 +1,35 @@
+# livestream-w2-gaules/tests/test_segmenter.py
+
+import pytest
+
+from benchmarks.synthetic import make_stream
+from capture.segmenter import SpeechSegmenter
+
+SR = 16000
+
+
+def _segments(pattern: str, seconds: float, seed: int, chunk: int = 1600, **kwargs) -> list:
+    samples = make_stream(pattern, seconds, sr=SR, seed=seed)
+    segmenter = SpeechSegmenter(SR, **kwargs)
+    cuts = []
+    for i in range(0, len(samples), chunk):
+        cuts.extend(segmenter.feed(samples[i:i + chunk]))
+    return cuts
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("pattern", ["speech:1,silence:1.5", "speech:0.5,silence:0.8", "speech:1.8,silence:0.4"])
+def test_pause_cuts_respect_min_segment(pattern, seed):
+    # Falas curtas entre pausas longas: a pausa que alcança min_segment não pode cortar antes dele
+    cuts = _segments(pattern, 30, seed, min_seconds=2.0, target_seconds=5.0, max_seconds=10.0)
+    assert cuts
+    for _, start, end in cuts:
+        assert 2.0 * SR <= end - start <= 10.0 * SR
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_cuts_are_contiguous_with_overlap(seed):
+    cuts = _segments("speech:3,silence:0.6", 30, seed, overlap_seconds=0.3)
+    for (_, _, previous_end), (context_start, start, _) in zip(cuts, cuts[1:]):
+        assert start == previous_end
+        assert start - context_start == int(0.3 * SR)
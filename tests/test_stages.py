@@ -0,0 +1,63 @@
+# livestream-w2-gaules/tests/test_stages.py
+
+import threading
+import time
+
+from pipeline.stages import Stage
+
+
+def _pipeline(slow_seq: int, delay: float):
+    packaged = []
+    done = threading.Event()
+    total = 20
+
+    def translate(item):
+        if item == slow_seq:
+            time.sleep(delay)
+        return item
+
+    def package(item):
+        packaged.append(item)
+        if len(packaged) == total:
+            done.set()
+        return item
+
+    head = Stage("translate", translate, workers=2, maxsize=4)
+    tts = head.then(Stage("tts", lambda item: item, workers=3, maxsize=4))
+    last = tts.then(Stage("package", package, ordered=True, maxsize=4))
+    stages = [head, tts, last]
+    for stage in stages:
+        stage.start()
+
+    feeder = threading.Thread(target=lambda: [head.put(seq, seq) for seq in range(total)], daemon=True)
+    feeder.start()
+    return stages, packaged, done
+
+
+def test_ordered_stage_survives_a_slow_sequence():
+    # seq 0 fica preso no translate enquanto os seguintes lotam o package
+    stages, packaged, done = _pipeline(slow_seq=0, delay=0.5)
+    try:
+        assert done.wait(10), f"packaged {len(packaged)}, depths {[stage.depth() for stage in stages]}"
+        assert packaged == list(range(20))
+    finally:
+        for stage in stages:
+            stage.stop()
+
+
+def test_ordered_stage_blocks_beyond_the_window_once_next_arrived():
+    release = threading.Event()
+    stage = Stage("package", lambda item: release.wait(5), ordered=True, maxsize=2).start()
+    stage.put(0, "a")  # o worker fica preso processando 0
+    while stage.depth():
+        time.sleep(0.01)
+    stage.put(2, "c")  # janela [1, 3)
+    stage.put(1, "b")
+    blocked = threading.Thread(target=stage.put, args=(3, "d"), daemon=True)
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()  # 1 já chegou e 3 >= 1 + maxsize
+    release.set()
+    blocked.join(2)
+    assert not blocked.is_alive()
+    stage.stop()
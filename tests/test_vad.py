@@ -0,0 +1,51 @@
+# livestream-w2-gaules/tests/test_vad.py
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import SAMPLE_RATE, music, silence, speech
+from pipeline.vad import VADGate
+
+SEEDS = range(3)
+
+
+def _rng(seed):
+    return np.random.default_rng(seed)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_speech_followed_by_a_pause_passes(seed):
+    rng = _rng(seed)
+    samples = np.concatenate([speech(7, rng=rng), silence(3, rng=rng)])
+    assert VADGate().analyze(samples, SAMPLE_RATE).is_speech
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_short_speech_in_a_long_pause_passes(seed):
+    rng = _rng(seed)
+    samples = np.concatenate([silence(7, rng=rng), speech(3, rng=rng)])
+    assert VADGate().analyze(samples, SAMPLE_RATE).is_speech
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("gain", [1.0, 3.0])
+def test_speech_over_continuous_game_music_passes(seed, gain):
+    rng = _rng(seed)
+    samples = speech(10, rng=rng) + gain * music(10, rng=rng)
+    assert VADGate().analyze(samples, SAMPLE_RATE).is_speech
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_speech_over_noise_passes(seed):
+    rng = _rng(seed)
+    samples = speech(10, rng=rng) + 0.03 * rng.standard_normal(10 * SAMPLE_RATE).astype(np.float32)
+    assert VADGate().analyze(samples, SAMPLE_RATE).is_speech
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_music_noise_and_silence_are_skipped(seed):
+    rng = _rng(seed)
+    gate = VADGate()
+    assert not gate.analyze(music(10, rng=rng), SAMPLE_RATE).is_speech
+    assert not gate.analyze(0.05 * rng.standard_normal(10 * SAMPLE_RATE).astype(np.float32), SAMPLE_RATE).is_speech
+    assert not gate.analyze(silence(10, rng=rng), SAMPLE_RATE).is_speech